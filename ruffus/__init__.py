@@ -26,9 +26,10 @@
 #################################################################################
 #from graph import *
 #from print_dependencies import *
-from task import pipeline_printout, pipeline_printout_graph, pipeline_run, register_cleanup, check_if_uptodate, active_if, split, transform, merge, collate, files, files_re, follows, parallel, stderr_logger, black_hole_logger, suffix, regex, inputs, add_inputs, touch_file, combine, mkdir, output_from, posttask, JobSignalledBreak, runtime_parameter, jobs_limit
+from task import pipeline_printout, pipeline_printout_graph, pipeline_run, register_cleanup, check_if_uptodate, active_if, split, transform, merge, collate, files, files_re, follows, parallel, stderr_logger, black_hole_logger, suffix, regex, inputs, add_inputs, touch_file, combine, mkdir, output_from, posttask, JobSignalledBreak, runtime_parameter, jobs_limit, priority, resources, retry, speculative, in_memory
 from graph  import graph_colour_demo_printout
-from file_name_parameters import needs_update_check_modify_time
+from file_name_parameters import needs_update_check_modify_time, needs_update_check_checksum
+from executors import t_executor, t_socket_executor, t_batch_executor
 import cmdline
 
 #output_dependency_tree_in_dot_format, output_dependency_tree_key_in_dot_format
@@ -151,6 +151,9 @@ def append_to_argparse (parser):
     pipline_options.add_argument("--forced_tasks", action="append",
                                 metavar="JOBNAME", type=str,
                                 help="Task(s) which will be included even if they are up to date.", default = [])
+    pipline_options.add_argument("--shard", metavar="I/N", type=str,
+                                help="Run only the I-th (from 0) of N shares of the jobs, "
+                                     "alongside N-1 other copies of the pipeline.")
 
 
 
@@ -190,6 +193,7 @@ def append_to_optparse (parser):
             --draw_graph_horizontally
             --flowchart_format
             --forced_tasks
+            --shard
 
     """
     #
@@ -247,6 +251,11 @@ def append_to_optparse (parser):
                         metavar="JOBNAME",
                         type="string",
                         help="Pipeline task(s) which will be included even if they are up to date.")
+    parser.add_option("--shard", dest="shard",
+                        metavar="I/N",
+                        type="string",
+                        help="Run only the I-th (from 0) of N shares of the jobs, "
+                             "alongside N-1 other copies of the pipeline.")
 
 
     return parser
@@ -418,7 +427,11 @@ extra_pipeline_printout_options   = [
                                             "indent"                        ,
                                             "gnu_make_maximal_rebuild_mode" ,
                                             "wrap_width"                    ,
-                                            "runtime_data"]
+                                            "runtime_data"                  ,
+                                            "history_file"                  ,
+                                            "checksums"                     ,
+                                            "uptodate_check_threads"        ,
+                                            "glob_cache_file"]
 
 extra_pipeline_run_options = [
                                 "gnu_make_maximal_rebuild_mode"     ,
@@ -427,7 +440,29 @@ extra_pipeline_run_options = [
                                 "touch_files_only"                  ,
                                 "logger"                            ,
                                 "exceptions_terminate_immediately"  ,
-                                "log_exceptions"]
+                                "log_exceptions"                    ,
+                                "job_level_dependencies"            ,
+                                "executor"                          ,
+                                "multithread"                       ,
+                                "history_file"                      ,
+                                "checksums"                         ,
+                                "uptodate_check_threads"            ,
+                                "glob_cache_file"                   ,
+                                "priority_policy"                   ,
+                                "resources"                         ,
+                                "claims_dir"                        ,
+                                "shard"]
+
+
+def parse_shard (shard):
+    """
+    "I/N" from --shard  -> (I, N)
+    """
+    try:
+        shard_index, cnt_shards = map(int, shard.split("/"))
+    except ValueError:
+        raise Exception("--shard should be I/N, e.g. --shard 0/4, not %s" % shard)
+    return shard_index, cnt_shards
 
 
 def get_extra_options_appropriate_for_command (appropriate_option_names, extra_options):
@@ -477,6 +512,8 @@ def run (options, **extra_options):
            extra_options["logger"] = task.black_hole_logger
         elif extra_options["logger"] == None:
             extra_options["logger"] = task.stderr_logger
+        if getattr(options, "shard", None) and not "shard" in extra_options:
+            extra_options["shard"] = parse_shard(options.shard)
         appropriate_options = get_extra_options_appropriate_for_command (extra_pipeline_run_options, extra_options)
         task.pipeline_run(  options.target_tasks,
                             options.forced_tasks,
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+################################################################################
+#
+#   data_store.py
+#
+#
+#   Copyright (c) 10/9/2009 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#################################################################################
+
+
+"""
+
+********************************************
+:mod:`data_store` -- Overview
+********************************************
+
+
+.. moduleauthor:: Leo Goodstadt <ruffus@llew.org.uk>
+
+    Keeps the return values of the jobs of @in_memory tasks in the main process
+        for the duration of a pipeline run, by output name, instead of writing files
+
+    Downstream jobs are passed the values in place of those names
+        (See t_data_store.substitute_values)
+
+    Values are pickled to files in a temporary directory once those kept in memory
+        add up to more than memory_limit bytes
+        (See pipeline_run(in_memory_limit = ...))
+
+
+"""
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+import os
+import shutil
+import tempfile
+import hashlib
+import cPickle as pickle
+
+from file_cache import stat_cache
+from ruffus_utility import replace_strings_in_nested_sequence
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_data_store
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_data_store(object):
+    """
+    Return values of jobs by output name
+
+        Each name appears to the up to date checks as a file made when the newest
+            input of its job was (See t_stat_cache.add_virtual_file), so that
+            downstream jobs are only out of date if those inputs have changed.
+        Values which cannot be pickled are always kept in memory.
+    """
+    def __init__ (self):
+        self.values             = dict()
+        # names of values pickled to spill_dir
+        self.spilled            = set()
+        # pickled sizes of values kept in memory
+        self.sizes              = dict()
+        self.checksums          = dict()
+        self.memory_limit       = 0
+        self.memory_used        = 0
+        self.spill_dir          = None
+
+    #_____________________________________________________________________________________
+
+    #   start / stop
+
+    #_____________________________________________________________________________________
+    def start (self, memory_limit = 100 * 1024 * 1024):
+        """
+        Start with a clean slate
+        """
+        self.stop()
+        self.memory_limit       = memory_limit
+
+    def stop (self):
+        self.values.clear()
+        self.spilled.clear()
+        self.sizes.clear()
+        self.checksums.clear()
+        self.memory_used        = 0
+        if self.spill_dir != None:
+            shutil.rmtree(self.spill_dir, ignore_errors = True)
+            self.spill_dir      = None
+
+    def __contains__ (self, name):
+        return name in self.values
+
+    def __len__ (self):
+        return len(self.values)
+
+    #_____________________________________________________________________________________
+
+    #   put / get
+
+    #_____________________________________________________________________________________
+    def put (self, name, value, mtime):
+        """
+        Keep the value made by a job whose newest input was made at mtime
+            Replaces any value kept under the same name
+        """
+        self.release(name)
+        try:
+            pickled_value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            pickled_value = None
+
+        if pickled_value == None:
+            self.values[name]       = value
+            self.checksums[name]    = None
+            size                    = 0
+        else:
+            self.checksums[name]    = hashlib.md5(pickled_value).hexdigest()
+            size                    = len(pickled_value)
+            if self.memory_used + size <= self.memory_limit:
+                self.values[name]   = value
+                self.sizes[name]    = size
+                self.memory_used   += size
+            else:
+                self.values[name]   = self.spill(pickled_value)
+                self.spilled.add(name)
+        stat_cache.add_virtual_file(name, size, mtime)
+
+    def release (self, name):
+        """
+        Forget the value kept under name, freeing its memory or spill file
+        """
+        if name not in self.values:
+            return
+        if name in self.spilled:
+            self.spilled.discard(name)
+            try:
+                os.unlink(self.values[name])
+            except OSError:
+                pass
+        self.memory_used -= self.sizes.pop(name, 0)
+        self.checksums.pop(name, None)
+        del self.values[name]
+
+    def spill (self, pickled_value):
+        """
+        Save pickled value to a new file, returning its name
+        """
+        if self.spill_dir == None:
+            self.spill_dir = tempfile.mkdtemp(prefix = "ruffus_in_memory.")
+        fd, file_name = tempfile.mkstemp(dir = self.spill_dir)
+        f = os.fdopen(fd, "wb")
+        try:
+            f.write(pickled_value)
+        finally:
+            f.close()
+        return file_name
+
+    def get (self, name):
+        if name in self.spilled:
+            f = open(self.values[name], "rb")
+            try:
+                return pickle.load(f)
+            finally:
+                f.close()
+        return self.values[name]
+
+    def checksum (self, name):
+        """
+        md5 of the pickled value, or None if it could not be pickled
+        """
+        return self.checksums.get(name)
+
+    #_____________________________________________________________________________________
+
+    #   substitute_values
+
+    #_____________________________________________________________________________________
+    def substitute_values (self, param):
+        """
+        Copy of job parameters with each input name we have a value for replaced
+            by the value
+        """
+        if not len(self.values) or not len(param):
+            return param
+        def value_or_name (name):
+            if name in self.values:
+                return self.get(name)
+            return name
+        return (replace_strings_in_nested_sequence(param[0], value_or_name),) + tuple(param[1:])
+
+
+#
+#   shared by all jobs of @in_memory tasks and their downstream jobs
+#
+data_store = t_data_store()
@@ -0,0 +1,1750 @@
+#!/usr/bin/env python
+################################################################################
+#
+#   executors.py
+#
+#
+#   Copyright (c) 10/9/2009 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#################################################################################
+
+
+"""
+
+********************************************
+:mod:`executors` -- Overview
+********************************************
+
+
+.. moduleauthor:: Leo Goodstadt <ruffus@llew.org.uk>
+
+    How pipeline_run runs jobs (See pipeline_run(executor = ...))
+
+    t_executor
+        The interface: jobs are submitted as a stream, results come back as
+        a stream in the order jobs complete, and outstanding jobs can be cancelled
+
+    t_serial_executor / t_pool_executor
+        Jobs run one at a time in this process, or in a (process, thread
+        or coroutine) pool
+
+    t_socket_executor
+        Jobs run in worker processes which connect over TCP or Unix sockets,
+        e.g. from other machines sharing the same file system:
+
+            ruffus-worker HOST:PORT
+
+    t_batch_executor
+        Jobs are submitted to a batch scheduler (e.g. slurm or sge) as array jobs
+
+    t_claim_executor
+        Copies of the pipeline on several hosts share out jobs through
+        claim files in a shared directory
+
+    t_speculative_executor
+        Jobs which are taking much longer than usual are run a second time,
+        and the first copy to succeed is used
+
+"""
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+import os
+import re
+import errno
+import hashlib
+import sys
+import imp
+import time
+import shlex
+import pipes
+import shutil
+import signal
+import socket
+import getpass
+import tempfile
+import binascii
+import threading
+import traceback
+import subprocess
+import itertools
+import functools
+import collections
+import cPickle as pickle
+from collections import defaultdict
+from itertools import imap
+from ruffus_utility import get_strings_in_nested_sequence, replace_strings_in_nested_sequence
+from multiprocessing.connection import Listener, Client
+from multiprocessing.pool import IMapIterator
+import multiprocessing
+import Queue
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_executor(object):
+    """
+    Runs jobs for pipeline_run
+
+        submit(job_func, jobs)
+            Start running job_func(job) for each job.
+            Jobs are taken from the jobs iterator whenever there is room for more:
+                it blocks until more jobs are ready and stops after the last job
+                of the pipeline run
+        results()
+            Iterator of the return values of job_func (t_job_result) in the order
+                the jobs complete. Stops after the last job.
+        cancel()
+            Stop jobs which have not completed, as far as possible within
+                cancel_grace_seconds (See kill_process_groups)
+        can_stop_jobs()
+            Whether cancel() stops jobs which are already running,
+                rather than leaving them to finish by themselves
+        close()
+            Release any processes, threads or connections
+        set_job_limits(job_limits)
+            Maximum number of concurrent jobs for each @jobs_limit name, for executors
+                whose jobs cannot share semaphores with this process
+
+        Subclasses provide submit() and results(). The other methods do nothing by default
+    """
+    def cancel (self):
+        pass
+
+    def can_stop_jobs (self):
+        return False
+
+    def close (self):
+        pass
+
+    def set_job_limits (self, job_limits):
+        pass
+
+
+
+#_________________________________________________________________________________________
+
+#   t_serial_executor
+
+#_________________________________________________________________________________________
+class t_serial_executor(t_executor):
+    """
+    Runs jobs one at a time in this process
+    """
+    def submit (self, job_func, jobs):
+        self.job_results = imap(job_func, jobs)
+
+    def results (self):
+        return self.job_results
+
+
+#_________________________________________________________________________________________
+
+#   t_pool_executor
+
+#_________________________________________________________________________________________
+class t_pool_executor(t_executor):
+    """
+    Runs jobs in a pool with imap_unordered(), e.g. multiprocessing.Pool or
+        multiprocessing.pool.ThreadPool
+
+        Processes of a multiprocessing.Pool should each start their own process group
+            (See start_process_group), so that cancel() can stop them together with
+            any programs their jobs are running.
+        Jobs running in threads cannot be stopped.
+    """
+    def __init__ (self, pool):
+        self.pool = pool
+
+    def submit (self, job_func, jobs):
+        self.job_results = self.pool.imap_unordered(job_func, jobs)
+
+    def results (self):
+        if not isinstance(self.job_results, IMapIterator):
+            return self.job_results
+        return self.get_results_interruptibly()
+
+    def get_results_interruptibly (self):
+        while 1:
+            try:
+                # with timeout so that KeyboardInterrupt is not blocked
+                yield self.job_results.next(1e6)
+            except StopIteration:
+                return
+
+    def get_processes (self):
+        return [process for process in getattr(self.pool, "_pool", [])
+                    if isinstance(process, multiprocessing.Process)]
+
+    def cancel (self):
+        process_group_ids = [process.pid for process in self.get_processes()]
+        if hasattr(self.pool, "terminate"):
+            self.pool.terminate()
+        kill_process_groups(process_group_ids)
+
+    def can_stop_jobs (self):
+        return len(self.get_processes()) > 0
+
+    def close (self):
+        """
+        Wait for the processes of the pool to exit. Threads are left to finish by themselves
+        """
+        if hasattr(self.pool, "close"):
+            self.pool.close()
+            if self.get_processes():
+                self.pool.join()
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_queued_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class all_jobs_submitted(object):
+    pass
+
+class t_queued_executor(t_executor):
+    """
+    Jobs wait in this process until they can start within their @jobs_limit,
+        for executors which hand jobs to other processes or machines
+
+        Subclasses take jobs with pop_startable_job() (holding self.condition)
+        and hand back each result with job_done(), or job_not_done() to run
+        the job again
+    """
+    def __init__ (self):
+        self.closed             = False
+
+        # jobs of the current pipeline run, waiting to start
+        self.condition          = threading.Condition()
+        self.pending_jobs       = collections.deque()
+        self.run_id             = 0
+        self.job_func           = None
+        self.job_limits         = dict()
+        self.cnt_running_by_limit = defaultdict(int)
+        self.cnt_jobs_submitted = 0
+        self.results_queue      = Queue.Queue()
+
+    #_____________________________________________________________________________________
+
+    #   pop_startable_job / job_done / job_not_done
+
+    #_____________________________________________________________________________________
+    def can_start (self, job):
+        limit_name = get_job_limit_name(job)
+        return (limit_name == None or
+                self.cnt_running_by_limit[limit_name] < self.job_limits.get(limit_name, 1))
+
+    def has_startable_job (self):
+        return any(self.can_start(job) for job in self.pending_jobs)
+
+    def pop_startable_job (self):
+        """
+        The first waiting job which can start within its @jobs_limit, or None
+        """
+        for i, job in enumerate(self.pending_jobs):
+            if self.can_start(job):
+                del self.pending_jobs[i]
+                limit_name = get_job_limit_name(job)
+                if limit_name != None:
+                    self.cnt_running_by_limit[limit_name] += 1
+                return job
+        return None
+
+    def job_finished (self, job):
+        limit_name = get_job_limit_name(job)
+        if limit_name != None:
+            self.cnt_running_by_limit[limit_name] -= 1
+        self.condition.notify_all()
+
+    def job_done (self, run_id, job, result):
+        with self.condition:
+            self.job_finished(job)
+            if run_id == self.run_id:
+                self.results_queue.put(result)
+
+    def job_not_done (self, run_id, job):
+        with self.condition:
+            self.job_finished(job)
+            if run_id == self.run_id:
+                self.pending_jobs.appendleft(job)
+
+    def wait_unless_closed (self, seconds):
+        """
+        Wait for seconds, returning early if closed. Returns whether closed
+        """
+        end_time = time.time() + seconds
+        with self.condition:
+            while not self.closed and time.time() < end_time:
+                self.condition.wait(end_time - time.time())
+            return self.closed
+
+    def get_worker_setup (self):
+        """
+        What workers need to run jobs as if in this process (See prepare_worker)
+        """
+        main_module = sys.modules["__main__"]
+        main_file = getattr(main_module, "__file__", None)
+        return {"cwd"           : os.getcwd(),
+                "sys_path"      : list(sys.path),
+                "main_file"     : os.path.abspath(main_file) if main_file else None}
+
+    #_____________________________________________________________________________________
+
+    #   t_executor methods
+
+    #_____________________________________________________________________________________
+    def set_job_limits (self, job_limits):
+        with self.condition:
+            self.job_limits = dict(job_limits)
+
+    def submit (self, job_func, jobs):
+        with self.condition:
+            self.run_id += 1
+            self.job_func = job_func
+            self.pending_jobs.clear()
+            self.cnt_running_by_limit.clear()
+            self.cnt_jobs_submitted = 0
+            self.results_queue = Queue.Queue()
+            run_id = self.run_id
+            results_queue = self.results_queue
+
+        def feed_jobs ():
+            for job in jobs:
+                with self.condition:
+                    if run_id != self.run_id:
+                        return
+                    self.cnt_jobs_submitted += 1
+                    self.pending_jobs.append(job)
+                    self.condition.notify_all()
+            results_queue.put(all_jobs_submitted())
+
+        feed_thread = threading.Thread(target = feed_jobs)
+        feed_thread.daemon = True
+        feed_thread.start()
+
+    def results (self):
+        results_queue = self.results_queue
+        cnt_results = 0
+        all_submitted = False
+        while not all_submitted or cnt_results < self.cnt_jobs_submitted:
+            # with timeout so that KeyboardInterrupt is not blocked
+            result = results_queue.get(True, 1e6)
+            if isinstance(result, all_jobs_submitted):
+                all_submitted = True
+                continue
+            cnt_results += 1
+            yield result
+
+    def cancel (self):
+        with self.condition:
+            self.run_id += 1
+            self.pending_jobs.clear()
+            self.condition.notify_all()
+
+    def close (self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_socket_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   Messages (pickled, See multiprocessing.connection)
+#
+#       worker      -> coordinator  ("hello", host name, process id)
+#       coordinator -> worker       ("setup", {"cwd", "sys_path", "main_file"})
+#       coordinator -> worker       ("job", (task name, job name, job index), pickled (job_func, job))
+#       worker      -> coordinator  ("result", t_job_result)
+#       coordinator -> worker       ("quit",)
+#
+#   Jobs are pickled separately so that the worker can still report which
+#       job failed if they cannot be unpickled
+#
+class t_socket_executor(t_queued_executor):
+    """
+    Runs jobs in worker processes which connect over TCP or Unix sockets
+        (See ruffus-worker / worker_main)
+
+        Each worker runs one job at a time, and asks for the next job when it is done.
+        Jobs of workers which disconnect are run again by other workers.
+        @jobs_limit applies to all the workers together.
+        Workers stay connected between pipeline runs, until close()
+
+        :param address: ("host", port) or the path of a Unix socket to listen on.
+                        Defaults to a free port on localhost.
+                        Use ("", port) to accept workers from other machines.
+        :param authkey: Workers are only accepted if they have the same key.
+                        Defaults to $RUFFUS_WORKER_AUTHKEY or a random key.
+        :param local_workers: Start this many worker processes on this machine
+
+        Workers import the pipeline script (under another name than "__main__")
+            to find the task functions: pipeline_run() should only be called
+            under ``if __name__ == '__main__':``
+    """
+    def __init__ (self, address = None, authkey = None, local_workers = 0):
+        t_queued_executor.__init__(self)
+        if authkey == None:
+            authkey = os.environ.get("RUFFUS_WORKER_AUTHKEY") or binascii.hexlify(os.urandom(16))
+        if address == None:
+            address = ("localhost", 0)
+        self.authkey            = authkey
+        self.listener           = Listener(address, authkey = authkey)
+        self.address            = self.listener.address
+
+        # host name and process id of each connected worker
+        self.workers            = dict()
+
+        accept_thread = threading.Thread(target = self.accept_workers)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+        self.local_worker_processes = [self.start_local_worker() for i in range(local_workers)]
+
+    #_____________________________________________________________________________________
+
+    #   start_local_worker
+
+    #_____________________________________________________________________________________
+    def start_local_worker (self):
+        """
+        Start a worker process on this machine
+        """
+        env = get_worker_environment()
+        env["RUFFUS_WORKER_AUTHKEY"] = self.authkey
+        return subprocess.Popen([sys.executable, "-c",
+                                 "from ruffus.executors import worker_main; worker_main()",
+                                 format_address(self.address)], env = env)
+
+    #_____________________________________________________________________________________
+
+    #   accept_workers / serve_worker
+
+    #_____________________________________________________________________________________
+    def accept_workers (self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception:
+                # e.g. wrong authkey
+                continue
+            serve_thread = threading.Thread(target = self.serve_worker, args = (connection,))
+            serve_thread.daemon = True
+            serve_thread.start()
+
+    def serve_worker (self, connection):
+        """
+        Send jobs to a worker one at a time, until closed or the worker disconnects
+        """
+        worker_id = None
+        try:
+            message, host_name, pid = connection.recv()
+            worker_id = (host_name, pid)
+            connection.send(("setup", self.get_worker_setup()))
+            with self.condition:
+                self.workers[worker_id] = connection
+
+            while 1:
+                run_id, job = self.next_job()
+                if job == None:
+                    connection.send(("quit",))
+                    break
+
+                header = get_job_header(job)
+                try:
+                    payload = pickle.dumps((self.job_func, job), pickle.HIGHEST_PROTOCOL)
+                except:
+                    self.job_done(run_id, job, make_job_error_result(header, sys.exc_info()))
+                    continue
+
+                try:
+                    connection.send(("job", header, payload))
+                    message, result = connection.recv()
+                except:
+                    # run again elsewhere
+                    self.job_not_done(run_id, job)
+                    break
+                self.job_done(run_id, job, result)
+        except (EOFError, IOError, socket.error):
+            pass
+        finally:
+            with self.condition:
+                self.workers.pop(worker_id, None)
+            connection.close()
+
+    def next_job (self):
+        """
+        Wait for a job which can start within its @jobs_limit
+            Returns (run id, job), or (None, None) once closed
+        """
+        with self.condition:
+            while not self.closed:
+                job = self.pop_startable_job()
+                if job != None:
+                    return self.run_id, job
+                # with timeout so that KeyboardInterrupt is not blocked
+                self.condition.wait(1e6)
+            return None, None
+
+    def close (self):
+        """
+        Tell workers to quit once they have finished their current job
+        """
+        t_queued_executor.close(self)
+        self.listener.close()
+        for worker_process in self.local_worker_processes:
+            worker_process.wait()
+        self.local_worker_processes = []
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_batch_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   Command templates for common batch schedulers
+#
+#       {count}     number of jobs in the array, with task ids 1 - count
+#       {script}    shell script running each job of the array
+#       {array_dir} directory with the jobs and results of the array
+#       {job_ids}   scheduler ids of arrays (from the output of submit_command)
+#       {user}      user name
+#
+#   status_command lists the arrays which have not finished: the first
+#       number on each line is taken as a scheduler id
+#
+batch_schedulers = {
+    "slurm" : { "submit_command"    : "sbatch --parsable --array=1-{count} "
+                                      "--output={array_dir}/%a.log {script}",
+                "status_command"    : "squeue -h -o %A -u {user}",
+                "cancel_command"    : "scancel {job_ids}",
+                "task_id_variable"  : "SLURM_ARRAY_TASK_ID"},
+    "sge"   : { "submit_command"    : "qsub -terse -cwd -S /bin/sh -t 1-{count} "
+                                      "-o {array_dir} -e {array_dir} {script}",
+                "status_command"    : "qstat -u {user}",
+                "cancel_command"    : "qdel {job_ids}",
+                "task_id_variable"  : "SGE_TASK_ID"},
+}
+
+class t_batch_array(object):
+    """
+    Jobs submitted together as an array job
+        tasks = {task id : (job, job header)} of jobs without results
+    """
+    def __init__ (self, run_id, scheduler_id, array_dir, tasks):
+        self.run_id         = run_id
+        self.scheduler_id   = scheduler_id
+        self.array_dir      = array_dir
+        self.tasks          = tasks
+        self.cnt_missing    = 0
+        self.lost_jobs      = False
+
+class t_batch_executor(t_queued_executor):
+    """
+    Submits jobs to a batch scheduler (e.g. sbatch or qsub) as array jobs
+
+        Jobs which become ready together (within submit_delay seconds) are
+            submitted in the same array, of up to max_array_size jobs.
+        Each job is pickled to a file in job_dir, and writes its result
+            alongside (See run_batch_task): the cluster nodes must share the file system.
+        Every poll_interval seconds, each array directory is listed for results
+            and the scheduler is asked (once for all arrays) which arrays have not finished.
+            Jobs of arrays which finish without results are reported as failed.
+
+        Only two threads run in this process however many jobs are in flight:
+            use pipeline_run(multiprocess = N) to allow up to N jobs in flight at once.
+        @jobs_limit applies to jobs in flight.
+
+        :param scheduler: "slurm" or "sge" for the commands in batch_schedulers
+        :param submit_command: command template for submitting an array job
+        :param status_command: command template listing arrays which have not finished
+        :param cancel_command: command template cancelling arrays
+        :param task_id_variable: environment variable with the task id (1 - count)
+                                 of each job in the array
+
+        See batch_schedulers for the command templates.
+    """
+    def __init__ (self, scheduler = None, submit_command = None, status_command = None,
+                  cancel_command = None, task_id_variable = None, job_dir = ".ruffus/batch",
+                  max_array_size = 1000, submit_delay = 1.0, poll_interval = 10.0):
+        t_queued_executor.__init__(self)
+        if scheduler != None and scheduler not in batch_schedulers:
+            raise Exception("t_batch_executor scheduler should be one of %s" %
+                            ", ".join(sorted(batch_schedulers)))
+        commands = dict(batch_schedulers[scheduler]) if scheduler else dict()
+        for name, value in (("submit_command",      submit_command),
+                            ("status_command",      status_command),
+                            ("cancel_command",      cancel_command),
+                            ("task_id_variable",    task_id_variable)):
+            if value != None:
+                commands[name] = value
+            if commands.get(name) == None and name != "cancel_command":
+                raise Exception("t_batch_executor needs a scheduler or %s" % name)
+        self.submit_command     = commands["submit_command"]
+        self.status_command     = commands["status_command"]
+        self.cancel_command     = commands.get("cancel_command")
+        self.task_id_variable   = commands["task_id_variable"]
+        self.job_dir            = os.path.abspath(job_dir)
+        self.max_array_size     = max_array_size
+        self.submit_delay       = submit_delay
+        self.poll_interval      = poll_interval
+
+        # arrays with jobs still running
+        self.arrays             = []
+        self.cnt_arrays_submitted = 0
+
+        self.threads = [threading.Thread(target = thread_func)
+                            for thread_func in (self.submit_arrays, self.poll_arrays)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    #_____________________________________________________________________________________
+
+    #   run_command
+
+    #_____________________________________________________________________________________
+    def run_command (self, template, job_ids = (), **values):
+        """
+        Run a command template, returning its output
+            Raises CalledProcessError if the command fails
+        """
+        quoted_values = dict((name, pipes.quote(str(value))) for name, value in values.items())
+        command = template.format(job_ids = " ".join(pipes.quote(i) for i in job_ids),
+                                  user = pipes.quote(getpass.getuser()), **quoted_values)
+        return subprocess.check_output(shlex.split(command), stderr = subprocess.STDOUT)
+
+    #_____________________________________________________________________________________
+
+    #   submit_arrays / submit_array
+
+    #_____________________________________________________________________________________
+    def submit_arrays (self):
+        """
+        Submit waiting jobs in arrays
+        """
+        while 1:
+            with self.condition:
+                while not self.closed and not self.has_startable_job():
+                    self.condition.wait(1e6)
+                if self.closed:
+                    return
+
+            # let jobs which become ready at about the same time go in the same array
+            if self.wait_unless_closed(self.submit_delay):
+                return
+
+            with self.condition:
+                run_id = self.run_id
+                jobs = []
+                while len(jobs) < self.max_array_size:
+                    job = self.pop_startable_job()
+                    if job == None:
+                        break
+                    jobs.append(job)
+            if jobs:
+                self.submit_array(run_id, jobs)
+
+    def submit_array (self, run_id, jobs):
+        if not os.path.isdir(self.job_dir):
+            os.makedirs(self.job_dir)
+        array_dir = tempfile.mkdtemp(prefix = "array.", dir = self.job_dir)
+        write_file(os.path.join(array_dir, "setup.pickle"),
+                   pickle.dumps(self.get_worker_setup(), pickle.HIGHEST_PROTOCOL))
+
+        tasks = dict()
+        for task_id, job in enumerate(jobs, 1):
+            header = get_job_header(job)
+            try:
+                payload = pickle.dumps((self.job_func, job), pickle.HIGHEST_PROTOCOL)
+            except:
+                self.job_done(run_id, job, make_job_error_result(header, sys.exc_info()))
+                continue
+            write_file(os.path.join(array_dir, "%d.job" % task_id),
+                       pickle.dumps((header, payload), pickle.HIGHEST_PROTOCOL))
+            tasks[task_id] = (job, header)
+        if not tasks:
+            shutil.rmtree(array_dir, ignore_errors = True)
+            return
+
+        script = os.path.join(array_dir, "run_job.sh")
+        env = get_worker_environment()
+        write_file(script, "#!/bin/sh\n"
+                           "PYTHONPATH=%s exec %s -c %s %s \"$%s\"\n" %
+                           (pipes.quote(env["PYTHONPATH"]), pipes.quote(sys.executable),
+                            pipes.quote("from ruffus.executors import run_batch_task; "
+                                        "run_batch_task()"),
+                            pipes.quote(array_dir), self.task_id_variable))
+        os.chmod(script, 0755)
+
+        try:
+            output = self.run_command(self.submit_command, count = len(jobs), script = script,
+                                      array_dir = array_dir)
+            scheduler_id = re.search(r"\d+", output)
+            if not scheduler_id:
+                raise Exception("No job id in the output of the batch scheduler: %r" % output)
+            scheduler_id = scheduler_id.group()
+        except:
+            exc_info = sys.exc_info()
+            for job, header in tasks.values():
+                self.job_done(run_id, job, make_job_error_result(header, exc_info))
+            return
+
+        with self.condition:
+            self.arrays.append(t_batch_array(run_id, scheduler_id, array_dir, tasks))
+            self.cnt_arrays_submitted += 1
+
+    #_____________________________________________________________________________________
+
+    #   poll_arrays / collect_results
+
+    #_____________________________________________________________________________________
+    def poll_arrays (self):
+        """
+        Collect results, and fail jobs of arrays which have finished without them
+        """
+        while not self.wait_unless_closed(self.poll_interval):
+            with self.condition:
+                arrays = list(self.arrays)
+            if not arrays:
+                continue
+
+            # arrays which finish after this still show up here, so their results are not missed
+            scheduler_ids = self.get_unfinished_scheduler_ids()
+
+            for array in arrays:
+                self.collect_results(array)
+                if array.tasks and scheduler_ids != None and array.scheduler_id not in scheduler_ids:
+                    # allow for schedulers which are slow to list new arrays
+                    array.cnt_missing += 1
+                    if array.cnt_missing >= 2:
+                        array.lost_jobs = True
+                        for task_id, (job, header) in sorted(array.tasks.items()):
+                            try:
+                                raise Exception("Batch job %s.%d finished without a result. See %s" %
+                                                (array.scheduler_id, task_id, array.array_dir))
+                            except:
+                                self.job_done(array.run_id, job,
+                                              make_job_error_result(header, sys.exc_info()))
+                        array.tasks.clear()
+                if not array.tasks:
+                    with self.condition:
+                        if array in self.arrays:
+                            self.arrays.remove(array)
+                    # keep logs of lost jobs
+                    if not array.lost_jobs:
+                        shutil.rmtree(array.array_dir, ignore_errors = True)
+
+    def get_unfinished_scheduler_ids (self):
+        """
+        Scheduler ids of arrays which have not finished, or None if the scheduler cannot be asked
+        """
+        try:
+            output = self.run_command(self.status_command,
+                                      job_ids = [array.scheduler_id for array in self.arrays])
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        scheduler_ids = set()
+        for line in output.splitlines():
+            fields = line.split()
+            if fields:
+                scheduler_id = re.match(r"\d+", fields[0])
+                if scheduler_id:
+                    scheduler_ids.add(scheduler_id.group())
+        return scheduler_ids
+
+    def collect_results (self, array):
+        for file_name in os.listdir(array.array_dir):
+            if not file_name.endswith(".result"):
+                continue
+            task_id = int(file_name[:-len(".result")])
+            if task_id not in array.tasks:
+                continue
+            job, header = array.tasks.pop(task_id)
+            try:
+                result = pickle.load(open(os.path.join(array.array_dir, file_name), "rb"))
+            except:
+                result = make_job_error_result(header, sys.exc_info())
+            self.job_done(array.run_id, job, result)
+
+    #_____________________________________________________________________________________
+
+    #   t_executor methods
+
+    #_____________________________________________________________________________________
+    def cancel (self):
+        """
+        Cancel waiting jobs and arrays which have not finished
+        """
+        t_queued_executor.cancel(self)
+        with self.condition:
+            arrays = self.arrays
+            self.arrays = []
+        if arrays and self.cancel_command:
+            try:
+                self.run_command(self.cancel_command,
+                                 job_ids = [array.scheduler_id for array in arrays])
+            except (subprocess.CalledProcessError, OSError):
+                pass
+        for array in arrays:
+            shutil.rmtree(array.array_dir, ignore_errors = True)
+
+    def can_stop_jobs (self):
+        return self.cancel_command != None
+
+    def close (self):
+        self.cancel()
+        t_queued_executor.close(self)
+        for thread in self.threads:
+            thread.join()
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_claim_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   One claim file per job in claims_dir, named by get_claim_key():
+#
+#       KEY.claim   claimed by the host and process written inside.
+#                   Touched every stale_seconds / 4 while the job runs
+#       KEY.done    written when the job has completed
+#       KEY.failed  written when the job has failed
+#                   KEY.claim is removed once KEY.done or KEY.failed has been written
+#
+#   Claims are made by creating KEY.claim with O_EXCL, which is atomic on
+#       local file systems and on NFS (v3 onwards)
+#
+#   Claims which have not been touched for stale_seconds (claim), or were done before
+#       this copy of the pipeline started by more than launch_window (done / failed),
+#       are removed: by rename() so that only one copy can remove each
+#
+class t_claim_executor(t_queued_executor):
+    """
+    Shares jobs between copies of the same pipeline running on several hosts at once,
+        through claim files in a shared directory (See pipeline_run(claims_dir = ...))
+
+        Each job is run, by executor, in whichever copy claims it first.
+        Jobs are only claimed when fewer than max_local_jobs are running here.
+        The other copies wait for its claim to be done, then carry on downstream.
+        Claims of hosts which have died are taken over after stale_seconds.
+
+        Copies should be started within launch_window seconds of each other:
+            jobs done before that are from earlier runs and are run again if necessary.
+        Clocks of the hosts must agree to within stale_seconds.
+    """
+    def __init__ (self, executor, claims_dir = ".ruffus/claims", max_local_jobs = 1,
+                  poll_interval = 1.0, stale_seconds = 60.0, launch_window = 60.0):
+        t_queued_executor.__init__(self)
+        self.executor           = executor
+        self.max_local_jobs     = max_local_jobs
+        self.claims_dir         = os.path.abspath(claims_dir)
+        self.poll_interval      = poll_interval
+        self.stale_seconds      = stale_seconds
+        self.launch_window      = launch_window
+        self.owner              = "%s %d" % (socket.gethostname(), os.getpid())
+        if not os.path.isdir(self.claims_dir):
+            try:
+                os.makedirs(self.claims_dir)
+            except OSError:
+                # made by another host
+                pass
+
+        # {key : job} of jobs claimed here / elsewhere
+        self.claimed_jobs       = dict()
+        self.watched_jobs       = dict()
+        self.claim_keys_by_job_index = dict()
+        self.reclaimed_jobs     = collections.deque()
+        self.cnt_local_jobs     = 0
+        self.last_heartbeat     = 0
+        self.all_submitted      = False
+        self.watch_thread       = None
+
+    #_____________________________________________________________________________________
+
+    #   claims
+
+    #_____________________________________________________________________________________
+    def claim_file (self, key, state):
+        return os.path.join(self.claims_dir, "%s.%s" % (key, state))
+
+    def get_file_system_time (self):
+        """
+        Time according to the (possibly remote) file system holding the claims
+        """
+        fd, file_name = tempfile.mkstemp(prefix = "time.", dir = self.claims_dir)
+        os.close(fd)
+        mtime = os.path.getmtime(file_name)
+        os.unlink(file_name)
+        return mtime
+
+    def try_claim (self, key):
+        """
+        Returns True if this process now holds the claim on the job,
+            otherwise "claim", "done" or "failed" for the claim of another process.
+            Jobs which failed here can be claimed again, e.g. to be retried (See @retry)
+        """
+        while 1:
+            try:
+                fd = os.open(self.claim_file(key, "claim"), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0644)
+                os.write(fd, self.owner + "\n")
+                os.close(fd)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+                state = self.get_claim_state(key)
+                if state in ("done", "claim"):
+                    return state
+                continue
+
+            #
+            #   the job may have been done or have failed before its claim was removed
+            #       (See release_claim)
+            #
+            state = self.get_claim_state(key)
+            if state == "failed" and self.is_own_claim(key, "failed"):
+                try:
+                    os.unlink(self.claim_file(key, "failed"))
+                except OSError:
+                    pass
+            elif state in ("done", "failed"):
+                try:
+                    os.unlink(self.claim_file(key, "claim"))
+                except OSError:
+                    pass
+                return state
+            return True
+
+    def is_own_claim (self, key, state):
+        try:
+            return open(self.claim_file(key, state)).read().strip() == self.owner
+        except IOError:
+            return False
+
+    def is_fresh (self, state, mtime):
+        """
+        Claims are refreshed while running. Done / failed claims must be from this run
+        """
+        if state == "claim":
+            return time.time() - mtime < self.stale_seconds
+        return mtime >= self.start_time - self.launch_window
+
+    def get_claim_state (self, key):
+        """
+        State of the claim on the job, or None if there is none,
+            after removing stale claims
+        """
+        for state in ("done", "claim", "failed"):
+            file_name = self.claim_file(key, state)
+            try:
+                mtime = os.path.getmtime(file_name)
+            except OSError:
+                continue
+            if self.is_fresh(state, mtime):
+                return state
+            self.remove_stale_claim(file_name, state)
+        return None
+
+    def remove_stale_claim (self, file_name, state):
+        """
+        Only one process can rename the claim out of the way.
+            Put back claims which have been refreshed or remade in the meantime
+        """
+        stale_file_name = "%s.stale.%s.%d" % (file_name, socket.gethostname(), os.getpid())
+        try:
+            os.rename(file_name, stale_file_name)
+        except OSError:
+            return
+        try:
+            if self.is_fresh(state, os.path.getmtime(stale_file_name)):
+                os.link(stale_file_name, file_name)
+        except OSError:
+            pass
+        os.unlink(stale_file_name)
+
+    def release_claim (self, key, state):
+        """
+        Mark our claim as done / failed (before removing it), or just remove it (state = None)
+            Ignored if our claim has been taken over
+        """
+        try:
+            if not self.is_own_claim(key, "claim"):
+                return
+            if state != None:
+                write_file(self.claim_file(key, state), self.owner + "\n")
+            os.unlink(self.claim_file(key, "claim"))
+        except (IOError, OSError):
+            pass
+
+    def remove_old_claims (self):
+        """
+        Remove claims which are stale, and done / failed claims of earlier runs
+        """
+        try:
+            file_names = os.listdir(self.claims_dir)
+        except OSError:
+            return
+        for file_name in file_names:
+            state = file_name.rsplit(".", 1)[-1]
+            if state not in ("claim", "done", "failed"):
+                continue
+            file_name = os.path.join(self.claims_dir, file_name)
+            try:
+                mtime = os.path.getmtime(file_name)
+            except OSError:
+                continue
+            if not self.is_fresh(state, mtime):
+                self.remove_stale_claim(file_name, state)
+
+    #_____________________________________________________________________________________
+
+    #   claim_jobs / watch_claims / collect_local_results
+
+    #_____________________________________________________________________________________
+    def claim_or_watch (self, key, job, reclaim = False):
+        """
+        Returns True if the job is claimed here.
+            Otherwise reports the job if it was run elsewhere, or keeps watching it
+        """
+        state = self.try_claim(key)
+        with self.condition:
+            self.watched_jobs.pop(key, None)
+            if state == True:
+                self.claimed_jobs[key] = job
+                self.claim_keys_by_job_index[job[-1]] = key
+                if reclaim:
+                    self.reclaimed_jobs.append(job)
+            elif state == "claim":
+                self.watched_jobs[key] = job
+            else:
+                self.results_queue.put(make_job_elsewhere_result(get_job_header(job),
+                                                                 state == "done"))
+            self.condition.notify_all()
+        return state == True
+
+    def get_local_jobs (self):
+        """
+        Claim jobs only when there is room to run them here,
+            leaving the rest to other copies of the pipeline
+        """
+        while 1:
+            with self.condition:
+                while not self.closed:
+                    if (self.cnt_local_jobs < self.max_local_jobs and
+                        (self.reclaimed_jobs or self.pending_jobs)):
+                        break
+                    if (self.all_submitted and not self.pending_jobs and
+                        not self.watched_jobs and not self.reclaimed_jobs):
+                        return
+                    self.condition.wait(1e6)
+                if self.closed:
+                    return
+                self.cnt_local_jobs += 1
+                if self.reclaimed_jobs:
+                    job, claimed = self.reclaimed_jobs.popleft(), True
+                else:
+                    job, claimed = self.pending_jobs.popleft(), False
+            if not claimed:
+                claimed = self.claim_or_watch(get_claim_key(job), job)
+            if claimed:
+                yield job
+            else:
+                with self.condition:
+                    self.cnt_local_jobs -= 1
+
+    def claim_jobs (self, jobs):
+        for job in jobs:
+            with self.condition:
+                self.cnt_jobs_submitted += 1
+                self.pending_jobs.append(job)
+                self.condition.notify_all()
+        with self.condition:
+            self.all_submitted = True
+            self.condition.notify_all()
+        self.results_queue.put(all_jobs_submitted())
+
+    def watch_claims (self):
+        """
+        Check on jobs claimed elsewhere, and keep our claims fresh
+        """
+        while not self.wait_unless_closed(self.poll_interval):
+            with self.condition:
+                watched_jobs = self.watched_jobs.items()
+                claimed_keys = list(self.claimed_jobs)
+            for key, job in watched_jobs:
+                self.claim_or_watch(key, job, reclaim = True)
+            if time.time() - self.last_heartbeat > self.stale_seconds / 4.0:
+                self.last_heartbeat = time.time()
+                for key in claimed_keys:
+                    try:
+                        os.utime(self.claim_file(key, "claim"), None)
+                    except OSError:
+                        pass
+
+    def collect_local_results (self):
+        for result in self.executor.results():
+            with self.condition:
+                key = self.claim_keys_by_job_index.pop(result.job_index)
+                self.claimed_jobs.pop(key, None)
+            self.release_claim(key, "done" if is_job_done(result) else "failed")
+            with self.condition:
+                self.cnt_local_jobs -= 1
+                self.condition.notify_all()
+            self.results_queue.put(result)
+
+    #_____________________________________________________________________________________
+
+    #   t_executor methods
+
+    #_____________________________________________________________________________________
+    def set_job_limits (self, job_limits):
+        self.executor.set_job_limits(job_limits)
+
+    def submit (self, job_func, jobs):
+        self.start_time = self.get_file_system_time()
+        self.executor.submit(job_func, self.get_local_jobs())
+        self.watch_thread = threading.Thread(target = self.watch_claims)
+        for thread in (threading.Thread(target = self.claim_jobs, args = (jobs,)),
+                       self.watch_thread,
+                       threading.Thread(target = self.collect_local_results)):
+            thread.daemon = True
+            thread.start()
+
+    def cancel (self):
+        """
+        Let other hosts run the jobs claimed here
+        """
+        # stop handing jobs to executor first
+        t_queued_executor.close(self)
+        self.executor.cancel()
+        with self.condition:
+            claimed_keys = list(self.claimed_jobs)
+            self.claimed_jobs.clear()
+            self.watched_jobs.clear()
+        for key in claimed_keys:
+            self.release_claim(key, None)
+        t_queued_executor.cancel(self)
+
+    def close (self):
+        t_queued_executor.close(self)
+        if self.watch_thread:
+            self.watch_thread.join()
+            self.remove_old_claims()
+
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_speculative_executor
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   Each copy of a job of a @speculative task writes its outputs under private
+#       names (See get_private_output_name). The outputs of the first copy to
+#       succeed are renamed into place, so that a copy which is still running
+#       cannot overwrite them
+#
+class t_speculative_job(object):
+    """
+    A job of a @speculative task and the copies of it which have not finished
+    """
+    def __init__ (self, job):
+        self.job            = job
+        self.start_time     = None
+        self.cnt_copies     = 1
+        self.duplicated     = False
+
+class t_speculative_executor(t_queued_executor):
+    """
+    Starts a second copy of jobs which are taking much longer than usual (stragglers)
+        (See @speculative)
+
+        A job is a straggler once it has been running for speculate_after times
+            as long as the median of the completed jobs of its task
+            (after min_completed_jobs have completed).
+        The first copy to succeed is used. The result of the other copy is ignored,
+            and it is stopped by close() if still running and executor can stop jobs.
+            Otherwise its outputs are removed whenever it finishes.
+
+        Jobs are only handed to executor while fewer than max_local_jobs are running,
+            so that jobs are timed from when they start running
+    """
+    min_completed_jobs  = 3
+
+    def __init__ (self, executor, speculate_after_by_task, max_local_jobs = 1,
+                  poll_interval = 1.0):
+        t_queued_executor.__init__(self)
+        self.executor                   = executor
+        self.speculate_after_by_task    = dict(speculate_after_by_task)
+        self.max_local_jobs             = max_local_jobs
+        self.poll_interval              = poll_interval
+
+        # {job index : t_speculative_job} of jobs of @speculative tasks which have not finished
+        self.speculative_jobs           = dict()
+
+        # {job index of copy : (job index, copy number, job)}
+        self.copies_by_job_index        = dict()
+        self.copy_job_indices           = itertools.count(-1, -1)
+        self.duplicate_jobs             = collections.deque()
+        self.cnt_duplicate_jobs         = 0
+        self.durations_by_task          = defaultdict(list)
+        self.cnt_local_jobs             = 0
+        self.all_submitted              = False
+        self.watch_thread               = None
+
+    #_____________________________________________________________________________________
+
+    #   get_local_jobs / queue_jobs / watch_jobs / collect_local_results
+
+    #_____________________________________________________________________________________
+    def get_local_jobs (self):
+        """
+        Second copies of stragglers first, then jobs in the order submitted
+        """
+        while 1:
+            with self.condition:
+                while not self.closed:
+                    if (self.cnt_local_jobs < self.max_local_jobs and
+                        (self.duplicate_jobs or self.pending_jobs)):
+                        break
+                    if (self.all_submitted and not self.pending_jobs and
+                        not self.speculative_jobs):
+                        return
+                    self.condition.wait(1e6)
+                if self.closed:
+                    return
+                if self.duplicate_jobs:
+                    job = self.duplicate_jobs.popleft()
+                    job_index, copy_number, original_job = self.copies_by_job_index[job[-1]]
+                    if job_index not in self.speculative_jobs:
+                        # the first copy has already succeeded
+                        del self.copies_by_job_index[job[-1]]
+                        continue
+                else:
+                    job = self.pending_jobs.popleft()
+                    if job[-1] in self.speculative_jobs:
+                        self.speculative_jobs[job[-1]].start_time = time.time()
+                self.cnt_local_jobs += 1
+            yield job
+
+    def queue_jobs (self, jobs):
+        for job in jobs:
+            with self.condition:
+                self.cnt_jobs_submitted += 1
+                if job[1] in self.speculate_after_by_task and len(job[0]) >= 2:
+                    self.speculative_jobs[job[-1]] = t_speculative_job(job)
+                    self.copies_by_job_index[job[-1]] = (job[-1], 0, job)
+                    job = make_job_copy(job, 0, job[-1])
+                self.pending_jobs.append(job)
+                self.condition.notify_all()
+        with self.condition:
+            self.all_submitted = True
+            self.condition.notify_all()
+        self.results_queue.put(all_jobs_submitted())
+
+    def is_straggler (self, speculative_job):
+        task_name = speculative_job.job[1]
+        durations = sorted(self.durations_by_task[task_name])
+        if (speculative_job.duplicated or speculative_job.start_time == None or
+            len(durations) < self.min_completed_jobs):
+            return False
+        median_duration = durations[len(durations) // 2]
+        return (time.time() - speculative_job.start_time >
+                self.speculate_after_by_task[task_name] * median_duration)
+
+    def watch_jobs (self):
+        """
+        Start a second copy of each straggler
+        """
+        while not self.wait_unless_closed(self.poll_interval):
+            with self.condition:
+                for job_index, speculative_job in self.speculative_jobs.items():
+                    if not self.is_straggler(speculative_job):
+                        continue
+                    speculative_job.duplicated = True
+                    speculative_job.cnt_copies += 1
+                    copy_job_index = self.copy_job_indices.next()
+                    self.copies_by_job_index[copy_job_index] = (job_index, 1, speculative_job.job)
+                    self.duplicate_jobs.append(make_job_copy(speculative_job.job, 1, copy_job_index))
+                    self.cnt_duplicate_jobs += 1
+                    self.condition.notify_all()
+
+    def collect_local_results (self):
+        for result in self.executor.results():
+            with self.condition:
+                self.cnt_local_jobs -= 1
+                self.condition.notify_all()
+                if result.job_index not in self.copies_by_job_index:
+                    self.results_queue.put(result)
+                    continue
+                job_index, copy_number, job = self.copies_by_job_index.pop(result.job_index)
+                speculative_job = self.speculative_jobs.get(job_index)
+
+                #
+                #   ignore the other copy once one has succeeded,
+                #       and a failed copy while the other is still running
+                #
+                if speculative_job != None:
+                    speculative_job.cnt_copies -= 1
+                    if not is_job_done(result) and speculative_job.cnt_copies:
+                        speculative_job = None
+                    else:
+                        del self.speculative_jobs[job_index]
+                        if is_job_done(result):
+                            self.durations_by_task[result.task_name].append(
+                                                    time.time() - speculative_job.start_time)
+            if speculative_job == None or not is_job_done(result):
+                remove_private_outputs(job, copy_number)
+                if speculative_job == None:
+                    continue
+            else:
+                try:
+                    commit_private_outputs(job, copy_number)
+                except:
+                    result = make_job_error_result(get_job_header(job), sys.exc_info())
+            self.results_queue.put(type(result)(*(result[:5] + (job_index,) + result[6:])))
+
+    #_____________________________________________________________________________________
+
+    #   t_executor methods
+
+    #_____________________________________________________________________________________
+    def set_job_limits (self, job_limits):
+        self.executor.set_job_limits(job_limits)
+
+    def submit (self, job_func, jobs):
+        self.executor.submit(job_func, self.get_local_jobs())
+        self.watch_thread = threading.Thread(target = self.watch_jobs)
+        for thread in (threading.Thread(target = self.queue_jobs, args = (jobs,)),
+                       self.watch_thread,
+                       threading.Thread(target = self.collect_local_results)):
+            thread.daemon = True
+            thread.start()
+
+    def cancel (self):
+        # stop handing jobs to executor first
+        t_queued_executor.close(self)
+        self.executor.cancel()
+        with self.condition:
+            copies = self.copies_by_job_index.values()
+            self.copies_by_job_index.clear()
+            self.speculative_jobs.clear()
+        for job_index, copy_number, job in copies:
+            remove_private_outputs(job, copy_number)
+        t_queued_executor.cancel(self)
+
+    def close (self):
+        """
+        Stop copies which are still running after the other copy of their job succeeded,
+            and remove their private outputs
+        """
+        t_queued_executor.close(self)
+        if self.watch_thread:
+            self.watch_thread.join()
+        with self.condition:
+            cnt_running_copies = self.cnt_local_jobs
+            copies = self.copies_by_job_index.values()
+        if cnt_running_copies and self.executor.can_stop_jobs():
+            self.executor.cancel()
+        for job_index, copy_number, job in copies:
+            remove_private_outputs(job, copy_number)
+
+
+#_________________________________________________________________________________________
+
+#   private outputs of copies of jobs (See t_speculative_executor)
+
+#_________________________________________________________________________________________
+def get_private_output_name (file_name, copy_number):
+    """
+    Hidden, in the same directory (and file system) as file_name, with the same extension
+    """
+    directory, base_name = os.path.split(file_name)
+    return os.path.join(directory, ".ruffus_copy%d.%s" % (copy_number, base_name))
+
+def get_private_outputs (job, copy_number):
+    """
+    [(private name, output file name)] for each output of the job
+    """
+    return [(get_private_output_name(file_name, copy_number), file_name)
+                for file_name in get_strings_in_nested_sequence(job[0][1])]
+
+def job_wrapper_private_outputs (copy_number, job_wrapper, param, user_defined_work_func,
+                                 register_cleanup, touch_files_only):
+    """
+    Run job_wrapper with the outputs of the job renamed
+    """
+    param = list(param)
+    param[1] = replace_strings_in_nested_sequence(param[1],
+                    lambda file_name: get_private_output_name(file_name, copy_number))
+    return job_wrapper(param, user_defined_work_func, register_cleanup, touch_files_only)
+
+def make_job_copy (job, copy_number, job_index):
+    """
+    Job parameters for run_pooled_job_without_exceptions which write private outputs
+    """
+    job = list(job)
+    job[3] = functools.partial(job_wrapper_private_outputs, copy_number, job[3])
+    job[-1] = job_index
+    return tuple(job)
+
+def commit_private_outputs (job, copy_number):
+    for private_name, file_name in get_private_outputs(job, copy_number):
+        if os.path.lexists(private_name):
+            os.rename(private_name, file_name)
+
+def remove_private_outputs (job, copy_number):
+    for private_name, file_name in get_private_outputs(job, copy_number):
+        try:
+            if os.path.isdir(private_name) and not os.path.islink(private_name):
+                shutil.rmtree(private_name)
+            else:
+                os.unlink(private_name)
+        except OSError:
+            pass
+
+
+#_________________________________________________________________________________________
+
+#   process groups
+
+#_________________________________________________________________________________________
+#
+#   Seconds that cancelled jobs have to finish after SIGTERM, before SIGKILL
+#
+cancel_grace_seconds = 5.0
+
+def start_process_group ():
+    """
+    Makes this process, and any programs it starts, a separate process group,
+        which can be stopped together (See kill_process_groups),
+        and which does not get the Ctrl-C meant for the pipeline (not on Windows)
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+def kill_process_groups (process_group_ids, grace_seconds = None):
+    """
+    SIGTERM each process group, then SIGKILL whatever is left after grace_seconds
+    """
+    if grace_seconds == None:
+        grace_seconds = cancel_grace_seconds
+    if not hasattr(os, "killpg"):
+        return
+
+    def signal_process_groups (signal_number, process_group_ids):
+        """
+        Returns the process groups which still exist
+        """
+        remaining_ids = []
+        for process_group_id in process_group_ids:
+            try:
+                os.killpg(process_group_id, signal_number)
+                remaining_ids.append(process_group_id)
+            except OSError:
+                pass
+        return remaining_ids
+
+    process_group_ids = signal_process_groups(signal.SIGTERM, process_group_ids)
+    end_time = time.time() + grace_seconds
+    while process_group_ids and time.time() < end_time:
+        time.sleep(0.05)
+        process_group_ids = signal_process_groups(0, process_group_ids)
+    signal_process_groups(signal.SIGKILL, process_group_ids)
+
+
+#_________________________________________________________________________________________
+
+#   helper functions
+
+#_________________________________________________________________________________________
+def write_file (file_name, data):
+    """
+    Closed (and so flushed) before returning, e.g. to be read by another process
+    """
+    f = open(file_name, "wb")
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+def get_job_header (job):
+    """
+    (task name, job name, job index) of job parameters for run_pooled_job_without_exceptions
+    """
+    return job[1], str(job[2]), job[-1]
+
+def get_job_limit_name (job):
+    """
+    @jobs_limit name of job parameters for run_pooled_job_without_exceptions
+    """
+    return job[5]
+
+def get_claim_key (job):
+    """
+    Names the claim on a job, the same for every copy of the pipeline
+        A job whose input files have changed since is claimed afresh
+    """
+    param, task_name = job[0], job[1]
+    input_stats = []
+    if len(param):
+        for file_name in get_strings_in_nested_sequence(param[0]):
+            try:
+                file_stat = os.stat(file_name)
+                input_stats.append((file_stat.st_size, repr(file_stat.st_mtime)))
+            except (OSError, TypeError, ValueError):
+                input_stats.append(None)
+    return hashlib.sha1(repr((task_name, param, input_stats))).hexdigest()
+
+def is_job_done (result):
+    # imported here because task imports this module
+    from task import JOB_COMPLETED, JOB_UP_TO_DATE
+    return result.state in (JOB_COMPLETED, JOB_UP_TO_DATE)
+
+def make_job_elsewhere_result (header, done):
+    """
+    t_job_result for a job which was run by another copy of the pipeline
+    """
+    from task import t_job_result, JOB_UP_TO_DATE
+    if done:
+        task_name, job_name, job_index = header
+        return t_job_result(task_name, JOB_UP_TO_DATE, job_name, None, None, job_index)
+    try:
+        raise Exception("Job failed when run by another copy of the pipeline")
+    except:
+        return make_job_error_result(header, sys.exc_info())
+
+def make_job_error_result (header, exc_info):
+    """
+    t_job_result for a job which could not be sent to, or run by, a worker
+    """
+    # imported here because task imports this module
+    from task import t_job_result, JOB_ERROR
+    task_name, job_name, job_index = header
+    exceptionType, exceptionValue, exceptionTraceback = exc_info
+    exception_stack  = "".join(traceback.format_exception(*exc_info))
+    exception_name   = exceptionType.__module__ + '.' + exceptionType.__name__
+    exception_value  = str(exceptionValue)
+    if len(exception_value):
+        exception_value = "(%s)" % exception_value
+    return t_job_result(task_name, JOB_ERROR, job_name, None,
+                        [task_name, job_name, exception_name, exception_value, exception_stack],
+                        job_index)
+
+def get_worker_environment ():
+    """
+    Environment for worker processes, which can import ruffus from wherever this process did
+    """
+    env = dict(os.environ)
+    ruffus_parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([ruffus_parent_dir] +
+                                        ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    return env
+
+def format_address (address):
+    """
+    "host:port" or Unix socket path for the ruffus-worker command line
+    """
+    if isinstance(address, tuple):
+        return "%s:%d" % address
+    return address
+
+def parse_address (address):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   ruffus-worker
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+def prepare_worker (setup):
+    """
+    Run jobs in the same directory, with the same python path and task functions
+        as the pipeline
+    """
+    if os.path.isdir(setup["cwd"]):
+        os.chdir(setup["cwd"])
+    for path in reversed(setup["sys_path"]):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    #
+    #   task functions in the pipeline script are pickled as "__main__.<name>"
+    #
+    main_file = setup["main_file"]
+    if main_file and os.path.exists(main_file):
+        if main_file.endswith(".pyc"):
+            main_module = imp.load_compiled("__ruffus_main__", main_file)
+        else:
+            main_module = imp.load_source("__ruffus_main__", main_file)
+        sys.modules["__main__"] = main_module
+
+
+def run_job_payload (header, payload):
+    """
+    Run a pickled (job_func, job), returning its t_job_result
+    """
+    #
+    #   each worker runs one job at a time:
+    #       @jobs_limit is enforced by the pipeline (See t_queued_executor.pop_startable_job)
+    #
+    from task import job_limit_semaphores_by_name
+    try:
+        job_func, job = pickle.loads(payload)
+        limit_name = get_job_limit_name(job)
+        if limit_name != None and limit_name not in job_limit_semaphores_by_name:
+            job_limit_semaphores_by_name[limit_name] = threading.BoundedSemaphore()
+        return job_func(job)
+    except:
+        return make_job_error_result(header, sys.exc_info())
+
+def run_worker (connection):
+    """
+    Run jobs sent by the pipeline until told to quit or disconnected
+    """
+    connection.send(("hello", socket.gethostname(), os.getpid()))
+    message, setup = connection.recv()
+    prepare_worker(setup)
+    while 1:
+        message = connection.recv()
+        if message[0] == "quit":
+            break
+        message, header, payload = message
+        result = run_job_payload(header, payload)
+        try:
+            connection.send(("result", result))
+        except (pickle.PicklingError, TypeError):
+            # e.g. return value cannot be pickled
+            connection.send(("result", make_job_error_result(header, sys.exc_info())))
+
+def connect (address, authkey, wait_seconds = 0):
+    """
+    Connect to the pipeline, trying for up to wait_seconds
+    """
+    give_up_time = time.time() + wait_seconds
+    while 1:
+        try:
+            return Client(address, authkey = authkey)
+        except socket.error:
+            if time.time() >= give_up_time:
+                raise
+            time.sleep(0.5)
+
+def worker_main (argv = None):
+    """
+    ruffus-worker [options] ADDRESS
+    """
+    from optparse import OptionParser
+    parser = OptionParser(usage = "\n\n    %prog [options] HOST:PORT|UNIX_SOCKET_PATH\n\n"
+                                  "Run jobs of the pipeline listening at this address "
+                                  "(See t_socket_executor)")
+    parser.add_option("--authkey_file", dest = "authkey_file", metavar = "FILE",
+                      help = "File containing the key shared with the pipeline. "
+                             "Defaults to $RUFFUS_WORKER_AUTHKEY")
+    parser.add_option("--wait", dest = "wait_seconds", type = "float", default = 0, metavar = "SECONDS",
+                      help = "Keep trying to connect for this long.")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Please specify the address of the pipeline")
+
+    if options.authkey_file:
+        authkey = open(options.authkey_file).read().strip()
+    else:
+        authkey = os.environ.get("RUFFUS_WORKER_AUTHKEY")
+    if not authkey:
+        parser.error("Please specify the key shared with the pipeline "
+                     "with --authkey_file or $RUFFUS_WORKER_AUTHKEY")
+
+    connection = connect(parse_address(args[0]), authkey, options.wait_seconds)
+    try:
+        run_worker(connection)
+    except EOFError:
+        # pipeline has gone away
+        pass
+    finally:
+        connection.close()
+
+
+def run_batch_task (argv = None):
+    """
+    Run one job of an array submitted by t_batch_executor:
+
+        run_batch_task([ARRAY_DIR, TASK_ID])
+
+    The result is written to ARRAY_DIR/TASK_ID.result, atomically
+    """
+    array_dir, task_id = argv or sys.argv[1:]
+    job_file = os.path.join(array_dir, "%s.job" % task_id)
+    if not os.path.exists(job_file):
+        return
+    prepare_worker(pickle.load(open(os.path.join(array_dir, "setup.pickle"), "rb")))
+    header, payload = pickle.load(open(job_file, "rb"))
+    result = run_job_payload(header, payload)
+    try:
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError):
+        # e.g. return value cannot be pickled
+        data = pickle.dumps(make_job_error_result(header, sys.exc_info()), pickle.HIGHEST_PROTOCOL)
+    result_file = os.path.join(array_dir, "%s.result" % task_id)
+    write_file(result_file + ".tmp", data)
+    os.rename(result_file + ".tmp", result_file)
+
+
+if __name__ == '__main__':
+    worker_main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+################################################################################
+#
+#   file_cache.py
+#
+#
+#   Copyright (c) 10/9/2009 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#################################################################################
+
+
+"""
+
+********************************************
+:mod:`file_cache` -- Overview
+********************************************
+
+
+.. moduleauthor:: Leo Goodstadt <ruffus@llew.org.uk>
+
+    Caches file system information for the duration of a pipeline run
+
+    The same file is often the output of one task and the input of many jobs
+        downstream, and would otherwise be stat-ed again for every job
+        (a network round trip on NFS).
+
+    Cached values are forgotten for the outputs of each job as it completes
+        (See pipeline_run)
+
+    Glob patterns are matched against cached directory listings, which are
+        reused until the directory is modified, and can be saved between runs
+        (See t_glob_cache and pipeline_run(glob_cache_file = ...))
+
+    Outputs of @in_memory tasks appear to the up to date checks as virtual files
+        (See t_virtual_stat)
+
+
+"""
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+import os
+import stat
+import time
+import fnmatch
+import glob
+import cPickle as pickle
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_virtual_stat
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_virtual_stat(object):
+    """
+    Stands in for os.stat() of a name which is not a file, e.g. the output of an
+        @in_memory task (See t_data_store), so that it can be compared with files
+        by the up to date checks
+    """
+    st_mode = stat.S_IFREG
+    st_dev  = -1
+
+    def __init__ (self, ino, size, mtime):
+        self.st_ino     = ino
+        self.st_size    = size
+        self.st_mtime   = mtime
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_stat_cache
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_stat_cache(object):
+    """
+    os.stat() and os.path.realpath() for each file name
+
+        Only caches while a pipeline is running (between start() and stop()),
+            otherwise always asks the file system.
+        Missing files are cached as None.
+        Virtual files are kept until stop() (See add_virtual_file)
+    """
+    def __init__ (self):
+        self.enabled            = False
+        self.file_stats         = dict()
+        self.virtual_stats      = dict()
+        self.real_paths         = dict()
+        self.cnt_syscalls       = 0
+        self.cnt_syscalls_saved = 0
+
+    #_____________________________________________________________________________________
+
+    #   start / stop
+
+    #_____________________________________________________________________________________
+    def start (self):
+        """
+        Start caching with a clean slate
+        """
+        self.clear()
+        self.virtual_stats.clear()
+        self.cnt_syscalls       = 0
+        self.cnt_syscalls_saved = 0
+        self.enabled            = True
+
+    def stop (self):
+        self.clear()
+        self.virtual_stats.clear()
+        self.enabled            = False
+
+    def clear (self):
+        self.file_stats.clear()
+        self.real_paths.clear()
+
+    #_____________________________________________________________________________________
+
+    #   invalidate
+
+    #_____________________________________________________________________________________
+    def invalidate (self, file_names):
+        """
+        Forget what we know about these files, e.g. after a job has written them
+        """
+        for file_name in file_names:
+            self.file_stats.pop(file_name, None)
+            self.real_paths.pop(file_name, None)
+
+    #_____________________________________________________________________________________
+
+    #   add_virtual_file
+
+    #_____________________________________________________________________________________
+    def add_virtual_file (self, file_name, size, mtime):
+        """
+        Name which is not in the file system but should be treated as a file of this
+            size, made at mtime
+        """
+        self.virtual_stats[file_name] = t_virtual_stat(len(self.virtual_stats), size, mtime)
+
+    #_____________________________________________________________________________________
+
+    #   stat
+
+    #_____________________________________________________________________________________
+    def stat (self, file_name):
+        """
+        os.stat() or None if the file does not exist
+        """
+        if file_name in self.virtual_stats:
+            return self.virtual_stats[file_name]
+        if self.enabled and file_name in self.file_stats:
+            self.cnt_syscalls_saved += 1
+            return self.file_stats[file_name]
+
+        self.cnt_syscalls += 1
+        try:
+            file_stat = os.stat(file_name)
+        except os.error:
+            file_stat = None
+        if self.enabled:
+            self.file_stats[file_name] = file_stat
+        return file_stat
+
+    def exists (self, file_name):
+        return self.stat(file_name) != None
+
+    def isdir (self, file_name):
+        file_stat = self.stat(file_name)
+        return file_stat != None and stat.S_ISDIR(file_stat.st_mode)
+
+    def file_id (self, file_name):
+        """
+        (device, inode): the same for every path to a file, e.g. through symbolic links
+            None if the file does not exist
+        """
+        file_stat = self.stat(file_name)
+        if file_stat == None:
+            return None
+        return file_stat.st_dev, file_stat.st_ino
+
+    def getmtime (self, file_name):
+        file_stat = self.stat(file_name)
+        if file_stat == None:
+            # raise the usual exception
+            return os.path.getmtime(file_name)
+        return file_stat.st_mtime
+
+    #_____________________________________________________________________________________
+
+    #   realpath
+
+    #_____________________________________________________________________________________
+    def realpath (self, file_name):
+        if self.enabled and file_name in self.real_paths:
+            self.cnt_syscalls_saved += 1
+            return self.real_paths[file_name]
+
+        self.cnt_syscalls += 1
+        real_path = os.path.realpath(file_name)
+        if self.enabled:
+            self.real_paths[file_name] = real_path
+        return real_path
+
+    #_____________________________________________________________________________________
+
+    #   get_summary
+
+    #_____________________________________________________________________________________
+    def get_summary (self):
+        return ("File system calls: %d made, %d saved by caching" %
+                    (self.cnt_syscalls, self.cnt_syscalls_saved))
+
+
+#
+#   shared by all up to date checks
+#
+stat_cache = t_stat_cache()
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_glob_cache
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_glob_cache(object):
+    """
+    glob.glob() using cached directory listings
+
+        A directory listing is reused while the modification time of the directory
+            is unchanged.
+        Listings taken within racy_interval seconds of the directory being modified
+            are not reused: files added in the same clock tick would not change
+            the modification time.
+        Listings are also forgotten when the pipeline writes files into the directory
+            (See invalidate)
+        Only caches while a pipeline is running (between start() and stop()),
+            otherwise always lists the directory.
+    """
+    racy_interval = 2.0
+
+    def __init__ (self):
+        self.enabled            = False
+        # absolute directory name -> (mtime, time listed, names, {pattern: matching names})
+        self.listings           = dict()
+        self.cnt_listdirs       = 0
+        self.cnt_listdirs_saved = 0
+
+    #_____________________________________________________________________________________
+
+    #   start / stop
+
+    #_____________________________________________________________________________________
+    def start (self, file_name = None):
+        """
+        Start counting directory listings, reusing listings saved in file_name if any
+        """
+        self.cnt_listdirs       = 0
+        self.cnt_listdirs_saved = 0
+        self.enabled            = True
+        if file_name:
+            self.load(file_name)
+
+    def stop (self, file_name = None):
+        """
+        Save listings to file_name if any, when they are also kept for the next pipeline
+            run in the same process. Otherwise forget them
+        """
+        if file_name:
+            self.save(file_name)
+        else:
+            self.clear()
+        self.enabled            = False
+
+    def clear (self):
+        self.listings.clear()
+
+    #_____________________________________________________________________________________
+
+    #   invalidate
+
+    #_____________________________________________________________________________________
+    def invalidate (self, file_names):
+        """
+        Forget the listings of the directories containing these files
+        """
+        for file_name in file_names:
+            self.listings.pop(os.path.dirname(os.path.abspath(file_name)), None)
+
+    #_____________________________________________________________________________________
+
+    #   load / save
+
+    #_____________________________________________________________________________________
+    def load (self, file_name):
+        """
+        Read listings saved by a previous run. Missing or unreadable files are ignored
+        """
+        try:
+            f = open(file_name, "rb")
+            try:
+                listings = pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return
+        if isinstance(listings, dict):
+            self.listings.update(listings)
+
+    def save (self, file_name):
+        """
+        Write listings atomically (via a temporary file)
+        """
+        temp_file_name = file_name + ".tmp.%d" % os.getpid()
+        f = open(temp_file_name, "wb")
+        try:
+            pickle.dump(self.listings, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(temp_file_name, file_name)
+
+    #_____________________________________________________________________________________
+
+    #   listing / listdir
+
+    #_____________________________________________________________________________________
+    def listing (self, dir_name):
+        """
+        Cached (mtime, time listed, names, matches) of directory or None if unreadable
+        """
+        key = os.path.abspath(dir_name)
+        try:
+            mtime = os.stat(key).st_mtime
+        except os.error:
+            self.listings.pop(key, None)
+            return None
+
+        listing = self.listings.get(key)
+        if (self.enabled and listing != None and listing[0] == mtime and
+            listing[1] - mtime > self.racy_interval):
+            self.cnt_listdirs_saved += 1
+            return listing
+
+        self.cnt_listdirs += 1
+        listed_time = time.time()
+        try:
+            names = os.listdir(key)
+        except os.error:
+            self.listings.pop(key, None)
+            return None
+        listing = (mtime, listed_time, names, dict())
+        if self.enabled:
+            self.listings[key] = listing
+        return listing
+
+    def listdir (self, dir_name):
+        listing = self.listing(dir_name)
+        if listing == None:
+            return []
+        return listing[2]
+
+    #_____________________________________________________________________________________
+
+    #   glob
+
+    #_____________________________________________________________________________________
+    def glob (self, pathname):
+        """
+        Same results as glob.glob()
+        """
+        dir_name, base_name = os.path.split(pathname)
+        if not glob.has_magic(pathname):
+            if base_name:
+                if os.path.lexists(pathname):
+                    return [pathname]
+            elif os.path.isdir(dir_name):
+                return [pathname]
+            return []
+
+        if not dir_name:
+            return self.glob_in_dir(os.curdir, base_name)
+
+        if dir_name != pathname and glob.has_magic(dir_name):
+            dir_names = self.glob(dir_name)
+        else:
+            dir_names = [dir_name]
+
+        results = []
+        for dir_name in dir_names:
+            if glob.has_magic(base_name):
+                names = self.glob_in_dir(dir_name, base_name)
+            elif base_name in self.listdir(dir_name) or (not base_name and os.path.isdir(dir_name)):
+                names = [base_name]
+            else:
+                continue
+            results.extend(os.path.join(dir_name, name) for name in names)
+        return results
+
+    def glob_in_dir (self, dir_name, pattern):
+        """
+        Names in directory matching pattern, remembered with the listing
+        """
+        listing = self.listing(dir_name or os.curdir)
+        if listing == None:
+            return []
+        matches = listing[3]
+        if pattern not in matches:
+            names = listing[2]
+            if pattern[0] != '.':
+                names = [name for name in names if name[0] != '.']
+            matches[pattern] = fnmatch.filter(names, pattern)
+        return matches[pattern]
+
+    #_____________________________________________________________________________________
+
+    #   get_summary
+
+    #_____________________________________________________________________________________
+    def get_summary (self):
+        return ("Directory listings: %d made, %d saved by caching" %
+                    (self.cnt_listdirs, self.cnt_listdirs_saved))
+
+
+#
+#   shared by all glob specifications in task parameters
+#
+glob_cache = t_glob_cache()
@@ -51,7 +51,7 @@
 #88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
 import os,copy
 import re
-import glob
+from array import array
 from operator import itemgetter
 from itertools import groupby
 from collections import defaultdict
@@ -63,6 +63,8 @@ if __name__ == '__main__':
 from ruffus_exceptions import *
 #from file_name_parameters import *
 from ruffus_utility import *
+from file_cache import stat_cache, glob_cache
+from job_history import job_history
 
 
 
@@ -205,9 +207,9 @@ def needs_update_check_directory_missing (dirs):
     """
     for d in dirs:
         #print >>sys.stderr, "check directory missing %d " % os.path.exists(d) # DEBUG
-        if not os.path.exists(d):
+        if not stat_cache.exists(d):
             return True, "Directory [%s] is missing" % d
-        if not os.path.isdir(d):
+        if not stat_cache.isdir(d):
             raise error_not_a_directory("%s already exists but as a file, not a directory" % d )
     return False, "All directories exist"
 
@@ -227,7 +229,7 @@ def check_input_files_exist (*params):
     if len(params):
         input_files = params[0]
         for f in get_strings_in_nested_sequence(input_files):
-            if not os.path.exists(f):
+            if not stat_cache.exists(f):
                 raise MissingInputFileError("No way to run job: "+
                                             "Input file ['%s'] does not exist" % f)
 
@@ -266,7 +268,7 @@ def needs_update_check_exist (*params):
     missing_files = []
     for io in (i, o):
         for p in io:
-            if not os.path.exists(p):
+            if not stat_cache.exists(p):
                 missing_files.append(p)
     if len(missing_files):
         return True, "Missing file%s [%s]" % ("s" if len(missing_files) > 1 else "",
@@ -296,8 +298,91 @@ def needs_update_check_modify_time (*params):
         #. any other type
         #. arbitrary nested sequence of (1) and (2)
 
+    Uses the order in which files were made by previous jobs if there is a job history
+        (See pipeline_run(history_file = ...))
+    or checks whether the contents of input files have changed
+        (See pipeline_run(checksums = True))
+    """
+    if job_history.is_open():
+        if job_history.use_checksums:
+            return needs_update_check_checksum (*params)
+        return needs_update_check_job_history (*params)
+    return needs_update_check_file_times (*params)
+
+#_________________________________________________________________________________________
+
+#   needs_update_check_checksum
+
+#_________________________________________________________________________________________
+def needs_update_check_checksum (*params):
     """
+    Given input and output files, see if all exist and whether the contents of the input
+        files have changed since the output files were made
+
+    Touching an input file without changing it does not make its outputs out of date
 
+    Checksums are recorded in the job history (See pipeline_run(history_file = ...))
+        Output files made without recording checksums are checked as
+        by needs_update_check_modify_time
+    """
+    needs_update, err_msg = needs_update_check_exist (*params)
+    if (needs_update, err_msg) != (False, "Up to date"):
+        return needs_update, err_msg
+
+    if not job_history.is_open():
+        return needs_update_check_file_times (*params)
+
+    i, o = params[0:2]
+    i = set(get_strings_in_nested_sequence(i))
+    o = get_strings_in_nested_sequence(o)
+
+    #
+    #   Ignore output file if it is found in the list of input files
+    #
+    i.difference_update(o)
+
+    records = job_history.lookup_input_checksums(o)
+    if not all(f in records for f in o):
+        return needs_update_check_job_history (*params)
+
+    changed_input_file_names = set()
+    for output_file_name in o:
+        input_checksums = records[output_file_name]
+        if set(input_checksums) != i:
+            return True, ("Input files differ from those used to make %s" %
+                            get_readable_path_str(output_file_name, 55))
+        for input_file_name in i:
+            if job_history.file_checksum(input_file_name) != input_checksums[input_file_name]:
+                changed_input_file_names.add(input_file_name)
+
+    if len(changed_input_file_names):
+        return True, t_lazy_str(file_names_msg, "Input files changed:",
+                                sorted(changed_input_file_names))
+    return False, "Up to date"
+
+#_________________________________________________________________________________________
+
+#   file_names_msg
+
+#_________________________________________________________________________________________
+def file_names_msg (msg, file_names):
+    """
+    Message followed by a line for each file name (See needs_update_check_job_history)
+    """
+    return msg + "\n" + "".join("    %s\n" % get_readable_path_str(f, 55) for f in file_names)
+
+#_________________________________________________________________________________________
+
+#   needs_update_check_job_history
+
+#_________________________________________________________________________________________
+def needs_update_check_job_history (*params):
+    """
+    Given input and output files, see if all exist and whether output files were made
+        by jobs which completed after the jobs which made the input files
+
+    Files not made by recorded jobs, or modified since, are compared by modification time
+    """
     needs_update, err_msg = needs_update_check_exist (*params)
     if (needs_update, err_msg) != (False, "Up to date"):
         return needs_update, err_msg
@@ -306,11 +391,56 @@ def needs_update_check_modify_time (*params):
     i = get_strings_in_nested_sequence(i)
     o = get_strings_in_nested_sequence(o)
 
+    records = job_history.lookup(i + o)
+    def is_recorded (file_name):
+        return (file_name in records and
+                records[file_name][1] == stat_cache.getmtime(file_name))
+
     #
-    #   get sorted modified times for all input and output files
+    #   output not made by recorded jobs: check modification times
+    #
+    if not all(is_recorded(f) for f in o):
+        return needs_update_check_file_times (*params)
+
     #
-    filename_to_times = [[], []]
-    file_times = [[], []]
+    #   Ignore output file if it is found in the list of input files
+    #
+    output_file_ids = set(stat_cache.file_id(f) for f in o)
+    oldest_output_sequence, oldest_output_mtime = min(records[f] for f in o)
+
+    newer_input_file_names = []
+    for input_file_name in i:
+        if stat_cache.file_id(input_file_name) in output_file_ids:
+            continue
+        if is_recorded(input_file_name):
+            if records[input_file_name][0] > oldest_output_sequence:
+                newer_input_file_names.append(input_file_name)
+        elif stat_cache.getmtime(input_file_name) >= oldest_output_mtime:
+            newer_input_file_names.append(input_file_name)
+
+    if len(newer_input_file_names):
+        return True, t_lazy_str(file_names_msg, "Input files made or modified after output files:",
+                                newer_input_file_names)
+    return False, "Up to date"
+
+#_________________________________________________________________________________________
+
+#   needs_update_check_file_times
+
+#_________________________________________________________________________________________
+def needs_update_check_file_times (*params):
+    """
+    Given input and output files, see if all exist and whether output files have
+        later modification times than input files
+    """
+
+    needs_update, err_msg = needs_update_check_exist (*params)
+    if (needs_update, err_msg) != (False, "Up to date"):
+        return needs_update, err_msg
+
+    i, o = params[0:2]
+    i = get_strings_in_nested_sequence(i)
+    o = get_strings_in_nested_sequence(o)
 
 
 
@@ -319,11 +449,12 @@ def needs_update_check_modify_time (*params):
     #   pretty_io_with_date_times
 
     #_____________________________________________________________________________________
-    def pretty_io_with_date_times (filename_to_times):
+    def pretty_io_with_date_times ():
 
-        # sort
-        for io in range(2) :
-            filename_to_times[io].sort()
+        #
+        #   get sorted modified times for all input and output files
+        #
+        filename_to_times = [sorted((stat_cache.getmtime(f), f) for f in io) for io in (i, o)]
 
 
         #
@@ -360,35 +491,36 @@ def needs_update_check_modify_time (*params):
     #       By definition they have the same timestamp,
     #       and the job will otherwise appear to be out of date
     #
-    #   Symbolic links followed
-    real_input_file_names = set()
+    #   Files are identified by (device, inode) from a single (cached) stat,
+    #       so symbolic links are followed
+    #
+    input_file_ids = set()
+    input_file_times = array('d')
     for input_file_name in i:
-        real_input_file_names.add(os.path.realpath(input_file_name))
-        mtime = os.path.getmtime(input_file_name)
-        filename_to_times[0].append((mtime, input_file_name))
-        file_times[0].append(mtime)
+        file_stat = stat_cache.stat(input_file_name) or os.stat(input_file_name)
+        input_file_ids.add((file_stat.st_dev, file_stat.st_ino))
+        input_file_times.append(file_stat.st_mtime)
 
+    output_file_times = array('d')
     for output_file_name in o:
-        real_file_name = os.path.realpath(output_file_name)
-        mtime = os.path.getmtime(output_file_name)
-        if real_file_name not in real_input_file_names:
-            file_times[1].append(mtime)
-        filename_to_times[1].append((mtime, output_file_name))
+        file_stat = stat_cache.stat(output_file_name) or os.stat(output_file_name)
+        if (file_stat.st_dev, file_stat.st_ino) not in input_file_ids:
+            output_file_times.append(file_stat.st_mtime)
 
 
     #
     #   Debug: Force print modified file names and times
     #
-    #if len(file_times[0]) and len (file_times[1]):
-    #    print >>sys.stderr, pretty_io_with_date_times(filename_to_times), file_times, (max(file_times[0]) >= min(file_times[1]))
+    #if len(input_file_times) and len (output_file_times):
+    #    print >>sys.stderr, pretty_io_with_date_times(), (max(input_file_times) >= min(output_file_times))
     #else:
     #    print >>sys.stderr, i, o
 
     #
     #   update if any input file >= (more recent) output file
     #
-    if len(file_times[0]) and len (file_times[1]) and max(file_times[0]) >= min(file_times[1]):
-        return True, pretty_io_with_date_times(filename_to_times)
+    if len(input_file_times) and len (output_file_times) and max(input_file_times) >= min(output_file_times):
+        return True, t_lazy_str(pretty_io_with_date_times)
     return False, "Up to date"
 
 
@@ -442,7 +574,7 @@ def file_names_from_tasks_globs(files_task_globs,
 
     # look up globs and tasks
     for g in files_task_globs.globs:
-        task_or_glob_to_files[g] = sorted(glob.glob(g))
+        task_or_glob_to_files[g] = sorted(glob_cache.glob(g))
     for t in files_task_globs.tasks:
         of = t.get_output_files(False, runtime_data)
         task_or_glob_to_files[t] = of
@@ -523,6 +655,7 @@ def touch_file_factory (orig_args, register_cleanup):
             else:
                 os.utime(f, None)
             register_cleanup(f, "touch")
+        stat_cache.invalidate(file_names)
     return do_touch_file
 
 
@@ -731,6 +864,71 @@ def split_ex_param_factory (input_files_task_globs,
 
 #_________________________________________________________________________________________
 
+#   transform_single_input_param_factory
+
+#_________________________________________________________________________________________
+def transform_single_input_param_factory (regex,
+                                          regex_or_suffix,
+                                          extra_input_files_task_globs,
+                                          replace_inputs,
+                                          output_pattern,
+                                          *extra_specs):
+    """
+    Factory for the parameters of the single @transform job made from one input
+        Returns None if the input does not match the regular expression / suffix
+
+    Used by transform_param_factory, and to start the downstream job as soon as
+        the upstream job which made this input has completed
+    """
+    # for regex, always substitute whether output or extra inputs or extras
+    if regex_or_suffix:
+        regex_or_suffix_extras  = REGEX_SUBSTITUTE
+        regex_or_suffix_outputs = REGEX_SUBSTITUTE
+
+    # for suffix, outputs there is an implicit "\1", otherwise only substitute when there is a "\1"
+    else:
+        regex_or_suffix_extras  = SUFFIX_SUBSTITUTE_IF_SPECIFIED
+        regex_or_suffix_outputs = SUFFIX_SUBSTITUTE_ALWAYS
+
+    def param_for_input(orig_input_param, runtime_data):
+
+        #
+        #   turn input param into a string and match with regular expression
+        #
+        filename = get_first_string_in_nested_sequence(orig_input_param)
+        if filename == None or not regex.search(filename):
+            return None
+
+        #
+        #   if "inputs" defined  turn input string into i/o/extras with regex
+        #
+        if extra_input_files_task_globs != None:
+            # extras
+            extra_inputs = extra_input_files_task_globs.regex_replaced (filename, regex, regex_or_suffix_extras)
+
+
+            # inputs()
+            if replace_inputs:
+                input_param = file_names_from_tasks_globs(extra_inputs, runtime_data)
+            # add_inputs()
+            else:
+                input_param = (orig_input_param,) + file_names_from_tasks_globs(extra_inputs, runtime_data)
+        else:
+            input_param = orig_input_param
+
+        # output
+        output_param = regex_replace(filename, regex, output_pattern, regex_or_suffix_outputs)
+
+        # extras
+        extra_params = tuple(regex_replace(filename, regex, p, regex_or_suffix_extras) for p in extra_specs)
+
+        yield_param = (input_param, output_param) + extra_params
+        return yield_param, yield_param
+
+    return param_for_input
+
+#_________________________________________________________________________________________
+
 #   transform_param_factory
 
 #_________________________________________________________________________________________
@@ -744,6 +942,12 @@ def transform_param_factory (input_files_task_globs,
     """
     Factory for task_transform
     """
+    param_for_input = transform_single_input_param_factory (regex,
+                                                            regex_or_suffix,
+                                                            extra_input_files_task_globs,
+                                                            replace_inputs,
+                                                            output_pattern,
+                                                            *extra_specs)
     def iterator(runtime_data):
 
         #
@@ -763,52 +967,15 @@ def transform_param_factory (input_files_task_globs,
         #
         no_regular_expression_matches = True
 
-        # for regex, always substitute whether output or extra inputs or extras
-        if regex_or_suffix:
-            regex_or_suffix_extras  = REGEX_SUBSTITUTE
-            regex_or_suffix_outputs = REGEX_SUBSTITUTE
-
-        # for suffix, outputs there is an implicit "\1", otherwise only substitute when there is a "\1"
-        else:
-            regex_or_suffix_extras  = SUFFIX_SUBSTITUTE_IF_SPECIFIED
-            regex_or_suffix_outputs = SUFFIX_SUBSTITUTE_ALWAYS
-
         for orig_input_param in sorted(input_params):
 
-            #
-            #   turn input param into a string and match with regular expression
-            #
-            filename = get_first_string_in_nested_sequence(orig_input_param)
-            if filename == None or not regex.search(filename):
+            params = param_for_input(orig_input_param, runtime_data)
+            if params == None:
                 continue
 
             no_regular_expression_matches = False
 
-            #
-            #   if "inputs" defined  turn input string into i/o/extras with regex
-            #
-            if extra_input_files_task_globs != None:
-                # extras
-                extra_inputs = extra_input_files_task_globs.regex_replaced (filename, regex, regex_or_suffix_extras)
-
-
-                # inputs()
-                if replace_inputs:
-                    input_param = file_names_from_tasks_globs(extra_inputs, runtime_data)
-                # add_inputs()
-                else:
-                    input_param = (orig_input_param,) + file_names_from_tasks_globs(extra_inputs, runtime_data)
-            else:
-                input_param = orig_input_param
-
-            # output
-            output_param = regex_replace(filename, regex, output_pattern, regex_or_suffix_outputs)
-
-            # extras
-            extra_params = tuple(regex_replace(filename, regex, p, regex_or_suffix_extras) for p in extra_specs)
-
-            yield_param = (input_param, output_param) + extra_params
-            yield yield_param, yield_param
+            yield params
 
         #
         #   Add extra warning if no regular expressions match:
@@ -1126,6 +1126,26 @@ def get_reachable_nodes(nodes, parents_as_well = True):
     return child_visitor.topological_sorted()
 
 
+#_________________________________________________________________________________________
+
+#   get_longest_path_lengths
+
+#_________________________________________________________________________________________
+def get_longest_path_lengths (nodes, node_weight_func):
+    """
+    Length of the longest path from each node through the nodes which depend on it,
+        where each node on the path adds node_weight_func(node)
+
+    nodes must be in topological order (dependencies first, as from
+        topologically_sorted_nodes). Only paths through these nodes are counted.
+    """
+    path_lengths = dict()
+    for n in reversed(nodes):
+        downstream = [path_lengths[d] for d in n._inward if d in path_lengths]
+        path_lengths[n] = node_weight_func(n) + max(downstream or [0])
+    return path_lengths
+
+
 #_________________________________________________________________________________________
 
 #   Helper functions to dump edges and nodes
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+################################################################################
+#
+#   job_history.py
+#
+#
+#   Copyright (c) 10/9/2009 Leo Goodstadt
+#
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to deal
+#   in the Software without restriction, including without limitation the rights
+#   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#   copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+#   THE SOFTWARE.
+#################################################################################
+
+
+"""
+
+********************************************
+:mod:`job_history` -- Overview
+********************************************
+
+
+.. moduleauthor:: Leo Goodstadt <ruffus@llew.org.uk>
+
+    Records the order in which jobs completed, in an SQLite database
+
+    For each output file, remember
+        1) the sequence number of the job which made it
+        2) its modification time when the job completed
+
+    Up to date checks can then compare when files were made by sequence number
+        rather than by modification times, which have a resolution of
+        one second on many file systems.
+        (See pipeline_run(history_file = ...) and needs_update_check_modify_time)
+
+    Also records
+        3) the checksums of the input files used to make each output
+        4) the checksum of each file, by (device, inode, size, modification time),
+           so that unchanged files are only read once
+        (See needs_update_check_checksum)
+
+    And how long each job took, so that jobs on the longest (critical) path
+        through the pipeline can be started first
+        (See pipeline_run(priority_policy = "critical_path"))
+
+"""
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+import os
+import time
+import hashlib
+import threading
+
+from file_cache import stat_cache
+from data_store import data_store
+
+#
+#   sqlite3 is optional in some python builds
+#
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   t_job_history
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_job_history(object):
+    """
+    Job completion history for the duration of a pipeline run
+
+        Only jobs in this (main) process are recorded.
+        Records are committed in batches and when the history is closed:
+            files whose records are lost are compared by modification time
+
+        Up to date checks may run in several threads at once
+            (See pipeline_run(uptodate_check_threads = ...)):
+            the database is only accessed while holding self.lock
+    """
+    # maximum number of SQL variables in a query
+    max_lookup_batch = 500
+
+    #
+    #   Files modified less than this many seconds ago might be modified again
+    #       without changing their modification time (racy timestamps)
+    #       Their checksums are not remembered
+    #
+    racy_interval = 2.0
+
+    def __init__ (self, commit_interval = 1000):
+        self.connection             = None
+        self.next_job_sequence      = 0
+        self.commit_interval        = commit_interval
+        self.cnt_uncommitted        = 0
+
+        # whether tasks checking modification times should check checksums instead
+        self.use_checksums          = False
+
+        # file name -> ((device, inode, size, mtime), checksum)
+        self.file_checksums         = dict()
+
+        self.lock                   = threading.RLock()
+
+    #_____________________________________________________________________________________
+
+    #   open / close
+
+    #_____________________________________________________________________________________
+    def open (self, file_name, read_only = False):
+        """
+        Open (or create) history database
+            read_only: do not create a missing database
+        """
+        self.close()
+        if sqlite3 == None:
+            raise Exception("The job history needs the sqlite3 module, "
+                            "which is not available in this python installation")
+        if read_only and not os.path.exists(file_name):
+            return
+        self.connection = sqlite3.connect(file_name, check_same_thread = False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS job_files ("
+                                "   file_name       TEXT PRIMARY KEY,"
+                                "   job_sequence    INTEGER NOT NULL,"
+                                "   mtime           REAL NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS file_checksums ("
+                                "   file_name       TEXT PRIMARY KEY,"
+                                "   st_dev          INTEGER NOT NULL,"
+                                "   st_ino          INTEGER NOT NULL,"
+                                "   size            INTEGER NOT NULL,"
+                                "   mtime           REAL NOT NULL,"
+                                "   checksum        TEXT NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS job_input_checksums ("
+                                "   output_file     TEXT NOT NULL,"
+                                "   input_file      TEXT NOT NULL,"
+                                "   checksum        TEXT NOT NULL,"
+                                "   PRIMARY KEY (output_file, input_file))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS job_durations ("
+                                "   task_name       TEXT NOT NULL,"
+                                "   job_key         TEXT NOT NULL,"
+                                "   duration        REAL NOT NULL,"
+                                "   PRIMARY KEY (task_name, job_key))")
+        self.file_checksums.clear()
+        (max_job_sequence,) = self.connection.execute("SELECT MAX(job_sequence) FROM job_files").fetchone()
+        self.next_job_sequence = 0 if max_job_sequence == None else max_job_sequence + 1
+
+    def is_open (self):
+        return self.connection != None
+
+    def close (self):
+        self.use_checksums = False
+        if self.connection == None:
+            return
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+
+    #_____________________________________________________________________________________
+
+    #   record_job
+
+    #_____________________________________________________________________________________
+    def record_job (self, output_file_names):
+        """
+        Remember that a job has just made these files
+        """
+        records = []
+        for file_name in output_file_names:
+            file_stat = stat_cache.stat(file_name)
+            if file_stat != None:
+                records.append((file_name, self.next_job_sequence, file_stat.st_mtime))
+        self.next_job_sequence += 1
+        if not len(records):
+            return
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO job_files "
+                                        "(file_name, job_sequence, mtime) VALUES (?, ?, ?)", records)
+            self.count_uncommitted()
+
+    def count_uncommitted (self):
+        with self.lock:
+            self.cnt_uncommitted += 1
+            if self.cnt_uncommitted >= self.commit_interval:
+                self.connection.commit()
+                self.cnt_uncommitted = 0
+
+    #_____________________________________________________________________________________
+
+    #   record_job_duration
+
+    #_____________________________________________________________________________________
+    def record_job_duration (self, task_name, job_key, duration):
+        """
+        Remember how many seconds the job took
+            job_key identifies the job within its task, e.g. by its output
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO job_durations "
+                                    "(task_name, job_key, duration) VALUES (?, ?, ?)",
+                                    (task_name, job_key, duration))
+            self.count_uncommitted()
+
+    #_____________________________________________________________________________________
+
+    #   lookup_job_durations
+
+    #_____________________________________________________________________________________
+    def lookup_job_durations (self, task_names):
+        """
+        Returns dictionary of task name -> {job key: duration} for recorded jobs
+        """
+        records = dict()
+        query = "SELECT task_name, job_key, duration FROM job_durations WHERE task_name IN (%s)"
+        for task_name, job_key, duration in self.select_by_file_names(query, task_names):
+            records.setdefault(task_name, dict())[job_key] = duration
+        return records
+
+    #_____________________________________________________________________________________
+
+    #   record_input_checksums
+
+    #_____________________________________________________________________________________
+    def record_input_checksums (self, output_file_names, input_file_names):
+        """
+        Remember the contents of the input files used by a job to make its output
+        """
+        input_checksums = []
+        for file_name in set(input_file_names).difference(output_file_names):
+            checksum = self.file_checksum(file_name)
+            if checksum != None:
+                input_checksums.append((file_name, checksum))
+        with self.lock:
+            for output_file_name in output_file_names:
+                self.connection.execute("DELETE FROM job_input_checksums WHERE output_file = ?",
+                                        (output_file_name,))
+                self.connection.executemany("INSERT INTO job_input_checksums "
+                                            "(output_file, input_file, checksum) VALUES (?, ?, ?)",
+                                            [(output_file_name, f, c) for f, c in input_checksums])
+            self.count_uncommitted()
+
+    #_____________________________________________________________________________________
+
+    #   lookup_input_checksums
+
+    #_____________________________________________________________________________________
+    def lookup_input_checksums (self, output_file_names):
+        """
+        Returns dictionary of output file name -> {input file name: checksum}
+            for output files made by recorded jobs
+        """
+        records = dict()
+        query = ("SELECT output_file, input_file, checksum FROM job_input_checksums "
+                 "WHERE output_file IN (%s)")
+        for output_file, input_file, checksum in self.select_by_file_names(query, output_file_names):
+            records.setdefault(output_file, dict())[input_file] = checksum
+        return records
+
+    #_____________________________________________________________________________________
+
+    #   file_checksum
+
+    #_____________________________________________________________________________________
+    def file_checksum (self, file_name):
+        """
+        Checksum of file contents or None if the file is missing
+            Only recalculated if the device, inode, size or modification time has changed
+            Outputs of @in_memory tasks are checksummed by value (See t_data_store)
+        """
+        if file_name in data_store:
+            return data_store.checksum(file_name)
+        file_stat = stat_cache.stat(file_name)
+        if file_stat == None:
+            return None
+        key = (file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime)
+
+        if file_name in self.file_checksums and self.file_checksums[file_name][0] == key:
+            return self.file_checksums[file_name][1]
+
+        with self.lock:
+            row = self.connection.execute("SELECT st_dev, st_ino, size, mtime, checksum "
+                                          "FROM file_checksums WHERE file_name = ?",
+                                          (file_name,)).fetchone()
+        if row != None and tuple(row[0:4]) == key:
+            checksum = row[4]
+        else:
+            checksum = calculate_checksum(file_name)
+            if time.time() - file_stat.st_mtime < self.racy_interval:
+                return checksum
+            with self.lock:
+                self.connection.execute("INSERT OR REPLACE INTO file_checksums "
+                                        "(file_name, st_dev, st_ino, size, mtime, checksum) "
+                                        "VALUES (?, ?, ?, ?, ?, ?)", (file_name,) + key + (checksum,))
+                self.count_uncommitted()
+        self.file_checksums[file_name] = (key, checksum)
+        return checksum
+
+    #_____________________________________________________________________________________
+
+    #   lookup
+
+    #_____________________________________________________________________________________
+    def lookup (self, file_names):
+        """
+        Returns dictionary of file name -> (job sequence, mtime) for files made by recorded jobs
+        """
+        records = dict()
+        query = "SELECT file_name, job_sequence, mtime FROM job_files WHERE file_name IN (%s)"
+        for file_name, job_sequence, mtime in self.select_by_file_names(query, file_names):
+            records[file_name] = (job_sequence, mtime)
+        return records
+
+    def select_by_file_names (self, query, file_names):
+        """
+        Run query with "IN (%s)" for batches of file (or task) names
+        """
+        file_names = list(set(file_names))
+        for start in range(0, len(file_names), self.max_lookup_batch):
+            batch = file_names[start:start + self.max_lookup_batch]
+            with self.lock:
+                rows = self.connection.execute(query % ",".join("?" * len(batch)), batch).fetchall()
+            for row in rows:
+                yield row
+
+
+#_________________________________________________________________________________________
+
+#   calculate_checksum
+
+#_________________________________________________________________________________________
+def calculate_checksum (file_name, block_size = 1 << 20):
+    """
+    md5 of file contents
+    """
+    checksum = hashlib.md5()
+    f = open(file_name, "rb")
+    try:
+        while 1:
+            block = f.read(block_size)
+            if not block:
+                break
+            checksum.update(block)
+    finally:
+        f.close()
+    return checksum.hexdigest()
+
+
+#
+#   opened by pipeline_run / pipeline_printout
+#
+job_history = t_job_history()
+
+#
+#   used if checksums are needed but no history file is specified
+#
+default_history_file_name = ".ruffus_history.sqlite"
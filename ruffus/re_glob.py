@@ -1,76 +1,183 @@
-"""Filename globbing utility."""
+"""Filename globbing utility.
+
+    Each component of the pathname (between separators) is either
+        a literal name,
+        a regular expression which must match the whole of a file or directory name, or
+        "**", which matches any number of nested directories, including none.
+        As the last component, "**" matches every file and directory beneath.
+
+    Names beginning with "." are only matched by patterns beginning with ".".
+"""
 
-import sys
 import os
 import re
+import stat
+from itertools import imap
+from multiprocessing.pool import ThreadPool
+
+#
+#   os.scandir (python 3.5) or the scandir module, if available, tell us which
+#       entries are directories without another system call for each
+#
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 __all__ = ["re_glob", "ire_glob"]
 
-def re_glob(pathname):
+def re_glob(pathname, threads = 0):
     """Return a list of paths matching a pathname pattern using regular expresions
 
+        threads: list sibling directories in this many threads at once
     """
-    return list(ire_glob(pathname))
+    return list(ire_glob(pathname, threads))
 
-def ire_glob(pathname):
+def ire_glob(pathname, threads = 0):
     """Return an iterator which yields the paths matching a pathname pattern using regular expresions
+
+        threads: list sibling directories in this many threads at once
     """
-    if not has_magic(pathname):
+    dirname, components = split_pattern(pathname)
+    if not components:
         if os.path.lexists(pathname):
             yield pathname
         return
-    dirname, basename = os.path.split(pathname)
-    if not dirname:
-        for name in re_glob1(os.curdir, basename):
-            yield name
-        return
-    if has_magic(dirname):
-        dirs = ire_glob(dirname)
-    else:
-        dirs = [dirname]
-    if has_magic(basename):
-        re_glob_in_dir = re_glob1
-    else:
-        re_glob_in_dir = re_glob0
-    for dirname in dirs:
-        for name in re_glob_in_dir(dirname, basename):
-            yield os.path.join(dirname, name)
-
-# These 2 helper functions non-recursively re_glob inside a literal directory.
-# They return a list of basenames. `re_glob1` accepts a pattern while `re_glob0`
-# takes a literal basename (so it only has to check for its existence).
-
-def re_glob1(dirname, pattern):
+
+    pool = ThreadPool(threads) if threads > 0 else None
+    try:
+        paths = [dirname]
+        for i, component in enumerate(components):
+            is_last = i == len(components) - 1
+            paths = match_component(paths, component, is_last, pool)
+            if not is_last:
+                paths = list(paths)
+        for path in paths:
+            yield path
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+def split_pattern(pathname):
+    """Split pathname into the leading directory without regular expressions
+    and a list of the remaining components
+    """
+    components = []
+    dirname = pathname
+    while has_magic(dirname):
+        dirname, basename = os.path.split(dirname)
+        components.append(basename)
+        if not dirname:
+            break
+    components.reverse()
+    return dirname, components
+
+# Helper functions which match one component of the pattern in each of a list of
+# directories, yielding paths. Only directories are kept except for the last component.
+
+def match_component(dirnames, component, is_last, pool):
+    if component == "**":
+        return match_recursive(dirnames, is_last, pool)
+    if not has_magic(component):
+        return match_literal(dirnames, component, is_last)
+    return match_regex(dirnames, component, is_last, pool)
+
+def match_literal(dirnames, basename, is_last):
+    for dirname in dirnames:
+        path = os.path.join(dirname, basename)
+        if basename == '':
+            # `os.path.split()` returns an empty basename for paths ending with a
+            # directory separator.  'q*x/' should match only directories.
+            if os.path.isdir(dirname):
+                yield path
+        elif os.path.lexists(path) if is_last else os.path.isdir(path):
+            yield path
+
+def match_regex(dirnames, pattern, is_last, pool):
+    # only where entire name is specified by regular expression
+    match = re.compile("(?:%s)\Z" % pattern).match
+    hidden = pattern[0] == '.'
+    map_func = pool.imap if pool else imap
+    for dirname, entries in zip(dirnames, map_func(list_dir, dirnames)):
+        for name, is_dir in entries:
+            if (name[0] != '.' or hidden) and match(name):
+                path = os.path.join(dirname, name)
+                if is_last or is_directory(path, is_dir):
+                    yield path
+
+def match_recursive(dirnames, is_last, pool):
+    """Each directory and the directories beneath it, parents first,
+    or, if is_last, all the files and directories beneath each directory.
+    Symbolic links to directories are not followed.
+    """
+    # list a whole level of the tree (i.e. siblings) at once
+    map_func = pool.imap if pool else imap
+    children = dict()
+    level = list(dirnames)
+    while level:
+        next_level = []
+        for dirname, entries in zip(level, map_func(list_dir_no_symlinks, level)):
+            paths = []
+            for name, is_dir in entries:
+                if name[0] == '.' or (is_dir == False and not is_last):
+                    continue
+                path = os.path.join(dirname, name)
+                is_dir = is_directory(path, is_dir, follow_symlinks = False)
+                if is_dir or is_last:
+                    paths.append((path, is_dir))
+                if is_dir:
+                    next_level.append(path)
+            children[dirname] = paths
+        level = next_level
+
+    for dirname in dirnames:
+        if not is_last:
+            yield dirname
+        stack = [iter(children[dirname])]
+        while stack:
+            for path, is_dir in stack[-1]:
+                if is_dir or is_last:
+                    yield path
+                if is_dir:
+                    stack.append(iter(children[path]))
+                    break
+            else:
+                stack.pop()
+
+def list_dir(dirname, follow_symlinks = True):
+    """List of (name, is_dir) for each entry in directory
+    is_dir is None if it is not known without another system call
+    """
+    # unicode patterns list unicode names
     if not dirname:
-        dirname = os.curdir
-    if isinstance(pattern, unicode) and not isinstance(dirname, unicode):
-        dirname = unicode(dirname, sys.getfilesystemencoding() or
-                                   sys.getdefaultencoding())
+        dirname = type(dirname)(os.curdir)
     try:
-        names = os.listdir(dirname)
+        if scandir != None:
+            return [(entry.name, entry.is_dir(follow_symlinks = follow_symlinks))
+                        for entry in scandir(dirname)]
+        # Entries are checked one by one (See is_directory): the link count of the
+        #   directory does not count its subdirectories on every file system
+        #   (e.g. FAT, ISO9660 or AFS)
+        return [(name, None) for name in os.listdir(dirname)]
     except os.error:
         return []
-    if pattern[0] != '.':
-        names = filter(lambda x: x[0] != '.', names)
-    
-    # only where entire name is specified by regular expression    
-    matching = []
-    for n in names:
-        m = re.match(pattern, n)
-        if m and m.end() == len(n):
-            matching.append(n)
-    return matching
-
-def re_glob0(dirname, basename):
-    if basename == '':
-        # `os.path.split()` returns an empty basename for paths ending with a
-        # directory separator.  'q*x/' should match only directories.
-        if os.path.isdir(dirname):
-            return [basename]
-    else:
-        if os.path.lexists(os.path.join(dirname, basename)):
-            return [basename]
-    return []
+
+def list_dir_no_symlinks(dirname):
+    return list_dir(dirname, follow_symlinks = False)
+
+def is_directory(path, is_dir, follow_symlinks = True):
+    if is_dir != None:
+        return is_dir
+    if follow_symlinks:
+        return os.path.isdir(path)
+    try:
+        return stat.S_ISDIR(os.lstat(path).st_mode)
+    except os.error:
+        return False
 
 
 magic_check = re.compile('[.*\\\^$?(){}[\]]')
@@ -97,6 +97,9 @@ class RethrownJobError(error_task):
         error_task.__init__(self)
         self.args = list(job_exceptions)
 
+        # names of jobs which were stopped, or never started, because of these exceptions
+        self.cancelled_jobs = []
+
     def __len__(self):
         return len(self.args)
 
@@ -123,6 +126,8 @@ class RethrownJobError(error_task):
         message = ["\nOriginal exception%s:\n" % ("s" if len(self.args) > 1 else "")]
         for ii in range(len(self.args)):
             message += self.get_nth_exception_str (ii)
+        if len(self.cancelled_jobs):
+            message += ["\nCancelled jobs:\n"] + ["    %s\n" % job_name for job_name in self.cancelled_jobs]
         #
         #   For each exception:
         #       turn original exception stack message into an indented string
@@ -143,6 +148,21 @@ class PostTaskArgumentError(error_task):
 class JobsLimitArgumentError(error_task):
     pass
 
+class PriorityArgumentError(error_task):
+    pass
+
+class ResourcesArgumentError(error_task):
+    pass
+
+class RetryArgumentError(error_task):
+    pass
+
+class SpeculativeArgumentError(error_task):
+    pass
+
+class InMemoryArgumentError(error_task):
+    pass
+
 class error_task_get_output(error_task_contruction):
     pass
 class error_task_transform_inputs_multiple_args(error_task_contruction):
@@ -223,6 +223,21 @@ def get_strings_in_nested_sequence (p, first_only = False):
 
 #_________________________________________________________________________________________
 
+#   replace_strings_in_nested_sequence
+
+#_________________________________________________________________________________________
+def replace_strings_in_nested_sequence (p, replace_func):
+    """
+    Copy of nested sequence with each string s replaced by replace_func(s)
+    """
+    if isinstance(p, basestring):
+        return replace_func(p)
+    if non_str_sequence (p):
+        return type(p)(replace_strings_in_nested_sequence(pp, replace_func) for pp in p)
+    return p
+
+#_________________________________________________________________________________________
+
 #   get_first_string_in_nested_sequence
 
 #_________________________________________________________________________________________
@@ -275,6 +290,63 @@ def shorten_filenames_encoder (obj):
 
 
 
+#_________________________________________________________________________________________
+#
+#   t_lazy_str
+#
+#________________________________________________________________________________________
+class t_lazy_str(object):
+    """
+    String which is only made (by calling func(*args)) when needed
+        e.g. messages which are only used if logged
+
+        Made at most once
+    """
+    def __init__ (self, func, *args):
+        self.func   = func
+        self.args   = args
+        self.value  = None
+
+    def __str__ (self):
+        if self.func != None:
+            self.value = self.func(*self.args)
+            self.func = self.args = None
+        return self.value
+
+    def __repr__ (self):
+        return repr(str(self))
+
+    #
+    #   otherwise behaves like the string
+    #
+    def __getattr__ (self, attr):
+        if attr in ("func", "args", "value"):
+            raise AttributeError(attr)
+        return getattr(str(self), attr)
+
+    def __len__ (self):
+        return len(str(self))
+
+    def __contains__ (self, sub):
+        return sub in str(self)
+
+    def __eq__ (self, other):
+        return str(self) == other
+
+    def __ne__ (self, other):
+        return str(self) != other
+
+    def __hash__ (self):
+        return hash(str(self))
+
+    def __add__ (self, other):
+        return str(self) + other
+
+    def __radd__ (self, other):
+        return other + str(self)
+
+
+
 #
 #_________________________________________________________________________________________
 #
@@ -90,13 +90,20 @@ import logging
 import re
 from collections import defaultdict
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import threading
 import traceback
 import types
-from itertools import imap
+import itertools
+from executors import t_executor, t_serial_executor, t_pool_executor, t_claim_executor, t_speculative_executor
+from executors import start_process_group, cancel_grace_seconds
 import textwrap
 import time
-from multiprocessing.managers import SyncManager
 from contextlib import contextmanager
+import heapq
+import subprocess
+import hashlib
+import functools
 
 
 if __name__ == '__main__':
@@ -108,6 +115,9 @@ from print_dependencies import *
 from ruffus_exceptions import  *
 from ruffus_utility import *
 from file_name_parameters import  *
+from file_cache import stat_cache, glob_cache
+from job_history import job_history, default_history_file_name
+from data_store import data_store
 
 
 #
@@ -121,6 +131,8 @@ except ImportError:
 dumps = json.dumps
 
 import Queue
+PriorityQueue = Queue.PriorityQueue
+QueueEmpty = Queue.Empty
 Queue = Queue.Queue
 
 
@@ -183,21 +195,25 @@ black_hole_logger = t_black_hole_logger()
 stderr_logger     = t_stderr_logger()
 
 class t_verbose_logger:
-    def __init__ (self, verbose, logger, runtime_data):
+    def __init__ (self, verbose, logger, runtime_data, uptodate_checker = None):
         self.verbose = verbose
         self.logger = logger
         self.runtime_data = runtime_data
+        self.uptodate_checker = uptodate_checker
 
 #_________________________________________________________________________________________
 #
 #   logging helper function
 #
 #________________________________________________________________________________________
-def log_at_level (logger, message_level, verbose_level, msg):
+def log_at_level (logger, message_level, verbose_level, msg, *args):
     """
     writes to log if message_level > verbose level
+        msg is only formatted with any args if it is written
     """
     if message_level <= verbose_level:
+        if len(args):
+            msg = msg % args
         logger.info(msg)
 
 
@@ -228,8 +244,26 @@ class waiting_for_more_tasks_to_complete:
 #
 # synchronisation data
 #
-#SyncManager()
-#syncmanager.start()
+#   Semaphores for tasks limited by @jobs_limit, looked up by semaphore name
+#       Set in each pool process when it starts (see init_job_limit_semaphores)
+#       so that jobs only need to carry the name of their semaphore
+#
+job_limit_semaphores_by_name = dict()
+
+def init_job_limit_semaphores (job_limit_semaphores):
+    """
+    Pool initializer
+    """
+    job_limit_semaphores_by_name.clear()
+    job_limit_semaphores_by_name.update(job_limit_semaphores)
+
+def init_pool_process (job_limit_semaphores):
+    """
+    Pool initializer for processes which can be stopped, with the programs
+        their jobs are running, when the pipeline is cancelled (See t_pool_executor)
+    """
+    start_process_group()
+    init_job_limit_semaphores(job_limit_semaphores)
 
 #
 # do nothing semaphore
@@ -259,11 +293,12 @@ class task_decorator(object):
         Adds task to the "pipeline_task" attribute of this function but
         otherwise leaves function untouched
     """
-    def __init__(self, *decoratorArgs):
+    def __init__(self, *decoratorArgs, **decoratorKwargs):
         """
             saves decorator arguments
         """
         self.args = decoratorArgs
+        self.kwargs = decoratorKwargs
 
     def __call__(self, func):
         """
@@ -279,7 +314,7 @@ class task_decorator(object):
         #   where "task_decorator" is the name of this class
         decorator_function_name = "task_" + self.__class__.__name__
         task_decorator_function = getattr(func.pipeline_task, decorator_function_name)
-        task_decorator_function(self.args)
+        task_decorator_function(self.args, **self.kwargs)
 
         #
         #   don't change the function so we can call it unaltered
@@ -317,6 +352,21 @@ class posttask(task_decorator):
 class jobs_limit(task_decorator):
     pass
 
+class priority(task_decorator):
+    pass
+
+class resources(task_decorator):
+    pass
+
+class retry(task_decorator):
+    pass
+
+class speculative(task_decorator):
+    pass
+
+class in_memory(task_decorator):
+    pass
+
 
 #
 #   Advanced
@@ -451,6 +501,32 @@ def mkdir_job_descriptor (param, runtime_data):
     return m, [m]
 
 
+#_________________________________________________________________________________________
+
+#   t_job_name
+
+#_________________________________________________________________________________________
+def job_name_from_descriptor (job_descriptor, descriptive_param, runtime_data):
+    return job_descriptor(descriptive_param, runtime_data)[0]
+
+class t_job_name(t_lazy_str):
+    """
+    Job name which is only made by the job descriptor when it is used, e.g. logged
+
+        Sent to job processes unformatted
+    """
+    def __init__ (self, job_descriptor, descriptive_param, runtime_data):
+        t_lazy_str.__init__(self, job_name_from_descriptor, job_descriptor,
+                            descriptive_param, runtime_data)
+
+    def __reduce__ (self):
+        if self.func == None:
+            return (str, (self.value,))
+        # runtime_data is not (yet) used by job descriptors, and may not pickle
+        job_descriptor, descriptive_param, runtime_data = self.args
+        return (t_job_name, (job_descriptor, descriptive_param, {}))
+
+
 #8888888888888888888888888888888888888888888888888888888888888888888888888888888888888
 
 #       job wrappers
@@ -482,6 +558,7 @@ def job_wrapper_io_files(param, user_defined_work_func, register_cleanup, touch_
 
     i,o = param[0:2]
 
+    ret_val = None
     if not touch_files_only:
         ret_val = user_defined_work_func(*param)
     else:
@@ -499,6 +576,39 @@ def job_wrapper_io_files(param, user_defined_work_func, register_cleanup, touch_
     for f in get_strings_in_nested_sequence(o):
         register_cleanup(f, "file")
 
+    #
+    #   coroutines (generator task functions) are run by the caller
+    #
+    return ret_val
+
+
+#_________________________________________________________________________________________
+
+#   job wrapper for @in_memory tasks
+
+#_________________________________________________________________________________________
+def job_wrapper_in_memory(param, user_defined_work_func, register_cleanup, touch_files_only):
+    """
+    run func, returning a list of values, one for each output name
+        Nothing is written, so there is nothing to clean up
+    """
+    assert(user_defined_work_func)
+
+    output_names = get_strings_in_nested_sequence(param[1]) if len(param) >= 2 else []
+    if touch_files_only:
+        return [None] * len(output_names)
+
+    ret_val = user_defined_work_func(*param)
+    if isinstance(ret_val, types.GeneratorType):
+        raise InMemoryArgumentError("@in_memory task functions must return their values, "
+                                    "not be generators")
+    if len(output_names) == 1:
+        return [ret_val]
+    if not isinstance(ret_val, (list, tuple)) or len(ret_val) != len(output_names):
+        raise InMemoryArgumentError("@in_memory job with outputs [%s] should return a list "
+                                    "with a value for each" % ", ".join(output_names))
+    return list(ret_val)
+
 
 #_________________________________________________________________________________________
 
@@ -533,6 +643,27 @@ def job_wrapper_mkdir(param, user_defined_work_func, register_cleanup, touch_fil
         #    if "File exists" not in e:
         #        raise
 
+#_________________________________________________________________________________________
+
+#   job wrapper for inputs which other shards did not make in time
+
+#_________________________________________________________________________________________
+#
+#   Jobs wait in the main process for the input files made by other shards
+#       (See pipeline_run(shard = ...)), checking every shard_poll_interval seconds,
+#       for up to shard_wait_seconds
+#
+shard_poll_interval = 1.0
+shard_wait_seconds  = 24 * 60 * 60.0
+def job_wrapper_inputs_not_made(input_files, wait_seconds, job_wrapper, param,
+                                user_defined_work_func, register_cleanup, touch_files_only):
+    """
+    fail the job whose input files were not made by other shards within wait_seconds
+    """
+    raise MissingInputFileError("No way to run job: Input files [%s] were not made by "
+                                "other shards within %g seconds" %
+                                (", ".join(input_files), wait_seconds))
+
 
 JOB_ERROR           = 0
 JOB_SIGNALLED_BREAK = 1
@@ -544,38 +675,41 @@ JOB_COMPLETED       = 3
 #   t_job_result
 #       Previously a collections.namedtuple (introduced in python 2.6)
 #       Now using implementation from running
-#           t_job_result = namedtuple('t_job_result', 'task_name state job_name return_value exception', verbose =1)
+#           t_job_result = namedtuple('t_job_result', 'task_name state job_name return_value exception job_index', verbose =1)
 #           for compatibility with python 2.5
+#
+#       job_index identifies the job in the main process (see jobs_in_flight in pipeline_run)
+#       duration is how many seconds a completed job took (see job_history.record_job_duration)
 
 #_________________________________________________________________________________________
 class t_job_result(tuple):
-        't_job_result(task_name, state, job_name, return_value, exception)'
+        't_job_result(task_name, state, job_name, return_value, exception, job_index, duration)'
 
         __slots__ = ()
 
-        fields = ('task_name', 'state', 'job_name', 'return_value', 'exception')
+        fields = ('task_name', 'state', 'job_name', 'return_value', 'exception', 'job_index', 'duration')
 
-        def __new__(cls, task_name, state, job_name, return_value, exception):
-            return tuple.__new__(cls, (task_name, state, job_name, return_value, exception))
+        def __new__(cls, task_name, state, job_name, return_value, exception, job_index, duration = None):
+            return tuple.__new__(cls, (task_name, state, job_name, return_value, exception, job_index, duration))
 
         @classmethod
         def make(cls, iterable, new=tuple.__new__, len=len):
             'Make a new t_job_result object from a sequence or iterable'
             result = new(cls, iterable)
-            if len(result) != 5:
-                raise TypeError('Expected 5 arguments, got %d' % len(result))
+            if len(result) != 7:
+                raise TypeError('Expected 7 arguments, got %d' % len(result))
             return result
 
         def __repr__(self):
-            return 't_job_result(task_name=%r, state=%r, job_name=%r, return_value=%r, exception=%r)' % self
+            return 't_job_result(task_name=%r, state=%r, job_name=%r, return_value=%r, exception=%r, job_index=%r, duration=%r)' % self
 
         def asdict(t):
             'Return a new dict which maps field names to their values'
-            return {'task_name': t[0], 'state': t[1], 'job_name': t[2], 'return_value': t[3], 'exception': t[4]}
+            return {'task_name': t[0], 'state': t[1], 'job_name': t[2], 'return_value': t[3], 'exception': t[4], 'job_index': t[5], 'duration': t[6]}
 
         def replace(self, **kwds):
             'Return a new t_job_result object replacing specified fields with new values'
-            result = self.make(map(kwds.pop, ('task_name', 'state', 'job_name', 'return_value', 'exception'), self))
+            result = self.make(map(kwds.pop, ('task_name', 'state', 'job_name', 'return_value', 'exception', 'job_index', 'duration'), self))
             if kwds:
                 raise ValueError('Got unexpected field names: %r' % kwds.keys())
             return result
@@ -588,6 +722,8 @@ class t_job_result(tuple):
         job_name    = property(itemgetter(2))
         return_value= property(itemgetter(3))
         exception   = property(itemgetter(4))
+        job_index   = property(itemgetter(5))
+        duration    = property(itemgetter(6))
 
 
 
@@ -606,21 +742,27 @@ def run_pooled_job_without_exceptions (process_parameters):
     """
 
     (param, task_name, job_name, job_wrapper, user_defined_work_func,
-            job_limit_semaphore, one_second_per_job, touch_files_only) = process_parameters
+            semaphore_name, one_second_per_job, touch_files_only, job_index) = process_parameters
 
-    if job_limit_semaphore == None:
+    if semaphore_name == None:
         job_limit_semaphore = do_nothing_semaphore()
+    else:
+        job_limit_semaphore = job_limit_semaphores_by_name[semaphore_name]
 
     try:
         with job_limit_semaphore:
+            start_time = time.time()
             return_value =  job_wrapper(param, user_defined_work_func, register_cleanup, touch_files_only)
 
             #
-            #   ensure one second between jobs
+            #   task functions which are coroutines are run to completion here
+            #       See run_cooperative_job to run many at the same time
             #
-            #if one_second_per_job:
-            #    time.sleep(1.01)
-            return t_job_result(task_name, JOB_COMPLETED, job_name, return_value, None)
+            if isinstance(return_value, types.GeneratorType):
+                return_value = run_coroutine_to_completion(return_value)
+
+            return t_job_result(task_name, JOB_COMPLETED, job_name, return_value, None, job_index,
+                                time.time() - start_time)
     except:
         #   Wrap up one or more exceptions rethrown across process boundaries
         #
@@ -638,10 +780,334 @@ def run_pooled_job_without_exceptions (process_parameters):
             job_state = JOB_ERROR
         return t_job_result(task_name, JOB_ERROR, job_name, None,
                             [task_name,
-                             job_name,
+                             str(job_name),
+                             exception_name,
+                             exception_value,
+                             exception_stack],
+                            job_index)
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Coroutines
+
+#       Task functions can be generators which yield whatever they are waiting for:
+#
+#           @transform(...)
+#           def compress (input_file, output_file):
+#               return_code = yield subprocess.Popen(["gzip", "-c", input_file],
+#                                                    stdout = open(output_file, "w"))
+#
+#       They are resumed with
+#           1) for subprocess.Popen or any other object with a poll() method:
+#              the result of poll() as soon as it is not None
+#           2) for a number: None after that many seconds
+#           3) for None: None after other jobs have had a turn
+#
+#       With pipeline_run(..., executor = "coroutines"), thousands of these jobs
+#           are run at the same time in a single thread (see t_coroutine_pool).
+#       Otherwise, each job waits in its own process or thread.
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+class t_timeout(object):
+    """
+    Waitable which is ready after a number of seconds
+    """
+    def __init__ (self, seconds):
+        self.ready_time = time.time() + seconds
+
+    def poll (self):
+        if time.time() >= self.ready_time:
+            return True
+        return None
+
+class t_semaphore_acquired(object):
+    """
+    Waitable which is ready once the (non-blocking) semaphore has been acquired
+    """
+    def __init__ (self, semaphore):
+        self.semaphore = semaphore
+
+    def poll (self):
+        if self.semaphore.acquire(False):
+            return True
+        return None
+
+class t_yield_turn(object):
+    """
+    Waitable which is ready at once, so that other jobs get a turn first
+    """
+    def poll (self):
+        return True
+
+def make_waitable (waiting_for):
+    """
+    What a coroutine task function yielded => object with poll()
+        poll() returns None until ready
+    """
+    if waiting_for == None:
+        return t_yield_turn()
+    if isinstance(waiting_for, (int, long, float)):
+        return t_timeout(waiting_for)
+    if hasattr(waiting_for, "poll"):
+        return waiting_for
+    raise error_task("Coroutine task functions should yield objects with a poll() method "
+                        "(e.g. subprocess.Popen), a number of seconds or None, not %s" %
+                        repr(waiting_for))
+
+def run_coroutine_to_completion (coroutine, poll_interval = 0.01):
+    """
+    Run coroutine task function, waiting in turn for each object it yields
+    """
+    value = None
+    while 1:
+        try:
+            waitable = make_waitable(coroutine.send(value))
+        except StopIteration:
+            return None
+        value = waitable.poll()
+        while value == None:
+            time.sleep(poll_interval)
+            value = waitable.poll()
+
+
+#_________________________________________________________________________________________
+
+#   run_cooperative_job
+
+#_________________________________________________________________________________________
+def run_cooperative_job (process_parameters):
+    """
+    Generator which runs a job alongside other jobs in the same thread
+        Yields the waitables the job is waiting for (see make_waitable)
+        and finally the t_job_result
+
+    Counterpart of run_pooled_job_without_exceptions for t_coroutine_pool
+    """
+
+    (param, task_name, job_name, job_wrapper, user_defined_work_func,
+            semaphore_name, one_second_per_job, touch_files_only, job_index) = process_parameters
+
+    job_limit_semaphore = None
+    if semaphore_name != None:
+        job_limit_semaphore = job_limit_semaphores_by_name[semaphore_name]
+
+    try:
+        if job_limit_semaphore != None:
+            yield t_semaphore_acquired(job_limit_semaphore)
+        try:
+            start_time = time.time()
+            return_value =  job_wrapper(param, user_defined_work_func, register_cleanup, touch_files_only)
+            if isinstance(return_value, types.GeneratorType):
+                coroutine = return_value
+                return_value = None
+                value = None
+                while 1:
+                    try:
+                        waiting_for = coroutine.send(value)
+                    except StopIteration:
+                        break
+                    value = yield make_waitable(waiting_for)
+        finally:
+            if job_limit_semaphore != None:
+                job_limit_semaphore.release()
+
+        result = t_job_result(task_name, JOB_COMPLETED, job_name, return_value, None, job_index,
+                              time.time() - start_time)
+    except GeneratorExit:
+        # cancelled (See t_coroutine_pool.terminate)
+        raise
+    except:
+        exceptionType, exceptionValue, exceptionTraceback = sys.exc_info()
+        exception_stack  = traceback.format_exc(exceptionTraceback)
+        exception_name   = exceptionType.__module__ + '.' + exceptionType.__name__
+        exception_value  = str(exceptionValue)
+        if len(exception_value):
+            exception_value = "(%s)" % exception_value
+        result = t_job_result(task_name, JOB_ERROR, job_name, None,
+                            [task_name,
+                             str(job_name),
                              exception_name,
                              exception_value,
-                             exception_stack])
+                             exception_stack],
+                            job_index)
+    yield result
+
+
+#_________________________________________________________________________________________
+
+#   t_coroutine_pool
+
+#_________________________________________________________________________________________
+class t_coroutine_pool(object):
+    """
+    Runs jobs cooperatively in a single thread
+        Used in place of a process pool: imap_unordered() takes
+            run_cooperative_job and the job parameters, and returns job results
+            in the order in which the jobs complete.
+
+        Any job which is queued (see t_job_dispatcher) is started at once.
+        The number of concurrent jobs is therefore limited by
+            the number of jobs in flight.
+
+        When all jobs are waiting, sleeps between polls,
+            for up to max_poll_interval seconds
+
+        terminate() stops the jobs, and any subprocesses they are waiting for
+    """
+    def __init__ (self, has_queued_jobs, max_poll_interval = 0.05):
+        self.has_queued_jobs    = has_queued_jobs
+        self.max_poll_interval  = max_poll_interval
+
+        # jobs which can run: (job, value to send)
+        self.running_jobs       = collections.deque()
+        # jobs which are waiting: (job, waitable)
+        self.waiting_jobs       = []
+
+    def terminate (self):
+        """
+        Subprocesses have cancel_grace_seconds to finish after SIGTERM, before SIGKILL
+        """
+        subprocesses = [waitable for job, waitable in self.waiting_jobs
+                            if isinstance(waitable, subprocess.Popen)]
+        for process in subprocesses:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+        end_time = time.time() + cancel_grace_seconds
+        while (time.time() < end_time and
+               any(process.poll() == None for process in subprocesses)):
+            time.sleep(0.05)
+        for process in subprocesses:
+            if process.poll() == None:
+                process.kill()
+                process.wait()
+        for job, value in list(self.running_jobs) + self.waiting_jobs:
+            job.close()
+        self.running_jobs.clear()
+        self.waiting_jobs = []
+
+    def imap_unordered (self, func, iterable):
+        iterable = iter(iterable)
+
+        running_jobs = self.running_jobs
+        all_jobs_started = False
+        poll_interval = 0.0
+
+        while 1:
+            #
+            #   start jobs:
+            #       only block for more jobs when there is nothing else to do
+            #
+            while (not all_jobs_started and
+                   (self.has_queued_jobs() or not (running_jobs or self.waiting_jobs))):
+                try:
+                    running_jobs.append((func(iterable.next()), None))
+                except StopIteration:
+                    all_jobs_started = True
+
+            if not (running_jobs or self.waiting_jobs):
+                break
+
+            #
+            #   jobs which have finished waiting can run again
+            #
+            still_waiting_jobs = []
+            for job, waitable in self.waiting_jobs:
+                value = waitable.poll()
+                if value == None:
+                    still_waiting_jobs.append((job, waitable))
+                else:
+                    running_jobs.append((job, value))
+            self.waiting_jobs = still_waiting_jobs
+
+            if not running_jobs:
+                poll_interval = min(max(poll_interval * 2, 0.001), self.max_poll_interval)
+                time.sleep(poll_interval)
+                continue
+            poll_interval = 0.0
+
+            #
+            #   run each job until it next waits
+            #
+            for i in range(len(running_jobs)):
+                job, value = running_jobs.popleft()
+                waitable = job.send(value)
+                if isinstance(waitable, t_job_result):
+                    yield waitable
+                else:
+                    self.waiting_jobs.append((job, waitable))
+
+
+
+#_________________________________________________________________________________________
+
+#   t_uptodate_checker
+
+#_________________________________________________________________________________________
+class t_uptodate_checker(object):
+    """
+    Checks whether jobs need updating, i.e. calls needs_update_func(*param) for each job
+
+        With num_threads > 0, checks are made concurrently in a pool of threads
+            so that file system round trips (e.g. on NFS) overlap.
+
+        Jobs are checked in batches, one batch ahead of the results being consumed,
+            so that callers can stop early (e.g. at the first out of date job)
+            without checking every job.
+            Batches start at one job per thread, so that the first result
+            is available quickly, and double up to max_batch_size.
+    """
+    def __init__ (self, num_threads = 0, max_batch_size = 1024):
+        self.num_threads    = num_threads
+        self.max_batch_size = max(max_batch_size, num_threads)
+        self.pool           = ThreadPool(num_threads) if num_threads > 0 else None
+
+    def close (self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def check (self, needs_update_func, parameters):
+        """
+        Yields (param, descriptive_param, needs_update, msg) for each job, in order
+        """
+        if self.pool == None:
+            for param, descriptive_param in parameters:
+                needs_update, msg = needs_update_func (*param)
+                yield param, descriptive_param, needs_update, msg
+            return
+
+        def check_job (param):
+            return needs_update_func (*param)
+
+        parameters = iter(parameters)
+        batch_size = self.num_threads
+        pending_batch = None
+        pending_results = None
+        while 1:
+            batch = list(itertools.islice(parameters, batch_size))
+            batch_size = min(batch_size * 2, self.max_batch_size)
+
+            #
+            #   start checking next batch before returning results for the last
+            #
+            if len(batch):
+                results = self.pool.map_async(check_job, [param for param, descriptive_param in batch])
+            if pending_batch:
+                for (param, descriptive_param), (needs_update, msg) in zip(pending_batch, pending_results.get()):
+                    yield param, descriptive_param, needs_update, msg
+            if not len(batch):
+                break
+            pending_batch, pending_results = batch, results
+
+#
+#   used when none is specified
+#
+serial_uptodate_checker = t_uptodate_checker()
 
 
 
@@ -652,6 +1118,20 @@ def run_pooled_job_without_exceptions (process_parameters):
 #88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
 
 
+#_________________________________________________________________________________________
+
+#   needs_update_func_from_batch
+
+#_________________________________________________________________________________________
+def needs_update_func_from_batch (batch_func):
+    """
+    Check a single job with a @check_if_uptodate(batch = ...) function
+        e.g. when a job is started as soon as its upstream job completes
+    """
+    def needs_update_func (*param):
+        return batch_func([param])[0]
+    return needs_update_func
+
 #_________________________________________________________________________________________
 
 #   register_cleanup
@@ -776,6 +1256,8 @@ class _task (node):
 
         self.param_generator_func       = None
         self.needs_update_func          = None
+        # @check_if_uptodate(batch = ...): checks all jobs of the task at once
+        self.needs_update_batch_func    = None
         self.job_wrapper                = job_wrapper_generic
 
         #
@@ -802,14 +1284,42 @@ class _task (node):
         # cache output file names here
         self.output_filenames           = None
 
+        # cache parameters for all jobs here (see get_job_plan)
+        self.job_plan                   = None
+
+        # whether job parameters depend on which files exist,
+        #   i.e. inputs are globs or come from a custom function
+        self.volatile_job_plan          = False
+
         self.semaphore_name             = module_name + "." + func_name
 
+        # jobs of tasks with higher @priority are started first
+        self.priority                   = 0
+
+        # amounts of named resources each job needs (See @resources and get_job_resources)
+        self.resources                  = None
+
+        # how failed jobs are run again (See @retry and t_retry_policy)
+        self.retry_policy               = None
+
+        # second copies of jobs taking this many times longer than usual (See @speculative)
+        self.speculate_after            = None
+
+        # job return values are kept by output name instead of writing files (See @in_memory)
+        self.in_memory                  = False
+
         # do not test for whether task is active
         self.active_if_checks           = None
 
         # extra flag for outputfiles
         self.is_active                  = True
 
+        # @transform: makes the parameters of the job for a single input
+        #   and the tasks whose outputs each provide one such input
+        #   Used to start jobs as soon as their upstream job has completed
+        self.single_input_param_func    = None
+        self.single_input_tasks         = []
+
 
 
     #_________________________________________________________________________________________
@@ -835,6 +1345,81 @@ class _task (node):
         # cache output file names here
         self.output_filenames = None
 
+        # cache job parameters here
+        self.job_plan = None
+
+    #_________________________________________________________________________________________
+
+    #   get_job_plan
+
+    #_________________________________________________________________________________________
+    def get_job_plan (self, runtime_data):
+        """
+        Returns list of (param, descriptive_param) for each job
+
+        Parameters are needed to check if this task is up to date, for the input of
+            downstream tasks, and to run the jobs. They are only generated
+            (with all the globbing and regular expression substitution) once per
+            pipeline run, unless invalidated by upstream tasks completing
+            (See invalidate_job_plans)
+        """
+        if self.job_plan == None:
+            self.job_plan = list(self.param_generator_func(runtime_data))
+        return self.job_plan
+
+    #_________________________________________________________________________________________
+
+    #   check_jobs_uptodate
+
+    #_________________________________________________________________________________________
+    def check_jobs_uptodate (self, uptodate_checker, parameters):
+        """
+        Yields (param, descriptive_param, needs_update, msg) for each job, in order
+
+            @check_if_uptodate(batch = ...) functions are called once for all jobs,
+            otherwise needs_update_func is called for each job (See t_uptodate_checker)
+        """
+        if self.needs_update_batch_func == None:
+            for result in uptodate_checker.check(self.needs_update_func, parameters):
+                yield result
+            return
+
+        parameters = list(parameters)
+        results = list(self.needs_update_batch_func([param for param, descriptive_param in parameters]))
+        if len(results) != len(parameters):
+            raise error_task("@check_if_uptodate(batch = %s) returned %d results for %d jobs in %s" %
+                             (self.needs_update_batch_func.__name__, len(results),
+                              len(parameters), self._name))
+        for (param, descriptive_param), (needs_update, msg) in zip(parameters, results):
+            yield param, descriptive_param, needs_update, msg
+
+    #_________________________________________________________________________________________
+
+    #   invalidate_job_plans
+
+    #_________________________________________________________________________________________
+    def invalidate_job_plans (self):
+        """
+        Forget job parameters which may have changed now that this task has completed:
+            1) This task, if its output was not known until it ran (@split)
+            2) Downstream tasks whose job parameters depend on which files exist
+            3) Anything downstream of these
+        """
+        if self.indeterminate_output:
+            self.job_plan = None
+
+        # tasks already visited with / without upstream changes
+        visited = (set(), set())
+        stack = [(child, self.indeterminate_output != 0) for child in self._inward]
+        while stack:
+            t, upstream_changed = stack.pop()
+            changed = upstream_changed or t.volatile_job_plan
+            if t in visited[changed] or t in visited[True]:
+                continue
+            visited[changed].add(t)
+            if changed:
+                t.job_plan = None
+            stack.extend((child, changed) for child in t._inward)
 
     #_________________________________________________________________________________________
 
@@ -875,6 +1460,12 @@ class _task (node):
         """
         return self.job_descriptor(descriptive_param, runtime_data)[0]
 
+    def get_lazy_job_name(self, descriptive_param, runtime_data):
+        """
+        Job name which is only made when it is used (See t_job_name)
+        """
+        return t_job_name(self.job_descriptor, descriptive_param, runtime_data)
+
 
     #_________________________________________________________________________________________
 
@@ -989,8 +1580,14 @@ class _task (node):
             #
             #   return messages description per job
             #
+            if self.needs_update_func:
+                checked_jobs = self.check_jobs_uptodate(serial_uptodate_checker,
+                                                        self.get_job_plan(runtime_data))
+            else:
+                checked_jobs = ((param, descriptive_param, True, "")
+                                    for param, descriptive_param in self.get_job_plan(runtime_data))
             cnt_jobs = 0
-            for param, descriptive_param in self.param_generator_func(runtime_data):
+            for param, descriptive_param, needs_update, msg in checked_jobs:
                 cnt_jobs += 1
 
                 #
@@ -1001,7 +1598,6 @@ class _task (node):
                     messages.append(indent_str + "  Jobs needs update: No function to check if up-to-date or not")
                     continue
 
-                needs_update, msg = self.needs_update_func (*param)
                 if needs_update:
                     messages.extend(get_job_names (descriptive_param, indent_str))
                     per_job_messages = [(indent_str + s) for s in ("  Job needs update: %s" % msg).split("\n")]
@@ -1037,10 +1633,12 @@ class _task (node):
                 logger       = verbose_logger.logger
                 verbose      = verbose_logger.verbose
                 runtime_data = verbose_logger.runtime_data
+                uptodate_checker = verbose_logger.uptodate_checker or serial_uptodate_checker
             else:
                 logger       = None
                 verbose      = 0
                 runtime_data = {}
+                uptodate_checker = serial_uptodate_checker
             log_at_level (logger, 4, verbose,
                             "  Task = " + self.get_task_name())
 
@@ -1078,8 +1676,9 @@ class _task (node):
                 #
                 #   return not up to date if ANY jobs needs update
                 #
-                for param, descriptive_param in self.param_generator_func(runtime_data):
-                    needs_update, msg = self.needs_update_func (*param)
+                for (param, descriptive_param,
+                     needs_update, msg) in self.check_jobs_uptodate(uptodate_checker,
+                                                                    self.get_job_plan(runtime_data)):
                     if needs_update:
                         if verbose >= 4:
                             job_name = self.get_job_name(descriptive_param, runtime_data)
@@ -1179,7 +1778,7 @@ class _task (node):
             if self.param_generator_func != None:
 
                 cnt_jobs = 0
-                for param, descriptive_param in self.param_generator_func(runtime_data):
+                for param, descriptive_param in self.get_job_plan(runtime_data):
                     cnt_jobs += 1
                     # skip tasks which don't have output parameters
                     if len(param) >= 2:
@@ -1289,6 +1888,7 @@ class _task (node):
         #
         if self.indeterminate_output:
             self.output_filenames = None
+        self.invalidate_job_plans()
 
 
 
@@ -1322,6 +1922,12 @@ class _task (node):
         functions_to_tasks = dict(zip(function_or_func_names, tasks))
         input_params = replace_func_names_with_tasks(input_params, functions_to_tasks)
 
+        #
+        #   which files match globs may change as the pipeline runs
+        #
+        if len(globs):
+            self.volatile_job_plan = True
+
         return t_params_tasks_globs_run_time_data(input_params, tasks, globs, runtime_data_names)
 
 
@@ -1577,6 +2183,21 @@ class _task (node):
         self.job_descriptor       = io_files_job_descriptor
         self.single_multi_io      = self.many_to_many
 
+        #
+        #   Each output of these tasks is one input for this task
+        #       i.e. @transform(task_a, ...) or @transform([task_a, task_b, "a.file"], ...)
+        #
+        input_params = input_files_task_globs.params
+        if isinstance(input_params, _task):
+            input_params = [input_params]
+        if isinstance(input_params, (list, tuple)):
+            self.single_input_tasks = [p for p in input_params if isinstance(p, _task)]
+        self.single_input_param_func = transform_single_input_param_factory (matching_regex,
+                                                                            regex_or_suffix,
+                                                                            extra_inputs,
+                                                                            replace_inputs,
+                                                                            *output_pattern_extras)
+
     #_________________________________________________________________________________________
 
     #   task_collate
@@ -1706,6 +2327,7 @@ class _task (node):
         if len(orig_args) == 1 and isinstance(orig_args[0], collections.Callable):
         #if len(orig_args) == 1 and type(orig_args[0]) == types.FunctionType:
             self.param_generator_func = orig_args[0]
+            self.volatile_job_plan = True
 
         # list of  params
         else:
@@ -1751,6 +2373,7 @@ class _task (node):
 
             self.set_action_type (_task.action_task_files_func)
             self.param_generator_func = files_custom_generator_param_factory(orig_args[0])
+            self.volatile_job_plan = True
 
             # assume
             self.single_multi_io           = self.many_to_many
@@ -2020,11 +2643,23 @@ class _task (node):
     #   task_check_if_uptodate
 
     #_________________________________________________________________________________________
-    def task_check_if_uptodate (self, args):
+    def task_check_if_uptodate (self, args, batch = None):
         """
         Saved decorator arguments should be:
                 a function which takes the appropriate number of arguments for each job
+            or
+                batch = a function which takes a list of the parameters of all jobs
+                        and returns a list of (needs_update, msg) for each job
         """
+        if batch != None:
+            if len(args) or not isinstance(batch, collections.Callable):
+                raise error_decorator_args("Expecting either a single function or batch = function in  " +
+                                                    "@task_check_if_uptodate %s:\n[%s]" %
+                                                    (self._name, str(args)))
+            self.needs_update_batch_func  = batch
+            self.needs_update_func        = needs_update_func_from_batch(batch)
+            return
+
         if len(args) != 1 or not isinstance(args[0], collections.Callable):
         #if len(args) != 1 or type(args[0]) != types.FunctionType:
             raise error_decorator_args("Expecting a single function in  " +
@@ -2092,43 +2727,152 @@ class _task (node):
 
     #_________________________________________________________________________________________
 
-    #   task_active_if
+    #   task_priority
 
     #_________________________________________________________________________________________
-    def task_active_if (self, active_if_checks):
+    def task_priority(self, args):
         """
-        If any of active_checks is False or returns False, then the task is
-        marked as "inactive" and its outputs removed.
+        Start jobs of this task before those of tasks with lower priorities
+            whenever both are ready to run
         """
-        #print 'job is active:', active_checks, [
-        #                arg() if isinstance(arg, collections.Callable) else arg
-        #                for arg in active_checks]
-        self.active_if_checks = active_if_checks
+        if len(args) != 1:
+            raise PriorityArgumentError("@priority takes a single number, not (%s)" %
+                                        ", ".join(map(repr, args)))
+        try:
+            self.priority = float(args[0])
+        except (TypeError, ValueError):
+            raise PriorityArgumentError("In @priority(%r), the priority must be a number" %
+                                        (args[0],))
 
+    #_________________________________________________________________________________________
 
-class task_encoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, set):
-            return list(obj)
-        if isinstance(obj, defaultdict):
-            return dict(obj)
-        if isinstance(obj, _task):
-            return obj._name #, _task.action_names[obj.action_task], obj._description]
-        return json.JSONEncoder.default(self, obj)
+    #   task_resources
 
+    #_________________________________________________________________________________________
+    def task_resources(self, args, **resources):
+        """
+        How much of each resource (e.g. cpus = 8, mem = 30) each job of this task needs
+            Jobs are only started when there is enough of each resource left
+            (See pipeline_run(resources = ...))
+        """
+        if len(args) or not len(resources):
+            raise ResourcesArgumentError("@resources takes named amounts of resources, "
+                                         "e.g. @resources(cpus = 8, mem = 30)")
+        for name, amount in resources.items():
+            try:
+                amount = float(amount)
+                assert(amount >= 0)
+            except:
+                raise ResourcesArgumentError("In @resources(%s = %r), the amount must be "
+                                             "a number greater than or equal to 0" %
+                                             (name, amount))
+        self.resources = resources
 
+    #_________________________________________________________________________________________
 
+    #   task_retry
 
+    #_________________________________________________________________________________________
+    def task_retry(self, args, **options):
+        """
+        Run failed jobs of this task again, up to times more,
+            waiting delay seconds and then backoff times longer after each failure.
+            Only for exceptions of the given types
+        """
+        if len(args) != 1 or not set(options) <= set(["delay", "backoff", "exceptions"]):
+            raise RetryArgumentError("@retry takes the number of times to run failed jobs again, "
+                                     "e.g. @retry(3, delay = 10, backoff = 2, exceptions = IOError)")
+        self.retry_policy = t_retry_policy(args[0], **options)
 
+    #_________________________________________________________________________________________
 
+    #   task_speculative
 
-#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+    #_________________________________________________________________________________________
+    def task_speculative(self, args):
+        """
+        Start a second copy of any job of this task which is taking slowdown times
+            longer than usual. The first copy to succeed is used
+        """
+        if len(args) > 1:
+            raise SpeculativeArgumentError("@speculative takes a single number, not (%s)" %
+                                           ", ".join(map(repr, args)))
+        slowdown = args[0] if len(args) else 3
+        try:
+            self.speculate_after = float(slowdown)
+            assert(self.speculate_after >= 1)
+        except:
+            raise SpeculativeArgumentError("In @speculative(%r), the slowdown must be a number "
+                                           "greater than or equal to 1" % (slowdown,))
+
+    #_________________________________________________________________________________________
+
+    #   task_in_memory
+
+    #_________________________________________________________________________________________
+    def task_in_memory(self, args):
+        """
+        Keep the value returned by each job in the main process under its output name,
+            instead of writing an output file. Downstream jobs are passed the value
+            in place of the name
+        """
+        if len(args):
+            raise InMemoryArgumentError("@in_memory takes no arguments, not (%s)" %
+                                        ", ".join(map(repr, args)))
+        self.in_memory = True
+
+    #_________________________________________________________________________________________
+
+    #   task_active_if
+
+    #_________________________________________________________________________________________
+    def task_active_if (self, active_if_checks):
+        """
+        If any of active_checks is False or returns False, then the task is
+        marked as "inactive" and its outputs removed.
+        """
+        #print 'job is active:', active_checks, [
+        #                arg() if isinstance(arg, collections.Callable) else arg
+        #                for arg in active_checks]
+        self.active_if_checks = active_if_checks
+
+
+class task_encoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, set):
+            return list(obj)
+        if isinstance(obj, defaultdict):
+            return dict(obj)
+        if isinstance(obj, _task):
+            return obj._name #, _task.action_names[obj.action_task], obj._description]
+        return json.JSONEncoder.default(self, obj)
 
-#   Functions
 
 
-#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
-#_________________________________________________________________________________________
+
+
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Functions
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#_________________________________________________________________________________________
+
+#   init_tasks_for_pipeline
+
+#_________________________________________________________________________________________
+def init_tasks_for_pipeline ():
+    """
+    Forget output file names and job parameters cached by previous pipeline runs / printouts
+        Call this before checking which tasks are up to date
+    """
+    for n in node._all_nodes:
+        n.init_for_pipeline()
+
+#_________________________________________________________________________________________
 
 #   link_task_names_to_functions
 
@@ -2252,6 +2996,7 @@ def pipeline_printout_graph (stream,
 
 
     link_task_names_to_functions ()
+    init_tasks_for_pipeline ()
 
     #
     #   run time data
@@ -2299,7 +3044,8 @@ def pipeline_printout_graph (stream,
 #_________________________________________________________________________________________
 def pipeline_printout(output_stream, target_tasks, forcedtorun_tasks = [], verbose=1, indent = 4,
                                     gnu_make_maximal_rebuild_mode  = True, wrap_width = 100,
-                                    runtime_data= None):
+                                    runtime_data= None, history_file = None, checksums = False,
+                                    uptodate_check_threads = 0, glob_cache_file = None):
     """
     Printouts the parts of the pipeline which will be run
 
@@ -2332,6 +3078,13 @@ def pipeline_printout(output_stream, target_tasks, forcedtorun_tasks = [], verbo
                                           set to build targets if set to ``True``. Use with caution.
     :param wrap_width: The maximum length of each line
     :param runtime_data: Experimental feature for passing data to tasks at run time
+    :param history_file: SQLite database recording the order in which jobs completed
+                         (See pipeline_run)
+    :param checksums: Check whether the contents of input files have changed
+                      instead of file modification times (See pipeline_run)
+    :param uptodate_check_threads: Check whether tasks are up to date in this many threads at once
+                                   (See pipeline_run)
+    :param glob_cache_file: Directory listings saved by pipeline_run (See pipeline_run)
     """
     if verbose == 0:
         return
@@ -2346,612 +3099,1877 @@ def pipeline_printout(output_stream, target_tasks, forcedtorun_tasks = [], verbo
                         "values passes to jobs at run time.")
 
     link_task_names_to_functions ()
+    init_tasks_for_pipeline ()
+
+    glob_cache.start(glob_cache_file)
 
     #
-    #   target jobs
+    #   Everything set up from here on is undone in the finally clause below
     #
-    target_tasks = task_names_to_tasks ("Target", target_tasks)
-    forcedtorun_tasks = task_names_to_tasks ("Forced to run", forcedtorun_tasks)
+    uptodate_checker = None
+    try:
+        job_history.close()
+        if history_file == None and (checksums or any_task_uses_checksums()):
+            history_file = default_history_file_name
+        if history_file:
+            job_history.open(history_file, read_only = True)
+            job_history.use_checksums = checksums
 
-    logging_strm = t_verbose_logger(verbose, t_stream_logger(output_stream), runtime_data)
+        uptodate_checker = t_uptodate_checker(uptodate_check_threads)
+
+        #
+        #   target jobs
+        #
+        target_tasks = task_names_to_tasks ("Target", target_tasks)
+        forcedtorun_tasks = task_names_to_tasks ("Forced to run", forcedtorun_tasks)
 
+        logging_strm = t_verbose_logger(verbose, t_stream_logger(output_stream), runtime_data)
 
-    (topological_sorted,
-    self_terminated_nodes,
-    dag_violating_edges,
-    dag_violating_nodes) = topologically_sorted_nodes(target_tasks, forcedtorun_tasks,
-                                                        gnu_make_maximal_rebuild_mode,
-                                                        extra_data_for_signal = t_verbose_logger(0, None, runtime_data))
 
+        (topological_sorted,
+        self_terminated_nodes,
+        dag_violating_edges,
+        dag_violating_nodes) = topologically_sorted_nodes(target_tasks, forcedtorun_tasks,
+                                                            gnu_make_maximal_rebuild_mode,
+                                                            extra_data_for_signal = t_verbose_logger(0, None, runtime_data,
+                                                                                                     uptodate_checker))
 
-    #
-    #   raise error if DAG violating nodes
-    #
-    if len(dag_violating_nodes):
-        dag_violating_tasks = ", ".join(t._name for t in dag_violating_nodes)
 
-        e = error_circular_dependencies("Circular dependencies found in the "
-                                        "pipeline involving one or more of (%s)" %
-                                            (dag_violating_tasks))
-        raise e
+        #
+        #   raise error if DAG violating nodes
+        #
+        if len(dag_violating_nodes):
+            dag_violating_tasks = ", ".join(t._name for t in dag_violating_nodes)
 
-    wrap_indent = " " * (indent + 11)
+            e = error_circular_dependencies("Circular dependencies found in the "
+                                            "pipeline involving one or more of (%s)" %
+                                                (dag_violating_tasks))
+            raise e
 
-    #
-    #   Get updated nodes as all_nodes - nodes_to_run
-    #
-    if verbose >= 4:
-        (all_tasks, ignore_param1, ignore_param2,
-         ignore_param3) = topologically_sorted_nodes(target_tasks, True,
-                                                     gnu_make_maximal_rebuild_mode,
-                                                     extra_data_for_signal = t_verbose_logger(0, None, runtime_data))
-        if len(all_tasks) > len(topological_sorted):
-            output_stream.write("\n" + "_" * 40 + "\nTasks which are up-to-date:\n\n")
-            pipelined_tasks_to_run = set(topological_sorted)
-
-            for t in all_tasks:
-                if t in pipelined_tasks_to_run:
-                    continue
-                messages = t.printout(runtime_data, t in forcedtorun_tasks, verbose, indent)
-                for m in messages:
-                    output_stream.write(textwrap.fill(m, subsequent_indent = wrap_indent, width = wrap_width) + "\n")
+        wrap_indent = " " * (indent + 11)
 
-    output_stream.write("\n" + "_" * 40 + "\nTasks which will be run:\n\n")
-    for t in topological_sorted:
-        messages = t.printout(runtime_data, t in forcedtorun_tasks, verbose, indent)
-        for m in messages:
-            output_stream.write(textwrap.fill(m, subsequent_indent = wrap_indent, width = wrap_width) + "\n")
+        #
+        #   Get updated nodes as all_nodes - nodes_to_run
+        #
+        if verbose >= 4:
+            (all_tasks, ignore_param1, ignore_param2,
+             ignore_param3) = topologically_sorted_nodes(target_tasks, True,
+                                                         gnu_make_maximal_rebuild_mode,
+                                                         extra_data_for_signal = t_verbose_logger(0, None, runtime_data,
+                                                                                                     uptodate_checker))
+            if len(all_tasks) > len(topological_sorted):
+                output_stream.write("\n" + "_" * 40 + "\nTasks which are up-to-date:\n\n")
+                pipelined_tasks_to_run = set(topological_sorted)
+
+                for t in all_tasks:
+                    if t in pipelined_tasks_to_run:
+                        continue
+                    messages = t.printout(runtime_data, t in forcedtorun_tasks, verbose, indent)
+                    for m in messages:
+                        output_stream.write(textwrap.fill(m, subsequent_indent = wrap_indent, width = wrap_width) + "\n")
+
+        output_stream.write("\n" + "_" * 40 + "\nTasks which will be run:\n\n")
+        for t in topological_sorted:
+            messages = t.printout(runtime_data, t in forcedtorun_tasks, verbose, indent)
+            for m in messages:
+                output_stream.write(textwrap.fill(m, subsequent_indent = wrap_indent, width = wrap_width) + "\n")
 
-    if verbose:
-        output_stream.write("_" * 40 + "\n")
+        if verbose:
+            output_stream.write("_" * 40 + "\n")
+
+    finally:
+        if uptodate_checker != None:
+            uptodate_checker.close()
+        glob_cache.stop()
+        job_history.close()
 
 #_________________________________________________________________________________________
 
-#   get_semaphore
+#   get_semaphore_name
 
 #_________________________________________________________________________________________
-def get_semaphore (t, job_limit_semaphores, syncmanager):
+def get_semaphore_name (t):
     """
-    return semaphore to limit the number of concurrent jobs
+    return name of semaphore to limit the number of concurrent jobs
+        or None if this task is not limited in the number of jobs
     """
-    #
-    #   Is this task limited in the number of jobs?
-    #
     if t.semaphore_name not in t.job_limit_semaphores:
         return None
+    return t.semaphore_name
 
+#_________________________________________________________________________________________
 
-    #
-    #   create semaphore if not yet created
-    #
-    if t.semaphore_name not in job_limit_semaphores:
-        maximum_jobs_num = t.job_limit_semaphores[t.semaphore_name]
-        job_limit_semaphores[t.semaphore_name] = syncmanager.BoundedSemaphore(maximum_jobs_num)
-    return job_limit_semaphores[t.semaphore_name]
+#   get_job_output_files
 
 #_________________________________________________________________________________________
-#
-#   Parameter generator for all jobs / tasks
-#
-#________________________________________________________________________________________
-def make_job_parameter_generator (incomplete_tasks, task_parents, logger, forcedtorun_tasks,
-                                    count_remaining_jobs, runtime_data, verbose,
-                                    syncmanager,
-                                    one_second_per_job, touch_files_only):
+def get_job_output_files (t, param):
+    """
+    Names of files (or directories) written by a job
+    """
+    if t.job_wrapper == job_wrapper_mkdir:
+        return get_strings_in_nested_sequence(param[0])
+    if len(param) >= 2:
+        return get_strings_in_nested_sequence(param[1])
+    return []
 
-    inprogress_tasks = set()
-    job_limit_semaphores = dict()
+#_________________________________________________________________________________________
 
-    def parameter_generator():
-        log_at_level (logger, 10, verbose, "   job_parameter_generator BEGIN")
-        while len(incomplete_tasks):
-            cnt_jobs_created_for_all_tasks = 0
-            cnt_tasks_processed = 0
-            for t in list(incomplete_tasks):
-                #
-                #   wrap in execption handler so that we know which task exception
-                #       came from
-                #
-                try:
-                    log_at_level (logger, 10, verbose, "   job_parameter_generator consider task = %s" % t._name)
+#   shards
 
-                    # ignore tasks in progress
-                    if t in inprogress_tasks:
-                        continue
-                    log_at_level (logger, 10, verbose, "   job_parameter_generator task %s not in progress" % t._name)
-
-                    # ignore tasks with incomplete dependencies
-                    incomplete_parent = False
-                    for parent in task_parents[t]:
-                        if parent in incomplete_tasks:
-                            incomplete_parent = True
-                            break
-                    if incomplete_parent:
-                        continue
+#_________________________________________________________________________________________
+def get_job_shard (t, param, cnt_shards):
+    """
+    Which of cnt_shards copies of the pipeline runs the job (See pipeline_run(shard = ...))
+        Decided by a hash of the job output file names, so that every copy agrees
+    """
+    output_files = get_job_output_files(t, param)
+    key = repr(output_files if output_files else param)
+    return int(hashlib.sha1(key).hexdigest()[:8], 16) % cnt_shards
 
-                    log_at_level (logger, 10, verbose, "   job_parameter_generator start task %s (parents completed)" % t._name)
-                    force_rerun = t in forcedtorun_tasks
-                    #
-                    # log task
-                    #
-                    log_at_level (logger, 3, verbose, "Task enters queue = " + t.get_task_name() + (": Forced to rerun" if force_rerun else ""))
-                    log_at_level (logger, 3, verbose, t._description)
-                    inprogress_tasks.add(t)
-                    cnt_tasks_processed += 1
+def get_task_shards (t, shard_of_task):
+    """
+    "all"   : each shard runs all the jobs (mkdir)
+    "first" : shard 0 runs all the jobs.
+              Barrier tasks (@split, @merge, @collate), and tasks downstream of
+              @split, whose jobs are not known until the @split outputs exist
+    "hash"  : jobs are shared out by get_job_shard()
+    """
+    if t not in shard_of_task:
+        if t.job_wrapper == job_wrapper_mkdir:
+            shard_of_task[t] = "all"
+        elif (t._action_type in (_task.action_task_split,
+                                 _task.action_task_merge,
+                                 _task.action_task_collate) or
+              any(parent.indeterminate_output or
+                  get_task_shards(parent, shard_of_task) == "first"
+                    for parent in t._outward
+                    if parent.job_wrapper != job_wrapper_mkdir)):
+            shard_of_task[t] = "first"
+        else:
+            shard_of_task[t] = "hash"
+    return shard_of_task[t]
 
+def get_shards_making_files (t, shard_of_task, cnt_shards, runtime_data):
+    """
+    Dictionary of the output files of the jobs of the task ->
+        (shard which runs the job, job parameters)
+        Outputs made by every shard are left out
+    """
+    shards_making_files = dict()
+    if (not t.is_active or t.param_generator_func == None or
+        get_task_shards(t, shard_of_task) == "all"):
+        return shards_making_files
+    for param, descriptive_param in t.get_job_plan(runtime_data):
+        if get_task_shards(t, shard_of_task) == "first":
+            job_shard = 0
+        else:
+            job_shard = get_job_shard(t, param, cnt_shards)
+        for file_name in get_job_output_files(t, param):
+            shards_making_files[file_name] = (job_shard, param)
+    return shards_making_files
 
-                    #
-                    #   Use output parameters actually generated by running task
-                    #
-                    t.output_filenames = []
+#_________________________________________________________________________________________
 
+#   remove_partial_job_outputs
 
+#_________________________________________________________________________________________
+def remove_partial_job_outputs (t, param, start_time, logger, verbose):
+    """
+    Remove the output files of a cancelled job which have been written since start_time,
+        so that they are not mistaken for complete output by later runs
+    """
+    for file_name in get_job_output_files(t, param):
+        try:
+            if not os.path.isdir(file_name) and os.path.getmtime(file_name) >= start_time:
+                os.unlink(file_name)
+                log_at_level (logger, 1, verbose, "    Removed partial output %s", file_name)
+        except OSError:
+            pass
 
-                    #
-                    #   If no parameters: just call task function (empty list)
-                    #
-                    if (t.active_if_checks != None):
-                        t.is_active = all(arg() if isinstance(arg, collections.Callable) else arg
-                                            for arg in t.active_if_checks)
-                    if not t.is_active:
-                        parameters = []
+#_________________________________________________________________________________________
 
+#   store_in_memory_values
 
+#_________________________________________________________________________________________
+def store_in_memory_values (t, param, values):
+    """
+    Keep the values returned by a job of an @in_memory task for downstream jobs,
+        as though written when the newest input of the job was
+    """
+    input_mtimes = [stat_cache.getmtime(f) for f in get_strings_in_nested_sequence(param[0])
+                        if stat_cache.exists(f)]
+    mtime = max(input_mtimes) if len(input_mtimes) else 0
+    for name, value in zip(get_strings_in_nested_sequence(param[1]), values):
+        data_store.put(name, value, mtime)
 
-                    #
-                    #   If no parameters: just call task function (empty list)
-                    #
-                    elif t.param_generator_func == None:
-                        parameters = ([[], []],)
-                    else:
-                        parameters = t.param_generator_func(runtime_data)
+#_________________________________________________________________________________________
 
-                    #
-                    #   iterate through parameters
-                    #
-                    cnt_jobs_created = 0
-                    for param, descriptive_param in parameters:
-
-                        #
-                        #   save output even if uptodate
-                        #
-                        if len(param) >= 2:
-                            t.output_filenames.append(param[1])
-
-                        job_name = t.get_job_name(descriptive_param, runtime_data)
-
-                        #
-                        #    don't run if up to date
-                        #
-                        if force_rerun:
-                            log_at_level (logger, 3, verbose, "    force task %s to rerun " % job_name)
-                        else:
-                            if not t.needs_update_func:
-                                log_at_level (logger, 3, verbose, "    %s no function to check if up-to-date " % job_name)
-                            else:
-                                needs_update, msg = t.needs_update_func (*param)
-                                if not needs_update:
-                                    log_at_level (logger, 2, verbose, "    %s unnecessary: already up to date " % job_name)
-                                    continue
-                                else:
-                                    log_at_level (logger, 3, verbose, "    %s %s " % (job_name, msg))
-
-                        #
-                        #   Clunky hack to make sure input files exists right before
-                        #        job is called for better error messages
-                        #
-                        if t.needs_update_func == needs_update_check_modify_time:
-                            check_input_files_exist (*param)
-
-                        # pause for one second before first job of each tasks
-                        if one_second_per_job and cnt_jobs_created == 0:
-                            log_at_level (logger, 10, verbose, "   1 second PAUSE in job_parameter_generator\n\n\n")
-                            time.sleep(1.01)
-
-
-                        count_remaining_jobs[t] += 1
-                        cnt_jobs_created += 1
-                        cnt_jobs_created_for_all_tasks += 1
-                        yield (param,
-                                t._name,
-                                job_name,
-                                t.job_wrapper,
-                                t.user_defined_work_func,
-                                get_semaphore (t, job_limit_semaphores, syncmanager),
-                                one_second_per_job,
-                                touch_files_only)
-
-                    # if no job came from this task, this task is complete
-                    #   we need to retire it here instead of normal completion at end of job tasks
-                    #   precisely because it created no jobs
-                    if cnt_jobs_created == 0:
-                        incomplete_tasks.remove(t)
-                        t.completed (logger, True)
-
-                        #
-                        #   Add extra warning if no regular expressions match:
-                        #   This is a common class of frustrating errors
-                        #
-                        if (verbose >= 1 and "ruffus_WARNING" in runtime_data and
-                            t.param_generator_func in runtime_data["ruffus_WARNING"]):
-                            for msg in runtime_data["ruffus_WARNING"][t.param_generator_func]:
-                                logger.warning("    'In Task def %s(...):' %s " % (t.get_task_name(), msg))
+#   uses_checksums
 
+#_________________________________________________________________________________________
+def uses_checksums (t):
+    """
+    Whether the checksums of the inputs of each job should be recorded
+    """
+    return (t.needs_update_func == needs_update_check_checksum or
+            (job_history.use_checksums and t.needs_update_func == needs_update_check_modify_time))
 
-                #
-                #   GeneratorExit is thrown when this generator does not complete.
-                #       I.e. there is a break in the pipeline_run loop.
-                #       This happens where there are exceptions signalled from within a job
-                #
-                #   This is not really an exception, more a way to exit the generator loop
-                #       asynchrononously so that cleanups can happen (e.g. the "with" statement
-                #       or finally.)
-                #
-                #   We could write except Exception: below which will catch everything but
-                #       KeyboardInterrupt and StopIteration and GeneratorExit in python 2.6
-                #
-                #   However, in python 2.5, GeneratorExit inherits from Exception. So
-                #       we explicitly catch and rethrow GeneratorExit.
-                except GeneratorExit:
-                    raise
-                except:
-                    exceptionType, exceptionValue, exceptionTraceback = sys.exc_info()
-                    exception_stack  = traceback.format_exc(exceptionTraceback)
-                    exception_name   = exceptionType.__module__ + '.' + exceptionType.__name__
-                    exception_value  = str(exceptionValue)
-                    if len(exception_value):
-                        exception_value = "(%s)" % exception_value
-                    errt = RethrownJobError([(t._name,
-                                             "",
-                                             exception_name,
-                                             exception_value,
-                                             exception_stack)])
-                    errt.specify_task(t, "Exceptions generating parameters")
-                    raise errt
-
-
-
-            # extra tests incase final tasks do not result in jobs
-            if len(incomplete_tasks) and (not cnt_tasks_processed or cnt_jobs_created_for_all_tasks):
-                log_at_level (logger, 10, verbose, "    incomplete tasks = " +
-                                       ",".join([t._name for t in incomplete_tasks] ))
-                yield waiting_for_more_tasks_to_complete()
+def any_task_uses_checksums ():
+    return any(n.needs_update_func == needs_update_check_checksum for n in node._all_nodes)
 
-        yield all_tasks_complete()
-        # This function is done
-        log_at_level (logger, 10, verbose, "   job_parameter_generator END")
+#_________________________________________________________________________________________
+
+#   make_job_limit_semaphores
 
-    return parameter_generator
+#_________________________________________________________________________________________
+def make_job_limit_semaphores (tasks, semaphore_type):
+    """
+    Create semaphores only for the tasks to be run which are limited by @jobs_limit
+        semaphore_type is multiprocessing.BoundedSemaphore if they need to be shared
+        with pool processes, otherwise threading.BoundedSemaphore
+    """
+    job_limit_semaphores = dict()
+    for t in tasks:
+        semaphore_name = get_semaphore_name(t)
+        if semaphore_name == None or semaphore_name in job_limit_semaphores:
+            continue
+        maximum_jobs_num = t.job_limit_semaphores[semaphore_name]
+        job_limit_semaphores[semaphore_name] = semaphore_type(maximum_jobs_num)
+    return job_limit_semaphores
 
+#_________________________________________________________________________________________
 
+#   get_job_resources
 
 #_________________________________________________________________________________________
 #
-#   feed_job_params_to_process_pool
-#
+#   jobs of tasks without @resources each use a single cpu
 #
-#________________________________________________________________________________________
-def feed_job_params_to_process_pool_factory (parameter_q, logger, verbose):
+default_job_resources = {"cpus" : 1}
+def get_job_resources (t):
     """
-    Process pool gets its parameters from this generator
-    Use factory function to save parameter_queue
+    Amounts of named resources each job of this task needs
     """
-    def feed_job_params_to_process_pool ():
-        log_at_level (logger, 10, verbose, "   Send param to Pooled Process START")
-        while 1:
-            log_at_level (logger, 10, verbose, "   Get next parameter size = %d" %
-                                                        parameter_q.qsize())
-            if not parameter_q.qsize():
-                time.sleep(0.1)
-            param = parameter_q.get()
-            log_at_level (logger, 10, verbose, "   Get next parameter done")
+    if t.resources == None:
+        return default_job_resources
+    return t.resources
 
-            # all tasks done
-            if isinstance(param, all_tasks_complete):
-                break
-
-            log_at_level (logger, 10, verbose, "   Send param to Pooled Process=>" + str(param[0]))
-            yield param
-
-        log_at_level (logger, 10, verbose, "   Send param to Pooled Process END")
+#_________________________________________________________________________________________
 
-    # return generator
-    return feed_job_params_to_process_pool
+#   t_retry_policy
 
 #_________________________________________________________________________________________
-#
-#   fill_queue_with_job_parameters
-#
-#________________________________________________________________________________________
-def fill_queue_with_job_parameters (job_parameters, parameter_q, POOL_SIZE, logger, verbose):
+class t_retry_policy(object):
     """
-    Ensures queue is filled with number of parameters > jobs / slots (POOL_SIZE)
+    How failed jobs of a task are run again (See @retry)
+        Up to times more, waiting delay seconds and then backoff times
+        longer after each failure. Only for exceptions of the given types
     """
-    log_at_level (logger, 10, verbose, "    fill_queue_with_job_parameters START")
-    for param in job_parameters:
+    def __init__ (self, times, delay = 1.0, backoff = 2.0, exceptions = Exception):
+        if not isinstance(exceptions, tuple):
+            exceptions = (exceptions,)
+        try:
+            self.times      = int(times)
+            self.delay      = float(delay)
+            self.backoff    = float(backoff)
+            assert(self.times >= 0 and self.delay >= 0 and self.backoff >= 1)
+            assert(all(isinstance(e, type) and issubclass(e, BaseException) for e in exceptions))
+        except:
+            raise RetryArgumentError("In @retry(%r, delay = %r, backoff = %r, exceptions = %r), "
+                                     "times, delay and backoff must be numbers at least 0, 0 and 1, "
+                                     "and exceptions a type or tuple of types of exception" %
+                                     (times, delay, backoff, exceptions))
+        self.exceptions = exceptions
 
-        # stop if no more jobs available
-        if isinstance(param, waiting_for_more_tasks_to_complete):
-            log_at_level (logger, 10, verbose, "    fill_queue_with_job_parameters WAITING for task to complete")
-            break
+    def get_delay (self, cnt_failures):
+        """
+        Seconds to wait before running a job again after it has failed cnt_failures times
+        """
+        return self.delay * self.backoff ** (cnt_failures - 1)
 
-        if not isinstance(param, all_tasks_complete):
-            log_at_level (logger, 10, verbose, "    fill_queue_with_job_parameters=>" + str(param[0]))
+    def is_retryable (self, exception_name):
+        """
+        Whether an exception, by the name reported from the job ("module.class"),
+            is one of the exceptions to retry after.
+            Classes which cannot be found in this process must be named exactly
+        """
+        module_name, class_name = exception_name.rsplit(".", 1)
+        exception_type = getattr(sys.modules.get(module_name), class_name, None)
+        if isinstance(exception_type, type) and issubclass(exception_type, BaseException):
+            return (issubclass(exception_type, self.exceptions) and
+                    not issubclass(exception_type, JobSignalledBreak))
+        return class_name in [e.__name__ for e in self.exceptions]
 
-        # put into queue
-        parameter_q.put(param)
+#_________________________________________________________________________________________
 
-        # queue size needs to be at least 2 so that the parameter queue never consists of a single
-        #   waiting_for_task_to_complete entry which will cause
-        #   a loop and everything to hang!
-        if parameter_q.qsize() > POOL_SIZE + 1:
-            break
-    log_at_level (logger, 10, verbose, "    fill_queue_with_job_parameters END")
+#   check_job_resources
 
+#_________________________________________________________________________________________
+def check_job_resources (tasks, capacities):
+    """
+    Make sure each job can run with the resources available
+    """
+    for t in tasks:
+        for name, amount in get_job_resources(t).iteritems():
+            if name in capacities and amount > capacities[name]:
+                raise ResourcesArgumentError("Each job needs %s = %s but only %s is available" %
+                                             (name, amount, capacities[name])).specify_task(t,
+                                                "Jobs need more resources than are available")
 
+#_________________________________________________________________________________________
 #
-#   How the job queue works:
-#
-#   Main loop
-#       iterates pool.map using feed_job_params_to_process_pool()
-#       (calls parameter_q.get() until all_tasks_complete)
-#
-#           if errors but want to finish tasks already in pipeine:
-#               parameter_q.put(all_tasks_complete())
-#               keep going
-#        else:
-#
-#            loops through jobs until no more jobs in non-dependent tasks
-#               separate loop in generator so that list of incomplete_tasks does not
-#               get updated half way through
-#               causing race conditions
-#
-#               parameter_q.put(param)
-#               until waiting_for_more_tasks_to_complete
-#               until queue is full (check *after*)
+#   t_resource_pool
 #
+#________________________________________________________________________________________
+class t_resource_pool(object):
+    """
+    Amounts of named resources (e.g. cpus, mem) used by running jobs,
+        out of those available.
+        Resources without a capacity are unlimited
+    """
+    def __init__ (self, capacities):
+        self.capacities = dict(capacities)
+        self.in_use     = defaultdict(float)
+
+    def fits (self, resources):
+        for name, amount in resources.iteritems():
+            # allow for rounding errors in the sum of fractional amounts
+            if name in self.capacities and self.in_use[name] + amount > self.capacities[name] + 1e-9:
+                return False
+        return True
 
-#_________________________________________________________________________________________
+    def reserve (self, resources):
+        for name, amount in resources.iteritems():
+            self.in_use[name] += amount
 
-#   pipeline_run
+    def release (self, resources):
+        for name, amount in resources.iteritems():
+            self.in_use[name] -= amount
 
 #_________________________________________________________________________________________
-def pipeline_run(target_tasks = [], forcedtorun_tasks = [], multiprocess = 1, logger = stderr_logger,
-                 gnu_make_maximal_rebuild_mode  = True, verbose = 1,
-                 runtime_data = None, one_second_per_job = True, touch_files_only = False,
-                 exceptions_terminate_immediately = False, log_exceptions = False):
+#
+#   t_ready_task_scheduler
+#
+#________________________________________________________________________________________
+class t_ready_task_scheduler(object):
     """
-    Run pipelines.
-
-    :param target_tasks: targets task functions which will be run if they are out-of-date
-    :param forcedtorun_tasks: task functions which will be run whether or not they are out-of-date
-    :param multiprocess: The number of concurrent jobs
-    :param logger: Where progress will be logged. Defaults to stderr output.
-    :type logger: `logging <http://docs.python.org/library/logging.html>`_ objects
-    :param gnu_make_maximal_rebuild_mode: Defaults to re-running *all* out-of-date tasks. Runs minimal
-                                          set to build targets if set to ``True``. Use with caution.
-    :param verbose: level 0 : nothing
-                    level 1 : logs task names and warnings
-                    level 2 : logs task description if exists
-                    level 3 : logs job names for jobs to be run
-                    level 4 : logs list of up-to-date tasks and job names for jobs to be run
-                    level 5 : logs job names for all jobs whether up-to-date or not
-                    level 10: logs messages useful only for debugging ruffus pipeline code
-    :param runtime_data: Experimental feature for passing data to tasks at run time
-    :param one_second_per_job: Defaults to (true) forcing jobs to take a minimum of 1 second to complete
-    :param touch_file_only: Create or update input/output files only to simulate running the pipeline. Do not run jobs
-
+    Keeps track of which tasks can have their jobs queued
+
+        Each task keeps a count of parents which have not yet completed.
+        When the last parent completes, the task is moved onto the ready queue.
+        Tasks which are still blocked are never rescanned, so releasing a task
+            only costs as much as the number of its children.
+
+        Ready tasks are taken in order of
+            1) @priority
+            2) the longest path through the pipeline from the task onwards,
+               if priority_policy == "critical_path"
+            3) when they became ready
+        Each task on a path counts as long as its longest job in job_durations
+            (task name -> {job key: seconds}, from previous runs),
+            or the average of the known tasks.
     """
-    syncmanager = multiprocessing.Manager()
+    def __init__ (self, topological_sorted, priority_policy = None, job_durations = None):
+        self.incomplete_tasks           = set(topological_sorted)
+        self.count_remaining_parents    = dict()
+        self.task_children              = defaultdict(list)
 
-    if runtime_data == None:
-        runtime_data = {}
-    if not isinstance(runtime_data, dict):
-        raise Exception("pipeline_run parameter runtime_data should be a dictionary of "
-                        "values passes to jobs at run time.")
-
-    if verbose == 0:
-        logger = black_hole_logger
-    elif verbose >= 11:
-        if hasattr(logger, "add_unique_prefix"):
-            logger.add_unique_prefix()
+        # heap of ((-priority, -path length, order released), task)
+        self.ready_tasks                = []
+        self.release_order              = itertools.count()
 
-    if touch_files_only and verbose >= 1:
-        logger.info("Touch output files instead of remaking them.")
+        #
+        #   longest path from each task onwards
+        #
+        self.job_durations              = job_durations or dict()
+        self.task_weights               = dict()
+        self.path_lengths               = dict()
+        if priority_policy == "critical_path":
+            self.task_weights = self.get_task_weights(topological_sorted)
+            self.path_lengths = get_longest_path_lengths(topological_sorted,
+                                                         self.task_weights.__getitem__)
 
-    link_task_names_to_functions ()
-    #
-    #   target jobs
-    #
-    target_tasks = task_names_to_tasks ("Target", target_tasks)
-    forcedtorun_tasks = task_names_to_tasks ("Forced to run", forcedtorun_tasks)
+        # tasks which have no more jobs left to be queued
+        self.fully_queued_tasks         = set()
 
-    (topological_sorted,
-    self_terminated_nodes,
-    dag_violating_edges,
-    dag_violating_nodes) = topologically_sorted_nodes(  target_tasks, forcedtorun_tasks,
-                                                        gnu_make_maximal_rebuild_mode,
-                                                        extra_data_for_signal = t_verbose_logger(verbose, logger, runtime_data))
+        # jobs started as soon as their upstream job completed,
+        #   i.e. before their own task was ready
+        self.early_released_jobs        = defaultdict(set)
 
-    if len(dag_violating_nodes):
-        dag_violating_tasks = ", ".join(t._name for t in dag_violating_nodes)
+        #
+        # get dependencies. Only include tasks which will be run
+        #   Iterate in topological order so that tasks are released deterministically
+        #
+        for t in topological_sorted:
+            parents = set(parent for parent in t._outward if parent in self.incomplete_tasks)
+            self.count_remaining_parents[t] = len(parents)
+            for parent in parents:
+                self.task_children[parent].append(t)
+            if not parents:
+                self.push_ready_task(t)
+
+    def get_task_weights (self, tasks):
+        """
+        Expected duration of each task: its longest recorded job
+        """
+        weights = dict()
+        for t in tasks:
+            durations = self.job_durations.get(t._name)
+            if durations:
+                weights[t] = max(durations.itervalues())
+        default_weight = sum(weights.values()) / len(weights) if len(weights) else 1.0
+        for t in tasks:
+            weights.setdefault(t, default_weight)
+        return weights
+
+    def has_incomplete_tasks (self):
+        return len(self.incomplete_tasks) > 0
+
+    def has_ready_tasks (self):
+        return len(self.ready_tasks) > 0
+
+    def push_ready_task (self, t):
+        scheduling_order = (-t.priority, -self.path_lengths.get(t, 0), self.release_order.next())
+        heapq.heappush(self.ready_tasks, (scheduling_order, t))
+
+    def pop_ready_task (self):
+        """
+        Returns (scheduling order, task) for the ready task which comes first
+        """
+        return heapq.heappop(self.ready_tasks)
 
-        e = error_circular_dependencies("Circular dependencies found in the "
-                                        "pipeline involving one or more of (%s)" %
-                                            (dag_violating_tasks))
-        raise e
+    def job_priority (self, t, param):
+        """
+        (@priority, expected seconds until the end of the pipeline) for this job
+        """
+        path_length = self.path_lengths.get(t, 0)
+        durations = self.job_durations.get(t._name)
+        if durations:
+            duration = durations.get(self.job_key(param))
+            if duration != None:
+                path_length += duration - self.task_weights[t]
+        return t.priority, path_length
+
+    def sort_jobs (self, t, parameters):
+        """
+        Longest jobs first, for tasks with recorded job durations
+            Jobs not seen before come first
+        """
+        durations = self.job_durations.get(t._name)
+        if not durations:
+            return parameters
+        job_key = self.job_key
+        return sorted(parameters, reverse = True,
+                      key = lambda (param, descriptive_param):
+                                (job_key(param) not in durations, durations.get(job_key(param))))
+
+    def all_jobs_queued (self, t):
+        """
+        Note that all the jobs of this task have been queued.
+            Until then, the task may not be retired even if no jobs are running
+        """
+        self.fully_queued_tasks.add(t)
 
+    def is_fully_queued (self, t):
+        return t in self.fully_queued_tasks
 
+    @staticmethod
+    def job_key (param):
+        """
+        Jobs are identified by their output
+        """
+        if len(param) < 2:
+            return repr(param)
+        return repr(param[1])
 
-    #
-    # get dependencies. Only include tasks which will be run
-    #
-    incomplete_tasks = set(topological_sorted)
-    task_parents = defaultdict(set)
-    for t in incomplete_tasks:
-        task_parents[t] = set()
-        for parent in t._outward:
-            if parent in incomplete_tasks:
-                task_parents[t].add(parent)
-    #print json.dumps(task_parents.items(), indent=4, cls=task_encoder)
+    def release_job_early (self, t, param):
+        self.early_released_jobs[t].add(self.job_key(param))
 
+    def is_released_early (self, t, param):
+        return t in self.early_released_jobs and self.job_key(param) in self.early_released_jobs[t]
 
-    # prepare tasks for pipeline run
-    #    **********
-    #      BEWARE
-    #    **********
-    #
-    #    Because state is stored, ruffus is *not* reentrant.
-    #
-    #    **********
-    #      BEWARE
-    #    **********
-    for t in topological_sorted:
-        t.init_for_pipeline()
+    def task_completed (self, t):
+        """
+        Retire task and release any children which are waiting only on this task
+        """
+        self.incomplete_tasks.remove(t)
+        for child in self.task_children[t]:
+            self.count_remaining_parents[child] -= 1
+            if self.count_remaining_parents[child] == 0:
+                self.push_ready_task(child)
 
 
-    #
-    # prime queue with initial set of job parameters
-    #
-    parameter_q = Queue()
-
-    count_remaining_jobs = defaultdict(int)
-    parameter_generator = make_job_parameter_generator (incomplete_tasks, task_parents,
-                                                        logger, forcedtorun_tasks,
-                                                        count_remaining_jobs,
-                                                        runtime_data, verbose,
-                                                        syncmanager,
-                                                        one_second_per_job,
-                                                        touch_files_only)
-    job_parameters = parameter_generator()
-    fill_queue_with_job_parameters(job_parameters, parameter_q, multiprocess, logger, verbose)
+#_________________________________________________________________________________________
+#
+#   Parameter generator for all jobs / tasks
+#
+#________________________________________________________________________________________
+def make_job_parameter_generator (task_scheduler, logger, forcedtorun_tasks,
+                                    count_remaining_jobs, jobs_in_flight,
+                                    runtime_data, verbose,
+                                    one_second_per_job, touch_files_only,
+                                    uptodate_checker = serial_uptodate_checker,
+                                    shard = None):
+    """
+    Returns
+        1) generator of the parameters for all jobs for all tasks
+        2) function which returns the jobs which can be started as soon as
+           a particular upstream job has completed
+        3) function which remakes a failed job to be run again
+        4) function which returns a job once its inputs made by other shards are ready
+           (See t_job_dispatcher)
+    """
 
+    job_indices = itertools.count()
+
+    #_____________________________________________________________________________________
+
+    #   is_job_in_shard
+
+    #_____________________________________________________________________________________
+    shard_of_task = dict()
+    def is_job_in_shard (t, param):
+        """
+        Whether this copy of the pipeline runs the job (See pipeline_run(shard = ...))
+        """
+        if shard == None:
+            return True
+        shard_index, cnt_shards = shard
+        task_shards = get_task_shards(t, shard_of_task)
+        if task_shards == "all":
+            return True
+        if task_shards == "first":
+            return shard_index == 0
+        return get_job_shard(t, param, cnt_shards) == shard_index
+
+    def jobs_in_shard (t, parameters):
+        for param, descriptive_param in parameters:
+            if is_job_in_shard(t, param):
+                yield param, descriptive_param
+
+    #_____________________________________________________________________________________
+
+    #   get_upstream_jobs_in_other_shards / get_input_files_from_other_shards /
+    #       check_job_input_files_exist
+
+    #_____________________________________________________________________________________
+    shards_making_files_by_task = dict()
+    def get_upstream_jobs_in_other_shards (t, param):
+        """
+        (input file, upstream task, upstream job parameters) for each input file of the job
+            made by an upstream job which another copy of the pipeline runs
+            (See pipeline_run(shard = ...))
+        """
+        if shard == None or not len(param):
+            return []
+        shard_index, cnt_shards = shard
+        upstream_jobs = []
+        for input_file in get_strings_in_nested_sequence(param[0]):
+            for parent in t._outward:
+                if parent not in shards_making_files_by_task:
+                    shards_making_files_by_task[parent] = get_shards_making_files(parent,
+                                                            shard_of_task, cnt_shards, runtime_data)
+                job_shard, parent_param = shards_making_files_by_task[parent].get(input_file,
+                                                                                  (shard_index, None))
+                if job_shard != shard_index:
+                    upstream_jobs.append((input_file, parent, parent_param))
+                    break
+        return upstream_jobs
+
+    def get_input_files_from_other_shards (t, param):
+        """
+        Input files of the job made by upstream jobs which other copies of the pipeline run
+            The job waits for these to be made (See is_made_by_other_shard)
+        """
+        return [input_file for input_file, parent, parent_param
+                    in get_upstream_jobs_in_other_shards(t, param)]
+
+    def get_all_upstream_jobs_in_other_shards (t, param):
+        """
+        [(upstream task, upstream job parameters)] for the upstream jobs of other shards
+            which make the inputs of the job, and the jobs of other shards upstream of those
+        """
+        upstream_jobs = []
+        seen = set()
+        stack = [(t, param)]
+        while stack:
+            for input_file, parent, parent_param in get_upstream_jobs_in_other_shards(*stack.pop()):
+                key = (parent, repr(parent_param))
+                if key not in seen:
+                    seen.add(key)
+                    upstream_jobs.append((parent, parent_param))
+                    stack.append((parent, parent_param))
+        return upstream_jobs
+
+    def is_made_by_other_shard (t, param):
+        """
+        Whether the job run by another shard has made its outputs in this run,
+            not just in an earlier run: its outputs are up to date
+            Jobs upstream of it are checked separately (See ready_job)
+        """
+        output_files = get_job_output_files(t, param)
+        input_files = get_strings_in_nested_sequence(param[0]) if len(param) else []
+
+        # written by another process since they were cached
+        stat_cache.invalidate(output_files + input_files)
+        if not all(os.path.exists(f) for f in output_files):
+            return False
+        if t.needs_update_func != None:
+            try:
+                needs_update, msg = t.needs_update_func(*param)
+            except:
+                return False
+            if needs_update:
+                return False
+        return True
+
+    def check_job_input_files_exist (t, param):
+        """
+        Only for tasks which check the modification times or checksums of their inputs
+            Inputs still to be made by other shards are waited for instead
+        """
+        if t.needs_update_func not in (needs_update_check_modify_time,
+                                       needs_update_check_checksum):
+            return
+        input_files_from_other_shards = get_input_files_from_other_shards(t, param)
+        if not len(input_files_from_other_shards):
+            check_input_files_exist (*param)
+        else:
+            check_input_files_exist ([f for f in get_strings_in_nested_sequence(param[0])
+                                        if f not in input_files_from_other_shards])
+
+    #_____________________________________________________________________________________
+
+    #   make_job / ready_job
+
+    #_____________________________________________________________________________________
+    # job index -> (input files made by other shards, upstream jobs in other shards,
+    #               time to give up waiting for them)
+    jobs_waiting_for_shards = dict()
+    def make_job (t, param, job_name):
+        """
+        Parameters for run_pooled_job_without_exceptions
+            Remember job so that we know which job has completed
+        """
+        job_index = job_indices.next()
+        jobs_in_flight[job_index] = (t, param, job_name)
+        count_remaining_jobs[t] += 1
+
+        #
+        #   input files may be made by jobs running in other shards (See ready_job)
+        #
+        job_wrapper = t.job_wrapper
+        if t.in_memory:
+            job_wrapper = job_wrapper_in_memory
+        if t.needs_update_func in (needs_update_check_modify_time, needs_update_check_checksum):
+            input_files_from_other_shards = get_input_files_from_other_shards(t, param)
+            if len(input_files_from_other_shards):
+                jobs_waiting_for_shards[job_index] = (input_files_from_other_shards,
+                                                      get_all_upstream_jobs_in_other_shards(t, param),
+                                                      time.time() + shard_wait_seconds)
+
+        #
+        #   inputs which are the outputs of @in_memory tasks are passed by value
+        #
+        return (data_store.substitute_values(param),
+                t._name,
+                job_name,
+                job_wrapper,
+                t.user_defined_work_func,
+                get_semaphore_name (t),
+                one_second_per_job,
+                touch_files_only,
+                job_index)
+
+    #_____________________________________________________________________________________
+
+    #   make_jobs_downstream_of
+
+    #_____________________________________________________________________________________
+    def make_jobs_downstream_of (t, param):
+        """
+        Jobs of downstream @transform tasks whose single input is the output of
+            this (just completed) job.
+            Only for downstream tasks which are waiting on nothing except this task.
+            Tasks whose output is only known after they have run (@split) or
+            which produce a single output (@merge) remain barriers
+
+            Returns (job, seconds to wait before queueing the job) for each job
+        """
+        upstream_completed_time = time.time()
+        jobs = []
+        if (t.indeterminate_output or
+            t._single_job_single_output != t.multiple_jobs_outputs or
+            len(param) < 2 or
+            t not in task_scheduler.incomplete_tasks):
+            return jobs
+
+        for child in task_scheduler.task_children[t]:
+            if (child.single_input_param_func == None or
+                t not in child.single_input_tasks or
+                task_scheduler.count_remaining_parents[child] != 1):
+                continue
+            try:
+                if (child.active_if_checks != None and
+                    not all(arg() if isinstance(arg, collections.Callable) else arg
+                                for arg in child.active_if_checks)):
+                    continue
+
+                params = child.single_input_param_func(param[1], runtime_data)
+                if params == None:
+                    continue
+                child_param, descriptive_param = params
+                if not is_job_in_shard(child, child_param):
+                    continue
+                job_name = child.get_lazy_job_name(descriptive_param, runtime_data)
+
+                #
+                #    don't run if up to date
+                #
+                if child not in forcedtorun_tasks and child.needs_update_func:
+                    needs_update, msg = child.needs_update_func (*child_param)
+                    if not needs_update:
+                        continue
+                check_job_input_files_exist (child, child_param)
+
+            except:
+                exceptionType, exceptionValue, exceptionTraceback = sys.exc_info()
+                exception_stack  = traceback.format_exc(exceptionTraceback)
+                exception_name   = exceptionType.__module__ + '.' + exceptionType.__name__
+                exception_value  = str(exceptionValue)
+                if len(exception_value):
+                    exception_value = "(%s)" % exception_value
+                errt = RethrownJobError([(child._name,
+                                         "",
+                                         exception_name,
+                                         exception_value,
+                                         exception_stack)])
+                errt.specify_task(child, "Exceptions generating parameters")
+                raise errt
+
+            log_at_level (logger, 3, verbose, "    %s started after upstream job completed", job_name)
+            task_scheduler.release_job_early(child, child_param)
+
+            #
+            #   the upstream output was only just written: make sure
+            #       the output of this job has a later modification time
+            #
+            pause_seconds = 0
+            if one_second_per_job:
+                pause_seconds = max(upstream_completed_time + 1.01 - time.time(), 0)
+            jobs.append((make_job(child, child_param, job_name), pause_seconds))
+        return jobs
+
+    #_____________________________________________________________________________________
+
+    #   jobs_not_released_early
+
+    #_____________________________________________________________________________________
+    def jobs_not_released_early (t, parameters):
+        for param, descriptive_param in parameters:
+
+            #
+            #   save output even if uptodate
+            #
+            if len(param) >= 2:
+                t.output_filenames.append(param[1])
+
+            #
+            #   already started when its upstream job completed
+            #
+            if task_scheduler.is_released_early(t, param):
+                continue
+
+            yield param, descriptive_param
+
+    #_____________________________________________________________________________________
+
+    #   task_jobs
+
+    #_____________________________________________________________________________________
+    def task_jobs (t):
+        """
+        Generator of the parameters for all the jobs of a task whose parents have completed
+        """
+        try:
+            log_at_level (logger, 10, verbose, "   job_parameter_generator start task %s (parents completed)", t._name)
+            force_rerun = t in forcedtorun_tasks
+            #
+            # log task
+            #
+            log_at_level (logger, 3, verbose, "Task enters queue = " + t.get_task_name() + (": Forced to rerun" if force_rerun else ""))
+            log_at_level (logger, 3, verbose, t._description)
+
+
+            #
+            #   Use output parameters actually generated by running task
+            #
+            t.output_filenames = []
+
+
+
+            #
+            #   If no parameters: just call task function (empty list)
+            #
+            if (t.active_if_checks != None):
+                t.is_active = all(arg() if isinstance(arg, collections.Callable) else arg
+                                    for arg in t.active_if_checks)
+            if not t.is_active:
+                parameters = []
+
+
+
+            #
+            #   If no parameters: just call task function (empty list)
+            #
+            elif t.param_generator_func == None:
+                parameters = ([[], []],)
+            else:
+                parameters = t.get_job_plan(runtime_data)
+
+            #
+            #   check whether jobs are up to date (possibly concurrently)
+            #       longest first if their durations are known
+            #   Outputs are saved in their original order before sorting
+            #
+            parameters = jobs_not_released_early(t, parameters)
+            parameters = jobs_in_shard(t, parameters)
+            parameters = task_scheduler.sort_jobs(t, parameters)
+            if force_rerun or not t.needs_update_func:
+                checked_parameters = ((param, descriptive_param, True, "")
+                                        for param, descriptive_param in parameters)
+            else:
+                checked_parameters = t.check_jobs_uptodate(uptodate_checker, parameters)
+
+            #
+            #   iterate through parameters
+            #
+            cnt_jobs_created = 0
+            for param, descriptive_param, needs_update, msg in checked_parameters:
+
+                job_name = t.get_lazy_job_name(descriptive_param, runtime_data)
+
+                #
+                #    don't run if up to date
+                #
+                if force_rerun:
+                    log_at_level (logger, 3, verbose, "    force task %s to rerun ", job_name)
+                else:
+                    if not t.needs_update_func:
+                        log_at_level (logger, 3, verbose, "    %s no function to check if up-to-date ", job_name)
+                    else:
+                        if not needs_update:
+                            log_at_level (logger, 2, verbose, "    %s unnecessary: already up to date ", job_name)
+                            continue
+                        else:
+                            log_at_level (logger, 3, verbose, "    %s %s ", job_name, msg)
+
+                #
+                #   Clunky hack to make sure input files exists right before
+                #        job is called for better error messages
+                #   Other shards may still be making them
+                #
+                check_job_input_files_exist (t, param)
+
+                # pause for one second before first job of each tasks
+                if one_second_per_job and cnt_jobs_created == 0:
+                    log_at_level (logger, 10, verbose, "   1 second PAUSE in job_parameter_generator\n\n\n")
+                    time.sleep(1.01)
+
+
+                cnt_jobs_created += 1
+                yield make_job(t, param, job_name)
+
+            task_scheduler.all_jobs_queued(t)
+
+            #
+            # if no job is running for this task, this task is complete
+            #   we need to retire it here instead of normal completion at end of job tasks
+            #   precisely because it created no jobs, or because
+            #   all jobs already finished while later jobs were
+            #   being generated (or found to be up to date)
+            #
+            if count_remaining_jobs[t] == 0:
+                task_scheduler.task_completed(t)
+                jobs_uptodate = (cnt_jobs_created == 0 and
+                                 t not in task_scheduler.early_released_jobs)
+                t.completed (logger, jobs_uptodate)
+
+                #
+                #   Add extra warning if no regular expressions match:
+                #   This is a common class of frustrating errors
+                #
+                if (jobs_uptodate and
+                    verbose >= 1 and "ruffus_WARNING" in runtime_data and
+                    t.param_generator_func in runtime_data["ruffus_WARNING"]):
+                    for msg in runtime_data["ruffus_WARNING"][t.param_generator_func]:
+                        logger.warning("    'In Task def %s(...):' %s " % (t.get_task_name(), msg))
+
+
+        #
+        #   GeneratorExit is thrown when this generator does not complete.
+        #       I.e. there is a break in the pipeline_run loop.
+        #       This happens where there are exceptions signalled from within a job
+        #
+        #   This is not really an exception, more a way to exit the generator loop
+        #       asynchrononously so that cleanups can happen (e.g. the "with" statement
+        #       or finally.)
+        #
+        #   We could write except Exception: below which will catch everything but
+        #       KeyboardInterrupt and StopIteration and GeneratorExit in python 2.6
+        #
+        #   However, in python 2.5, GeneratorExit inherits from Exception. So
+        #       we explicitly catch and rethrow GeneratorExit.
+        except GeneratorExit:
+            raise
+        except:
+            exceptionType, exceptionValue, exceptionTraceback = sys.exc_info()
+            exception_stack  = traceback.format_exc(exceptionTraceback)
+            exception_name   = exceptionType.__module__ + '.' + exceptionType.__name__
+            exception_value  = str(exceptionValue)
+            if len(exception_value):
+                exception_value = "(%s)" % exception_value
+            errt = RethrownJobError([(t._name,
+                                     "",
+                                     exception_name,
+                                     exception_value,
+                                     exception_stack)])
+            errt.specify_task(t, "Exceptions generating parameters")
+            raise errt
+
+
+    #_____________________________________________________________________________________
+
+    #   parameter_generator
+
+    #_____________________________________________________________________________________
+    def parameter_generator():
+        """
+        Jobs of the ready task which comes first (see t_ready_task_scheduler)
+            Tasks which become ready later take over if they come before
+            the tasks whose jobs are being generated
+        """
+        log_at_level (logger, 10, verbose, "   job_parameter_generator BEGIN")
+
+        # heap of (scheduling order of task, jobs of task)
+        tasks_being_generated = []
+        while task_scheduler.has_incomplete_tasks():
+            #
+            #   Only tasks whose parents have all completed are ever on the ready queue
+            #
+            while task_scheduler.has_ready_tasks():
+                scheduling_order, t = task_scheduler.pop_ready_task()
+                heapq.heappush(tasks_being_generated, (scheduling_order, task_jobs(t)))
+
+            if len(tasks_being_generated):
+                scheduling_order, jobs = tasks_being_generated[0]
+                try:
+                    yield jobs.next()
+                except StopIteration:
+                    heapq.heappop(tasks_being_generated)
+                continue
+
+
+            # wait for jobs in progress to complete before more tasks become ready
+            if task_scheduler.has_incomplete_tasks():
+                log_at_level (logger, 10, verbose, "    incomplete tasks = " +
+                                       ",".join([t._name for t in task_scheduler.incomplete_tasks] ))
+                yield waiting_for_more_tasks_to_complete()
+
+        yield all_tasks_complete()
+        # This function is done
+        log_at_level (logger, 10, verbose, "   job_parameter_generator END")
+
+    #_____________________________________________________________________________________
+
+    #   retry_job
+
+    #_____________________________________________________________________________________
+    def retry_job (t, param, job_name):
+        """
+        The failed job, to be run again (See @retry)
+        """
+        return make_job(t, param, job_name)
+
+    def ready_job (job):
+        """
+        The job once the upstream jobs run by other shards have made its inputs,
+            None while it has to wait for them (See t_job_dispatcher),
+            or after shard_wait_seconds, the job failing with MissingInputFileError
+        """
+        job_index = job[-1]
+        if job_index not in jobs_waiting_for_shards:
+            return job
+        input_files, upstream_jobs, give_up_time = jobs_waiting_for_shards[job_index]
+        upstream_jobs = [(parent, parent_param) for parent, parent_param in upstream_jobs
+                            if not is_made_by_other_shard(parent, parent_param)]
+        if not len(upstream_jobs):
+            del jobs_waiting_for_shards[job_index]
+            return job
+        jobs_waiting_for_shards[job_index] = (input_files, upstream_jobs, give_up_time)
+        if time.time() < give_up_time:
+            return None
+        del jobs_waiting_for_shards[job_index]
+        job = list(job)
+        job[3] = functools.partial(job_wrapper_inputs_not_made, input_files,
+                                   shard_wait_seconds, job[3])
+        return tuple(job)
+
+    return parameter_generator, make_jobs_downstream_of, retry_job, ready_job
+
+
+
+#_________________________________________________________________________________________
+#
+#   t_job_dispatcher
+#
+#________________________________________________________________________________________
+class t_job_dispatcher(object):
+    """
+    Hands job parameters to the (process) pool as soon as they are available
+
+        The pool takes its parameters from feed(), which blocks on the job queue
+            (no polling) until a job is queued or the dispatcher is closed.
+
+        The main loop calls job_completed() for each retired job and then fill()
+            to keep (max_jobs_in_flight) jobs queued or running.
+            Counting jobs in flight explicitly replaces guessing from the queue size.
+
+        Queued jobs are handed out highest job_priority(job) first,
+            otherwise in the order they were queued
+
+        With a resource_pool, jobs wait until the resources they need
+            (job_resources(job)) are free (See start_waiting_jobs)
+
+        Jobs to be run again after a pause (See @retry) wait here, not in the pool,
+            and are queued by a timer thread once the pause is over (See queue_job_after)
+            They hold no process, job slot or resources in the meantime.
+
+        Likewise, jobs for which ready_job(job) returns None, e.g. because their inputs
+            are still being made by other shards, wait here and are asked again every
+            ready_poll_interval seconds. ready_job may also return a changed job to queue
+    """
     #
-    #   N.B.
-    #   Handling keyboard shortcuts may require
-    #       See http://stackoverflow.com/questions/1408356/keyboard-interrupts-with-pythons-multiprocessing-pool
-    #
-    #   When waiting for a condition in threading.Condition.wait(), KeyboardInterrupt is never sent
-    #       unless a timeout is specified
+    #   How many jobs can wait for resources, and be overtaken by
+    #       smaller jobs which come after
     #
+    max_jobs_waiting    = 64
+    max_overtaken       = 64
+
+    def __init__ (self, job_parameters, max_jobs_in_flight, logger, verbose, job_priority = None,
+                  resource_pool = None, job_resources = None, ready_job = None,
+                  ready_poll_interval = 1.0):
+        self.job_parameters         = job_parameters
+        self.max_jobs_in_flight     = max(max_jobs_in_flight, 1)
+        self.logger                 = logger
+        self.verbose                = verbose
+        self.job_priority           = job_priority
+        self.jobs_queue             = PriorityQueue()
+        self.queue_order            = itertools.count()
+        self.cnt_jobs_in_flight     = 0
+        self.closed                 = False
+
+        # list of [priority, queue order, job, resources, count overtaken]
+        self.resource_pool          = resource_pool
+        self.job_resources          = job_resources
+        self.jobs_waiting           = []
+        self.resources_by_job_index = dict()
+        self.no_more_jobs           = False
+
+        # heap of (time ready, queue order, job) and the timer for the first
+        self.jobs_delayed           = []
+        self.delay_timer            = None
+        self.ready_job              = ready_job
+        self.ready_poll_interval    = ready_poll_interval
+        # queue_job_after() queues jobs from the timer thread
+        self.lock                   = threading.RLock()
+
+    #_____________________________________________________________________________________
+
+    #   fill
+
+    #_____________________________________________________________________________________
+    def fill (self):
+        """
+        Queue jobs until
+            1) there are enough jobs queued or running, or
+            2) no more jobs can be created until jobs in progress complete
+               (waiting_for_more_tasks_to_complete), or
+            3) all tasks are complete
+        """
+        log_at_level (self.logger, 10, self.verbose, "    t_job_dispatcher.fill START")
+        with self.lock:
+            self.start_waiting_jobs()
+            while (not self.closed and not self.no_more_jobs and
+                   self.cnt_jobs_in_flight < self.max_jobs_in_flight and
+                   len(self.jobs_waiting) < self.max_jobs_waiting):
+                param = self.job_parameters.next()
+
+                # stop if no more jobs available
+                if isinstance(param, waiting_for_more_tasks_to_complete):
+                    log_at_level (self.logger, 10, self.verbose, "    t_job_dispatcher.fill WAITING for task to complete")
+                    break
+
+                if isinstance(param, all_tasks_complete):
+                    self.no_more_jobs = True
+                    break
+
+                log_at_level (self.logger, 10, self.verbose, "    t_job_dispatcher.fill=>%s", param[0])
+                self.queue_job(param)
+
+            # after jobs still waiting for resources or to be run again
+            if self.no_more_jobs and not len(self.jobs_waiting) and not len(self.jobs_delayed):
+                self.close()
+        log_at_level (self.logger, 10, self.verbose, "    t_job_dispatcher.fill END")
+
+    #_____________________________________________________________________________________
+
+    #   queue_job
+
+    #_____________________________________________________________________________________
+    def queue_job (self, param):
+        """
+        Queue job made outside job_parameters,
+            e.g. started as soon as its upstream job completed
+        """
+        if self.ready_job != None:
+            ready_job = self.ready_job(param)
+            if ready_job == None:
+                self.queue_job_after(param, self.ready_poll_interval)
+                return
+            param = ready_job
+        if self.job_priority == None:
+            priority = (0, 0)
+        else:
+            priority, path_length = self.job_priority(param)
+            priority = (-priority, -path_length)
+        with self.lock:
+            if self.resource_pool == None:
+                self.cnt_jobs_in_flight += 1
+                self.jobs_queue.put((priority, self.queue_order.next(), param))
+            else:
+                self.jobs_waiting.append([priority, self.queue_order.next(), param,
+                                          self.job_resources(param), 0])
+                self.start_waiting_jobs()
+
+    #_____________________________________________________________________________________
+
+    #   queue_job_after / queue_delayed_jobs
+
+    #_____________________________________________________________________________________
+    def queue_job_after (self, param, seconds):
+        """
+        Queue job once seconds have passed
+        """
+        with self.lock:
+            heapq.heappush(self.jobs_delayed, (time.time() + seconds, self.queue_order.next(), param))
+            self.start_delay_timer()
+
+    def start_delay_timer (self):
+        """
+        Wake up when the first delayed job is ready
+        """
+        if self.delay_timer != None:
+            self.delay_timer.cancel()
+            self.delay_timer = None
+        if len(self.jobs_delayed):
+            self.delay_timer = threading.Timer(max(self.jobs_delayed[0][0] - time.time(), 0),
+                                               self.queue_delayed_jobs)
+            self.delay_timer.daemon = True
+            self.delay_timer.start()
+
+    def queue_delayed_jobs (self):
+        with self.lock:
+            if self.closed:
+                return
+            while len(self.jobs_delayed) and self.jobs_delayed[0][0] <= time.time():
+                ready_time, queue_order, param = heapq.heappop(self.jobs_delayed)
+                self.queue_job(param)
+            self.start_delay_timer()
+
+    #_____________________________________________________________________________________
+
+    #   start_waiting_jobs
+
+    #_____________________________________________________________________________________
+    def start_waiting_jobs (self):
+        """
+        Queue waiting jobs whose resources are free, in order,
+            so that smaller jobs fill the gaps around larger ones (backfill).
+
+            A job which has been overtaken max_overtaken times keeps the
+                resources which are freed for itself
+        """
+        if not len(self.jobs_waiting):
+            return
+        self.jobs_waiting.sort()
+        still_waiting = []
+        keep_resources = False
+        for waiting in self.jobs_waiting:
+            priority, queue_order, param, resources, cnt_overtaken = waiting
+            if (keep_resources or self.cnt_jobs_in_flight >= self.max_jobs_in_flight or
+                not self.resource_pool.fits(resources)):
+                still_waiting.append(waiting)
+                keep_resources = keep_resources or cnt_overtaken >= self.max_overtaken
+                continue
+
+            self.resource_pool.reserve(resources)
+            self.resources_by_job_index[param[-1]] = resources
+            self.cnt_jobs_in_flight += 1
+            self.jobs_queue.put((priority, queue_order, param))
+            for overtaken in still_waiting:
+                overtaken[4] += 1
+        self.jobs_waiting = still_waiting
+
+    #_____________________________________________________________________________________
+
+    #   has_queued_jobs
+
+    #_____________________________________________________________________________________
+    def has_queued_jobs (self):
+        """
+        Whether feed() would return without blocking
+        """
+        return not self.jobs_queue.empty()
+
+    #_____________________________________________________________________________________
+
+    #   job_completed
+
+    #_____________________________________________________________________________________
+    def job_completed (self, job_index):
+        with self.lock:
+            self.cnt_jobs_in_flight -= 1
+            if job_index in self.resources_by_job_index:
+                self.resource_pool.release(self.resources_by_job_index.pop(job_index))
+
+    #_____________________________________________________________________________________
+
+    #   close
+
+    #_____________________________________________________________________________________
+    def close (self):
+        """
+        No more jobs will be queued: feed() stops once the queue has been drained
+            Jobs waiting to be run again are dropped
+        """
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.jobs_waiting = []
+                self.jobs_delayed = []
+                self.start_delay_timer()
+                # after any jobs still queued
+                self.jobs_queue.put(((float("inf"),), self.queue_order.next(), all_tasks_complete()))
+
+    #_____________________________________________________________________________________
+
+    #   cancel
+
+    #_____________________________________________________________________________________
+    def cancel (self):
+        """
+        Drop jobs which are queued but not yet handed out, then close()
+            Any end of queue marker is dropped too, and put back by close()
+        """
+        with self.lock:
+            while 1:
+                try:
+                    self.jobs_queue.get_nowait()
+                except QueueEmpty:
+                    break
+            self.closed = False
+            self.close()
+
+    #_____________________________________________________________________________________
+
+    #   feed
+
+    #_____________________________________________________________________________________
+    def feed (self):
+        """
+        Process pool gets its parameters from this generator
+        """
+        log_at_level (self.logger, 10, self.verbose, "   Send param to Pooled Process START")
+        while 1:
+            # blocks until a job is available
+            #   with timeout so that KeyboardInterrupt is not blocked
+            priority, queue_order, param = self.jobs_queue.get(True, 1e6)
+
+            # all tasks done
+            if isinstance(param, all_tasks_complete):
+                break
+
+            log_at_level (self.logger, 10, self.verbose, "   Send param to Pooled Process=>%s", param[0])
+            yield param
+
+        log_at_level (self.logger, 10, self.verbose, "   Send param to Pooled Process END")
+
+
+#
+#   How the job queue works:
+#
+#   Main loop
+#       iterates pool.map using job_dispatcher.feed()
+#       (blocks on job_dispatcher.jobs_queue.get() until all_tasks_complete)
+#
+#           if errors but want to finish tasks already in pipeine:
+#               job_dispatcher.close()
+#               keep going
+#        else:
+#
+#            loops through jobs until no more jobs in non-dependent tasks
+#               tasks are taken from the ready queue of task_scheduler
+#               tasks are released onto the ready queue when their last parent
+#               task completes (task_scheduler.task_completed)
+#
+#               job_dispatcher.fill()
+#               until waiting_for_more_tasks_to_complete
+#               until (max_jobs_in_flight) jobs are queued or running
+#
+
+#_________________________________________________________________________________________
+
+#   pipeline_run
+
+#_________________________________________________________________________________________
+def pipeline_run(target_tasks = [], forcedtorun_tasks = [], multiprocess = 1, logger = stderr_logger,
+                 gnu_make_maximal_rebuild_mode  = True, verbose = 1,
+                 runtime_data = None, one_second_per_job = True, touch_files_only = False,
+                 exceptions_terminate_immediately = False, log_exceptions = False,
+                 job_level_dependencies = False, executor = None, multithread = 0,
+                 history_file = None, checksums = False, uptodate_check_threads = 0,
+                 glob_cache_file = None, priority_policy = None, resources = None,
+                 claims_dir = None, shard = None, in_memory_limit = 100 * 1024 * 1024):
+    """
+    Run pipelines.
+
+    :param target_tasks: targets task functions which will be run if they are out-of-date
+    :param forcedtorun_tasks: task functions which will be run whether or not they are out-of-date
+    :param multiprocess: The number of concurrent jobs
+    :param logger: Where progress will be logged. Defaults to stderr output.
+    :type logger: `logging <http://docs.python.org/library/logging.html>`_ objects
+    :param gnu_make_maximal_rebuild_mode: Defaults to re-running *all* out-of-date tasks. Runs minimal
+                                          set to build targets if set to ``True``. Use with caution.
+    :param verbose: level 0 : nothing
+                    level 1 : logs task names and warnings
+                    level 2 : logs task description if exists
+                    level 3 : logs job names for jobs to be run
+                    level 4 : logs list of up-to-date tasks and job names for jobs to be run
+                    level 5 : logs job names for all jobs whether up-to-date or not
+                    level 10: logs messages useful only for debugging ruffus pipeline code
+    :param runtime_data: Experimental feature for passing data to tasks at run time
+    :param one_second_per_job: Defaults to (true) forcing jobs to take a minimum of 1 second to complete
+    :param touch_file_only: Create or update input/output files only to simulate running the pipeline. Do not run jobs
+    :param job_level_dependencies: Start each job of a @transform as soon as the upstream job
+                                   making its input has completed, rather than waiting for the
+                                   whole upstream task. @split, @merge and @collate remain barriers.
+    :param executor: How jobs are run concurrently:
+                     ``"processes"`` : a pool of ``multiprocess`` processes (the default)
+                     ``"threads"``   : a pool of ``multithread`` threads in this process.
+                                       Suitable for jobs which mostly wait on
+                                       external programs or I/O.
+                                       Parameters are not pickled.
+                     ``"coroutines"``: up to ``multiprocess`` jobs at the same time in this thread.
+                                       Task functions which are generators are run
+                                       cooperatively, each waiting on whatever it yields
+                                       (e.g. ``subprocess.Popen``).
+                                       Other task functions run one at a time.
+                     or a ``t_executor`` object, e.g.
+                     ``t_socket_executor(("", 9999))`` : jobs are run by ``ruffus-worker``
+                                       processes which connect over the network.
+                                       ``multiprocess`` jobs are handed out at a time.
+                                       The executor is not closed afterwards, and
+                                       can be reused by later pipeline runs.
+    :param multithread: The number of concurrent jobs when running jobs in threads.
+                        Implies ``executor = "threads"``
+    :param history_file: SQLite database recording the order in which jobs completed.
+                         Jobs are up to date if their output was made after their input,
+                         without comparing file modification times.
+                         ``one_second_per_job`` is then unnecessary and ignored.
+    :param checksums: Tasks which would check file modification times instead check whether
+                      the contents of their input files have changed since their output was made
+                      (See ``needs_update_check_checksum``).
+                      Checksums are saved in ``history_file`` (default ``".ruffus_history.sqlite"``)
+    :param uptodate_check_threads: Check whether jobs are up to date in this many threads at once.
+                                   Speeds up tasks with very many jobs on slow (e.g. network) file systems.
+                                   ``@check_if_uptodate`` functions must then be thread safe.
+    :param glob_cache_file: Save the directory listings used to match glob patterns in this file,
+                            for reuse by later runs while the directories are unchanged.
+    :param priority_policy: Which jobs to start first when several are ready to run:
+                            ``None``            : Tasks with the highest ``@priority``,
+                                                  otherwise in the order they became ready
+                            ``"critical_path"`` : Then jobs with the longest path through the
+                                                  rest of the pipeline. Jobs count for as long as
+                                                  they took in previous runs, recorded in
+                                                  ``history_file``. Otherwise each task counts the same.
+    :param resources: Amounts of each resource available, e.g. ``{"cpus" : 16, "mem" : 64}``.
+                      Jobs are only started if there is enough left of each resource they need
+                      (See ``@resources``). Jobs of tasks without ``@resources`` need one cpu.
+                      Smaller jobs can start while larger ones wait for resources.
+                      ``multiprocess`` still limits the number of jobs running at once.
+    :param claims_dir: Share jobs with copies of this pipeline started at the same time
+                       on other hosts, through claim files in this (shared) directory,
+                       e.g. ``".ruffus/claims"``. Each job is run by whichever copy
+                       claims it first. The others wait for it to finish.
+    :param shard: ``(i, N)`` : Run only the i-th of N shares of the jobs of each task,
+                  so that N copies of this pipeline, e.g. on N hosts, together run all of them.
+                  Jobs are shared out by a hash of their output file names.
+                  @split, @merge, @collate and tasks downstream of @split run whole on shard ``0``.
+                  Jobs wait for the upstream jobs of other shards to make their inputs
+                  (for up to ``ruffus.task.shard_wait_seconds``, a day by default).
+    :param in_memory_limit: Bytes of (pickled) values returned by jobs of ``@in_memory`` tasks
+                            to keep in memory. Further values are saved to temporary files
+                            until the end of the run.
+
+    """
+    if executor == None:
+        executor = "threads" if multithread else "processes"
+    if (not isinstance(executor, t_executor) and
+        executor not in ("processes", "threads", "coroutines")):
+        raise Exception("pipeline_run parameter executor should be "
+                        "one of \"processes\", \"threads\", \"coroutines\" "
+                        "or a t_executor object")
+    if executor == "threads":
+        multiprocess = multithread or multiprocess
+    if priority_policy not in (None, "critical_path"):
+        raise Exception("pipeline_run parameter priority_policy should be "
+                        "None or \"critical_path\"")
+    if resources != None and not isinstance(resources, dict):
+        raise Exception("pipeline_run parameter resources should be a dictionary of "
+                        "the amount of each resource available.")
+    if shard != None:
+        if (not isinstance(shard, (tuple, list)) or len(shard) != 2 or
+            not all(isinstance(i, (int, long)) for i in shard) or
+            not 0 <= shard[0] < shard[1]):
+            raise Exception("pipeline_run parameter shard should be (i, N), "
+                            "with 0 <= i < N, to run the i-th of N shares of the jobs.")
+        shard = tuple(shard)
+
+    if runtime_data == None:
+        runtime_data = {}
+    if not isinstance(runtime_data, dict):
+        raise Exception("pipeline_run parameter runtime_data should be a dictionary of "
+                        "values passes to jobs at run time.")
+
     #
+    #   Outputs of jobs which are cancelled are removed if written after this
+    #       (whole seconds, for file systems with coarse modification times)
     #
-    #   #
-    #   #   whether using multiprocessing
-    #   #
-    #   pool = Pool(multiprocess) if multiprocess > 1 else None
-    #   if pool:
-    #       pool_func = pool.imap_unordered
-    #       job_iterator_timeout = []
-    #   else:
-    #       pool_func = imap
-    #       job_iterator_timeout = [999999999999]
+    run_start_time = int(time.time())
+
+    if verbose == 0:
+        logger = black_hole_logger
+    elif verbose >= 11:
+        if hasattr(logger, "add_unique_prefix"):
+            logger.add_unique_prefix()
+
+    if touch_files_only and verbose >= 1:
+        logger.info("Touch output files instead of remaking them.")
+
+    link_task_names_to_functions ()
+
+    # prepare tasks for pipeline run
+    #    **********
+    #      BEWARE
+    #    **********
     #
+    #    Because state is stored, ruffus is *not* reentrant.
     #
-    #   ....
+    #    **********
+    #      BEWARE
+    #    **********
+    init_tasks_for_pipeline ()
+
     #
+    #   remember which files exist and their modification times until they are
+    #       written by jobs
     #
-    #   it = pool_func(run_pooled_job_without_exceptions, feed_job_params_to_process_pool())
-    #   while 1:
-    #      try:
-    #          job_result = it.next(*job_iterator_timeout)
+    stat_cache.start()
+    glob_cache.start(glob_cache_file)
+    data_store.start(in_memory_limit)
+
     #
-    #          ...
+    #   Everything set up from here on is undone in the finally clause below,
+    #       also when setting up fails, e.g. on missing input files for the
+    #       jobs of the first task
     #
-    #      except StopIteration:
-    #          break
+    uptodate_checker = None
+    local_executor = None
+    wrapping_executors = []
+    try:
+        #
+        #   jobs completion order replaces waiting for file modification times to differ
+        #
+        job_history.close()
+        if history_file == None and (checksums or any_task_uses_checksums()):
+            history_file = default_history_file_name
+        if history_file:
+            job_history.open(history_file)
+            job_history.use_checksums = checksums
+            one_second_per_job = False
 
+        uptodate_checker = t_uptodate_checker(uptodate_check_threads)
 
+        #
+        #   target jobs
+        #
+        target_tasks = task_names_to_tasks ("Target", target_tasks)
+        forcedtorun_tasks = task_names_to_tasks ("Forced to run", forcedtorun_tasks)
 
-    #
-    #   whether using multiprocessing
-    #
-    pool = Pool(multiprocess) if multiprocess > 1 else None
-    if pool:
-        pool_func = pool.imap_unordered
-    else:
-        pool_func = imap
+        (topological_sorted,
+        self_terminated_nodes,
+        dag_violating_edges,
+        dag_violating_nodes) = topologically_sorted_nodes(  target_tasks, forcedtorun_tasks,
+                                                            gnu_make_maximal_rebuild_mode,
+                                                            extra_data_for_signal = t_verbose_logger(verbose, logger, runtime_data,
+                                                                                                     uptodate_checker))
 
+        if len(dag_violating_nodes):
+            dag_violating_tasks = ", ".join(t._name for t in dag_violating_nodes)
 
+            e = error_circular_dependencies("Circular dependencies found in the "
+                                            "pipeline involving one or more of (%s)" %
+                                                (dag_violating_tasks))
+            raise e
 
-    feed_job_params_to_process_pool = feed_job_params_to_process_pool_factory (parameter_q, logger, verbose)
+        #
+        #   Values returned by jobs of @in_memory tasks are only kept by this copy of the pipeline
+        #
+        if claims_dir != None or shard != None:
+            in_memory_tasks = [t._name for t in topological_sorted if t.in_memory]
+            if len(in_memory_tasks):
+                raise InMemoryArgumentError("@in_memory tasks (%s) cannot be shared between copies "
+                                            "of the pipeline with claims_dir or shard" %
+                                            ", ".join(in_memory_tasks))
 
-    #
-    #   for each result from job
-    #
-    job_errors = RethrownJobError()
-    tasks_with_errors = set()
+        #
+        # get dependencies. Only include tasks which will be run
+        #
+        job_durations = None
+        if priority_policy == "critical_path" and job_history.is_open():
+            job_durations = job_history.lookup_job_durations([t._name for t in topological_sorted])
+        task_scheduler = t_ready_task_scheduler(topological_sorted, priority_policy, job_durations)
 
 
 
-    #
-    #   job_result.job_name / job_result.return_value
-    #       Reserved for returning result from job...
-    #       How?
-    #
-    for job_result in pool_func(run_pooled_job_without_exceptions, feed_job_params_to_process_pool()):
-        t = node.lookup_node_from_name(job_result.task_name)
-        count_remaining_jobs[t] = count_remaining_jobs[t] - 1
+        #
+        # prime queue with initial set of job parameters
+        #
+        count_remaining_jobs = defaultdict(int)
+        jobs_in_flight = dict()
+        (parameter_generator,
+         make_jobs_downstream_of,
+         retry_job,
+         ready_job) = make_job_parameter_generator (task_scheduler,
+                                                            logger, forcedtorun_tasks,
+                                                            count_remaining_jobs,
+                                                            jobs_in_flight,
+                                                            runtime_data, verbose,
+                                                            one_second_per_job,
+                                                            touch_files_only,
+                                                            uptodate_checker,
+                                                            shard)
+        job_parameters = parameter_generator()
 
-        last_job_in_task = False
-        if count_remaining_jobs[t] == 0:
-            incomplete_tasks.remove(t)
-            last_job_in_task = True
+        #
+        #   Keep a job waiting for each process so that
+        #       a free process never has to wait for the main loop
+        #   Coroutines start as soon as they are queued
+        #   Prioritised jobs are only queued when a process is free, so that
+        #       jobs which become ready later can still go first
+        #   Jobs only hold resources while they are running
+        #   Copies of the pipeline sharing jobs through claims each need to see all ready jobs
+        #
+        if claims_dir != None:
+            max_jobs_in_flight = sys.maxint
+        elif executor == "coroutines" or priority_policy == "critical_path" or resources != None:
+            max_jobs_in_flight = multiprocess
+        else:
+            max_jobs_in_flight = 2 * multiprocess
+        def job_priority (job):
+            job_index = job[-1]
+            t, param, job_name = jobs_in_flight[job_index]
+            return task_scheduler.job_priority(t, param)
+        def job_resources (job):
+            t, param, job_name = jobs_in_flight[job[-1]]
+            return get_job_resources(t)
+        if resources != None:
+            check_job_resources(topological_sorted, resources)
+            resource_pool = t_resource_pool(resources)
+        else:
+            resource_pool = None
+        job_dispatcher = t_job_dispatcher(job_parameters, max_jobs_in_flight, logger, verbose, job_priority,
+                                          resource_pool, job_resources, ready_job, shard_poll_interval)
+        job_dispatcher.fill()
 
-        elif count_remaining_jobs[t] < 0:
-            raise Exception("Task [%s] job count < 0" % t._name)
+        #
+        #   N.B.
+        #   Handling keyboard shortcuts may require
+        #       See http://stackoverflow.com/questions/1408356/keyboard-interrupts-with-pythons-multiprocessing-pool
+        #
+        #   When waiting for a condition in threading.Condition.wait(), KeyboardInterrupt is never sent
+        #       unless a timeout is specified
+        #
+        #
+        #
+        #   #
+        #   #   whether using multiprocessing
+        #   #
+        #   pool = Pool(multiprocess) if multiprocess > 1 else None
+        #   if pool:
+        #       pool_func = pool.imap_unordered
+        #       job_iterator_timeout = []
+        #   else:
+        #       pool_func = imap
+        #       job_iterator_timeout = [999999999999]
+        #
+        #
+        #   ....
+        #
+        #
+        #   it = pool_func(run_pooled_job_without_exceptions, job_dispatcher.feed())
+        #   while 1:
+        #      try:
+        #          job_result = it.next(*job_iterator_timeout)
+        #
+        #          ...
+        #
+        #      except StopIteration:
+        #          break
 
-        # only save poolsize number of errors
-        if job_result.state == JOB_ERROR:
-            job_errors.append(job_result.exception)
-            tasks_with_errors.add(t)
 
-            #
-            # print to logger immediately
-            #
-            if log_exceptions:
-                logger.error(job_errors.get_nth_exception_str())
 
-            #
-            # break if too many errors
-            #
-            if len(job_errors) >= multiprocess or exceptions_terminate_immediately:
-                break
+        #
+        #   whether using multiprocessing / multithreading
+        #
+        #   Nothing is started if there are no jobs to run (everything up to date)
+        #   Semaphores are only shared between processes if they need to be
+        #
+        job_func = run_pooled_job_without_exceptions
+        use_process_pool = (executor == "processes" and multiprocess > 1 and
+                            job_dispatcher.cnt_jobs_in_flight > 0)
+        if use_process_pool:
+            semaphore_type = multiprocessing.BoundedSemaphore
+        else:
+            semaphore_type = threading.BoundedSemaphore
+        job_limit_semaphores = make_job_limit_semaphores(topological_sorted, semaphore_type)
+        init_job_limit_semaphores(job_limit_semaphores)
+
+        if isinstance(executor, t_executor):
+            local_executor = executor
+            local_executor.set_job_limits(make_job_limit_semaphores(topological_sorted, int))
+        elif job_dispatcher.cnt_jobs_in_flight == 0:
+            local_executor = t_serial_executor()
+        elif executor == "coroutines":
+            local_executor = t_pool_executor(t_coroutine_pool(job_dispatcher.has_queued_jobs))
+            job_func = run_cooperative_job
+        elif multiprocess <= 1:
+            local_executor = t_serial_executor()
+        elif executor == "threads":
+            local_executor = t_pool_executor(ThreadPool(multiprocess))
+        else:
+            local_executor = t_pool_executor(Pool(multiprocess, initializer = init_pool_process,
+                                                  initargs = (job_limit_semaphores,)))
 
+        #
+        #   Run second copies of straggling jobs of @speculative tasks
+        #       (not @split, whose outputs are not known beforehand)
+        #   Only run jobs not claimed by other copies of this pipeline
+        #
+        job_executor = local_executor
+        wrapping_executors = []
+        speculate_after_by_task = dict((t._name, t.speculate_after) for t in topological_sorted
+                                        if t.speculate_after != None and not t.indeterminate_output)
+        if speculate_after_by_task and multiprocess > 1 and not touch_files_only:
+            job_executor = t_speculative_executor(job_executor, speculate_after_by_task, multiprocess)
+            wrapping_executors.append(job_executor)
+        if claims_dir != None:
+            job_executor = t_claim_executor(job_executor, claims_dir, multiprocess)
+            wrapping_executors.append(job_executor)
 
-        # break immediately if the user says stop
-        elif job_result.state == JOB_SIGNALLED_BREAK:
-            job_errors.append(job_result.exception)
-            job_errors.specify_task(t, "Exceptions running jobs")
-            break
 
-        else:
-            if job_result.state == JOB_UP_TO_DATE:
-                if verbose > 1:
-                    logger.info("    %s unnecessary: already up to date" % job_result.job_name)
-            elif verbose:
-                logger.info("    %s completed" % job_result.job_name)
 
         #
-        # Current Task completed
+        #   for each result from job
         #
-        if last_job_in_task:
+        job_errors = RethrownJobError()
+        tasks_with_errors = set()
 
-            t.completed (logger)
+        # number of times each job run again (See @retry) has failed so far
+        cnt_failures_by_job_index = dict()
 
 
-        # make sure queue is still full after each job is retired
-        # do this after undating which jobs are incomplete
-        if len(job_errors):
-            #parameter_q.clear()
-            #if len(job_errors) == 1 and not parameter_q._closed:
-            parameter_q.put(all_tasks_complete())
-        else:
-            fill_queue_with_job_parameters(job_parameters, parameter_q, multiprocess, logger, verbose)
 
+        #
+        #   job_result.return_value of @in_memory tasks is kept for downstream jobs
+        #       (See store_in_memory_values)
+        #
+        interrupted = None
+        try:
+            job_executor.submit(job_func, job_dispatcher.feed())
+            for job_result in job_executor.results():
+                job_dispatcher.job_completed(job_result.job_index)
+                t, param, job_name = jobs_in_flight.pop(job_result.job_index)
+                count_remaining_jobs[t] = count_remaining_jobs[t] - 1
+                cnt_failures = cnt_failures_by_job_index.pop(job_result.job_index, 0)
+
+                #
+                #   Forget cached file information for the output of this job
+                #       The output of @split is not known beforehand
+                #
+                if t.indeterminate_output:
+                    stat_cache.clear()
+                else:
+                    stat_cache.invalidate(get_job_output_files(t, param))
+                    glob_cache.invalidate(get_job_output_files(t, param))
+
+                #
+                #   Run failed jobs again, before their task can be retired (See @retry)
+                #
+                if (job_result.state == JOB_ERROR and not len(job_errors) and
+                    t.retry_policy != None and cnt_failures < t.retry_policy.times and
+                    t.retry_policy.is_retryable(job_result.exception[2])):
+                    cnt_failures += 1
+                    pause_seconds = t.retry_policy.get_delay(cnt_failures)
+                    log_at_level (logger, 1, verbose, "    %s failed with %s%s: run again (%d of %d) in %g seconds",
+                                  job_result.job_name, job_result.exception[2], job_result.exception[3],
+                                  cnt_failures, t.retry_policy.times, pause_seconds)
+                    job = retry_job(t, param, job_result.job_name)
+                    cnt_failures_by_job_index[job[-1]] = cnt_failures
+                    job_dispatcher.queue_job_after(job, pause_seconds)
+                    job_dispatcher.fill()
+                    continue
+
+                #
+                #   Retire task if its last job has completed and there are no more to come
+                #
+                last_job_in_task = False
+                if count_remaining_jobs[t] == 0 and task_scheduler.is_fully_queued(t):
+                    task_scheduler.task_completed(t)
+                    last_job_in_task = True
+
+                elif count_remaining_jobs[t] < 0:
+                    raise Exception("Task [%s] job count < 0" % t._name)
+
+                # only save poolsize number of errors
+                if job_result.state == JOB_ERROR:
+                    job_errors.append(job_result.exception)
+                    tasks_with_errors.add(t)
+
+                    #
+                    # print to logger immediately
+                    #
+                    if log_exceptions:
+                        logger.error(job_errors.get_nth_exception_str())
+
+                    #
+                    # break if too many errors
+                    #
+                    if len(job_errors) >= multiprocess or exceptions_terminate_immediately:
+                        break
+
+
+                # break immediately if the user says stop
+                elif job_result.state == JOB_SIGNALLED_BREAK:
+                    job_errors.append(job_result.exception)
+                    job_errors.specify_task(t, "Exceptions running jobs")
+                    break
+
+                else:
+                    if job_result.state == JOB_UP_TO_DATE:
+                        if verbose > 1:
+                            logger.info("    %s unnecessary: already up to date" % job_result.job_name)
+                    elif verbose:
+                        logger.info("    %s completed" % job_result.job_name)
+
+                    if job_result.state == JOB_COMPLETED and t.in_memory:
+                        store_in_memory_values(t, param, job_result.return_value)
+
+                    if job_result.state == JOB_COMPLETED and job_history.is_open():
+                        if not t.in_memory:
+                            job_history.record_job(get_job_output_files(t, param))
+                        if not touch_files_only and job_result.duration != None:
+                            job_history.record_job_duration(t._name, task_scheduler.job_key(param),
+                                                            job_result.duration)
+                        if uses_checksums(t) and len(param) >= 2 and not t.in_memory:
+                            job_history.record_input_checksums(get_strings_in_nested_sequence(param[1]),
+                                                               get_strings_in_nested_sequence(param[0]))
+
+                    #
+                    #   Start downstream jobs which are only waiting for the output of this job
+                    #
+                    if job_level_dependencies and not len(job_errors):
+                        for job, pause_seconds in make_jobs_downstream_of(t, param):
+                            if pause_seconds:
+                                job_dispatcher.queue_job_after(job, pause_seconds)
+                            else:
+                                job_dispatcher.queue_job(job)
+
+                #
+                # Current Task completed
+                #
+                if last_job_in_task:
+
+                    t.completed (logger)
+
+                    #
+                    #   The output of @split is only known now
+                    #
+                    if t.indeterminate_output and job_history.is_open() and t not in tasks_with_errors:
+                        job_history.record_job(get_strings_in_nested_sequence(t.get_output_files(False, runtime_data)))
 
 
+                # make sure queue is still full after each job is retired
+                # do this after undating which jobs are incomplete
+                if len(job_errors):
+                    job_dispatcher.close()
+                else:
+                    job_dispatcher.fill()
 
+        #
+        #   Ctrl-C, or errors in running the pipeline itself, e.g. missing input files
+        #       found while making the parameters of the next jobs:
+        #       passed on once the jobs in flight have been cancelled
+        #
+        except:
+            interrupted = sys.exc_info()
+
+        #
+        #   Stop jobs which are still queued or running if the pipeline stopped early,
+        #       and remove any output they have partly written.
+        #   (Not under claims_dir, where jobs might be running on other hosts)
+        #
+        cancelled_jobs = []
+        if len(jobs_in_flight):
+            job_dispatcher.cancel()
+            job_executor.cancel()
+            for job_index in sorted(jobs_in_flight):
+                t, param, job_name = jobs_in_flight.pop(job_index)
+                cancelled_jobs.append(str(job_name))
+                log_at_level (logger, 1, verbose, "    %s cancelled", job_name)
+                if claims_dir == None:
+                    remove_partial_job_outputs(t, param, run_start_time, logger, verbose)
+        job_errors.cancelled_jobs = cancelled_jobs
+        if interrupted and isinstance(interrupted[1], RethrownJobError):
+            interrupted[1].cancelled_jobs = cancelled_jobs
+
+    finally:
+        for wrapping_executor in reversed(wrapping_executors):
+            wrapping_executor.close()
+        if local_executor not in (None, executor):
+            local_executor.close()
+        if uptodate_checker != None:
+            uptodate_checker.close()
+        log_at_level (logger, 5, verbose, stat_cache.get_summary())
+        log_at_level (logger, 5, verbose, glob_cache.get_summary())
+        stat_cache.stop()
+        glob_cache.stop(glob_cache_file)
+        data_store.stop()
+        job_history.close()
+
+    if interrupted:
+        raise interrupted[0], interrupted[1], interrupted[2]
     if len(job_errors):
         raise job_errors
 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_glob_cache.py
+
+        Times matching glob patterns, one per job, against a directory with many files,
+            using glob.glob() and the cached directory listings used by ruffus
+
+        use :
+            --files_count N         number of files in the directory (default 20000)
+            --globs_count N         number of glob patterns (default 200)
+
+"""
+import sys, os, time, shutil, glob
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus.file_cache import t_glob_cache
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--files_count", dest="files_count", type="int", default = 20000,
+                  help="Number of files in the directory.")
+parser.add_option("--globs_count", dest="globs_count", type="int", default = 200,
+                  help="Number of glob patterns.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_glob_cache_dir/"
+if os.path.exists(tempdir):
+    shutil.rmtree(tempdir)
+os.makedirs(tempdir)
+for i in range(options.files_count):
+    open(tempdir + "%d.input" % i, "w")
+mtime = int(time.time()) - 100
+os.utime(tempdir, (mtime, mtime))
+
+patterns = [tempdir + "%d.*" % i for i in range(options.globs_count)]
+
+start = time.time()
+for pattern in patterns:
+    glob.glob(pattern)
+print "glob.glob()                  %8.2f s" % (time.time() - start)
+
+glob_cache = t_glob_cache()
+glob_cache.start()
+start = time.time()
+for pattern in patterns:
+    glob_cache.glob(pattern)
+print "t_glob_cache.glob()          %8.2f s" % (time.time() - start)
+
+start = time.time()
+for pattern in patterns:
+    glob_cache.glob(pattern)
+print "t_glob_cache.glob() again    %8.2f s" % (time.time() - start)
+
+shutil.rmtree(tempdir)
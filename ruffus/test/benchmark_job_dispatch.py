@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_job_dispatch.py
+
+        Runs a large number of jobs which do nothing and reports
+            the number of jobs dispatched per second
+
+        use :
+            -j N / --jobs N         to specify multitasking
+            --jobs_count N          number of no-op jobs (default 100000)
+            --threads               run jobs in threads rather than processes
+
+"""
+import sys, os, time
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("-j", "--jobs", dest="jobs", type="int", default = 1,
+                  help="Allow N jobs (commands) to run simultaneously.")
+parser.add_option("--jobs_count", dest="jobs_count", type="int", default = 100000,
+                  help="Number of no-op jobs to run.")
+parser.add_option("--threads", dest="threads", action="store_true", default = False,
+                  help="Run jobs in threads rather than processes.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+@parallel([[i] for i in range(options.jobs_count)])
+def no_op_job (i):
+    pass
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+executor = "threads" if options.threads else "processes"
+start = time.time()
+pipeline_run([no_op_job], multiprocess = options.jobs, verbose = 0, executor = executor)
+elapsed = time.time() - start
+print "%d no-op jobs with %d %s in %.2f seconds: %.0f jobs per second" % (
+            options.jobs_count, options.jobs, executor, elapsed, options.jobs_count / elapsed)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_job_planning.py
+
+        Times how long it takes to plan (generate the parameters for) all jobs
+            in a chain of @transform tasks with many jobs each:
+
+            1) pipeline_printout of every job in the pipeline
+            2) pipeline_run when all jobs are up to date
+            3) pipeline_run(touch_files_only = True), dominated by touching files
+
+        use :
+            --jobs_count N          number of jobs per task (default 20000)
+
+"""
+import sys, os, time, shutil
+import StringIO
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--jobs_count", dest="jobs_count", type="int", default = 20000,
+                  help="Number of jobs per task.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_job_planning_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.1" % i] for i in range(options.jobs_count)])
+def task1 (i, o):
+    pass
+
+@transform(task1, regex(r"(.+)\.1"), r"\1.2")
+def task2 (i, o):
+    pass
+
+@transform(task2, regex(r"(.+)\.2"), r"\1.3")
+def task3 (i, o):
+    pass
+
+@transform(task3, regex(r"(.+)\.3"), r"\1.4")
+def task4 (i, o):
+    pass
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+if os.path.exists(tempdir):
+    shutil.rmtree(tempdir)
+
+start = time.time()
+pipeline_printout(StringIO.StringIO(), [task4], verbose = 5)
+print "pipeline_printout                          %8.2f s" % (time.time() - start)
+
+start = time.time()
+pipeline_run([task4], verbose = 0, touch_files_only = True, one_second_per_job = False)
+touch_files_time = time.time() - start
+
+start = time.time()
+pipeline_run([task4], verbose = 0)
+print "pipeline_run (up to date)                  %8.2f s" % (time.time() - start)
+print "pipeline_run(touch_files_only = True)      %8.2f s" % touch_files_time
+
+shutil.rmtree(tempdir)
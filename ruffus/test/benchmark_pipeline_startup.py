@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_pipeline_startup.py
+
+        Times pipeline_run for a small pipeline which is already up to date,
+            and for the same pipeline with jobs to run,
+            against the cost of starting a multiprocessing.Manager()
+            (previously started by every pipeline_run)
+
+        use :
+            -j N / --jobs N         to specify multitasking (default 4)
+            --repeats N             number of times to run each (default 10)
+
+"""
+import sys, os, time, shutil
+import multiprocessing
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("-j", "--jobs", dest="jobs", type="int", default = 4,
+                  help="Allow N jobs (commands) to run simultaneously.")
+parser.add_option("--repeats", dest="repeats", type="int", default = 10,
+                  help="Number of times to run each pipeline.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_pipeline_startup_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(4)])
+def make_start (i, o):
+    open(o, "w")
+
+@transform(make_start, suffix(".start"), ".limited")
+@jobs_limit(2)
+def limited_jobs (i, o):
+    open(o, "w")
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+def time_pipeline_run (remove_files):
+    elapsed = 0.0
+    for i in range(options.repeats):
+        if remove_files and os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        start = time.time()
+        pipeline_run([limited_jobs], multiprocess = options.jobs, verbose = 0,
+                     one_second_per_job = False)
+        elapsed += time.time() - start
+    return elapsed * 1000 / options.repeats
+
+def time_manager_start ():
+    elapsed = 0.0
+    for i in range(options.repeats):
+        start = time.time()
+        manager = multiprocessing.Manager()
+        manager.BoundedSemaphore(2)
+        manager.shutdown()
+        elapsed += time.time() - start
+    return elapsed * 1000 / options.repeats
+
+print "multiprocessing.Manager() start        %8.1f ms" % time_manager_start()
+print "pipeline_run with jobs to run          %8.1f ms" % time_pipeline_run(True)
+print "pipeline_run already up to date        %8.1f ms" % time_pipeline_run(False)
+shutil.rmtree(tempdir)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_priority.py
+
+        Times a skewed pipeline, in which many short independent jobs are ready
+            at the same time as the start of a chain of long jobs,
+            with and without pipeline_run(priority_policy = "critical_path")
+
+        Each run starts from scratch. The first run records job durations
+            in the job history
+
+        use :
+            --processes N           number of processes (default 4)
+            --short_jobs N          number of short jobs (default 40)
+            --seconds SECONDS       length of short jobs (default 0.1)
+
+"""
+import sys, os, time, shutil
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--processes", dest="processes", type="int", default = 4,
+                  help="Number of processes.")
+parser.add_option("--short_jobs", dest="short_jobs", type="int", default = 40,
+                  help="Number of short jobs.")
+parser.add_option("--seconds", dest="seconds", type="float", default = 0.1,
+                  help="Length of short jobs. Each of the 3 long jobs is 10 times longer.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_priority_dir/"
+history_file = "benchmark_priority.sqlite"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%03d.short" % i] for i in range(options.short_jobs)])
+def short (i, o):
+    time.sleep(options.seconds)
+    open(o, "w")
+
+@follows(mkdir(tempdir))
+@files(None, tempdir + "chain.1")
+def long1 (i, o):
+    time.sleep(options.seconds * 10)
+    open(o, "w")
+
+@transform(long1, suffix(".1"), ".2")
+def long2 (i, o):
+    time.sleep(options.seconds * 10)
+    open(o, "w")
+
+@transform(long2, suffix(".2"), ".3")
+def long3 (i, o):
+    time.sleep(options.seconds * 10)
+    open(o, "w")
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+for f in (tempdir, history_file):
+    if os.path.isdir(f):
+        shutil.rmtree(f)
+    elif os.path.exists(f):
+        os.unlink(f)
+
+#
+#   start from scratch each time, keeping the job history
+#
+for priority_policy in (None, "critical_path", None, "critical_path"):
+    if os.path.exists(tempdir):
+        shutil.rmtree(tempdir)
+    start = time.time()
+    pipeline_run([short, long3], verbose = 0, multiprocess = options.processes,
+                 history_file = history_file, priority_policy = priority_policy)
+    print ("priority_policy = %-16s    makespan %6.2f s" %
+            (priority_policy, time.time() - start))
+
+shutil.rmtree(tempdir)
+os.unlink(history_file)
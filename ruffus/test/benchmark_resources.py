@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_resources.py
+
+        Times a pipeline of a few jobs needing 4 cpus each and many jobs needing 1 cpu,
+            on a simulated machine with 8 cpus:
+
+            multiprocess = 2                        : never oversubscribes the machine
+            resources = {"cpus" : 8}, multiprocess = 8  : jobs packed by the cpus they need
+
+        use :
+            --big_jobs N            number of 4 cpu jobs (default 4)
+            --small_jobs N          number of 1 cpu jobs (default 32)
+            --seconds SECONDS       length of each job (default 0.2)
+
+"""
+import sys, os, time, shutil
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--big_jobs", dest="big_jobs", type="int", default = 4,
+                  help="Number of 4 cpu jobs.")
+parser.add_option("--small_jobs", dest="small_jobs", type="int", default = 32,
+                  help="Number of 1 cpu jobs.")
+parser.add_option("--seconds", dest="seconds", type="float", default = 0.2,
+                  help="Length of each job.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_resources_dir/"
+
+@follows(mkdir(tempdir))
+@resources(cpus = 4)
+@files([[None, tempdir + "%03d.big" % i] for i in range(options.big_jobs)])
+def big (i, o):
+    time.sleep(options.seconds)
+    open(o, "w")
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%03d.small" % i] for i in range(options.small_jobs)])
+def small (i, o):
+    time.sleep(options.seconds)
+    open(o, "w")
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+for description, extra_options in (("multiprocess = 2",
+                                        {"multithread" : 2}),
+                                   ("resources = {\"cpus\" : 8}, multiprocess = 8",
+                                        {"multithread" : 8, "resources" : {"cpus" : 8}})):
+    if os.path.exists(tempdir):
+        shutil.rmtree(tempdir)
+    start = time.time()
+    pipeline_run([big, small], verbose = 0, one_second_per_job = False, **extra_options)
+    print ("%-45s    makespan %6.2f s" % (description, time.time() - start))
+
+shutil.rmtree(tempdir)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_task_scheduler.py
+
+        Times how long it takes to release each ready task as the size of the
+            pipeline grows.
+
+        The ready-set scheduler (task.t_ready_task_scheduler) should take a constant
+            time per task. The previous polling scheduler, which rescanned every
+            incomplete task and all its parents for each batch of jobs,
+            is reproduced for comparison.
+
+        use :
+            --max_tasks N       largest pipeline to time (default 8000)
+            --no_polling        skip the (slow) polling scheduler
+
+"""
+import sys, os, time
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus.task import t_ready_task_scheduler
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--max_tasks", dest="max_tasks", type="int", default = 8000,
+                  help="Largest number of tasks to time.")
+parser.add_option("--no_polling", dest="no_polling", action="store_true", default = False,
+                  help="Do not time the polling scheduler.")
+(options, remaining_args) = parser.parse_args()
+
+
+#_________________________________________________________________________________________
+
+#   fake_task
+
+#_________________________________________________________________________________________
+class fake_task(object):
+    """
+    Just enough of a task for the scheduler: a name and a list of parents
+    """
+    def __init__ (self, name, parents):
+        self._name = name
+        self._outward = parents
+
+def make_layered_pipeline (cnt_tasks, width = 50):
+    """
+    Tasks in each layer depend on three tasks from the previous layer
+    Returned in topological order
+    """
+    tasks = []
+    for i in range(cnt_tasks):
+        layer, pos = divmod(i, width)
+        if layer == 0:
+            parents = []
+        else:
+            previous = tasks[(layer - 1) * width: layer * width]
+            parents = [previous[(pos + d) % width] for d in (0, 1, 7)]
+        tasks.append(fake_task("task%d" % i, parents))
+    return tasks
+
+def time_ready_set_scheduler (tasks):
+    start = time.time()
+    task_scheduler = t_ready_task_scheduler(tasks)
+    cnt_released = 0
+    while task_scheduler.has_incomplete_tasks():
+        t = task_scheduler.pop_ready_task()
+        task_scheduler.task_completed(t)
+        cnt_released += 1
+    assert(cnt_released == len(tasks))
+    return time.time() - start
+
+def time_polling_scheduler (tasks):
+    """
+    Emulates the previous scheduler: every pass rescans all incomplete tasks
+    """
+    start = time.time()
+    incomplete_tasks = set(tasks)
+    task_parents = dict((t, set(t._outward)) for t in tasks)
+    while len(incomplete_tasks):
+        for t in list(incomplete_tasks):
+            if any(parent in incomplete_tasks for parent in task_parents[t]):
+                continue
+            incomplete_tasks.remove(t)
+            # one task completes per batch of jobs
+            break
+    return time.time() - start
+
+
+print "%10s %28s %28s" % ("tasks", "ready set (usec per task)", "polling (usec per task)")
+cnt_tasks = 500
+while cnt_tasks <= options.max_tasks:
+    tasks = make_layered_pipeline(cnt_tasks)
+    ready_set_usec = time_ready_set_scheduler(tasks) * 1e6 / cnt_tasks
+    if options.no_polling:
+        polling_usec = "-"
+    else:
+        polling_usec = "%.1f" % (time_polling_scheduler(tasks) * 1e6 / cnt_tasks)
+    print "%10d %28.1f %28s" % (cnt_tasks, ready_set_usec, polling_usec)
+    cnt_tasks *= 2
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+
+    benchmark_uptodate_checks.py
+
+        Times how long it takes before the first job is dispatched when
+            most jobs of a large @transform are up to date, with up to date checks
+            made in 0, 4 and 16 threads (pipeline_run(uptodate_check_threads = ...))
+
+        File system latency (e.g. NFS) is simulated by sleeping in each check
+
+        use :
+            --jobs_count N          number of jobs (default 2000)
+            --latency SECONDS       delay per up to date check (default 0.002)
+
+"""
+import sys, os, time, shutil
+from optparse import OptionParser
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+parser = OptionParser(usage = "\n\n    %prog [options]")
+parser.add_option("--jobs_count", dest="jobs_count", type="int", default = 2000,
+                  help="Number of jobs.")
+parser.add_option("--latency", dest="latency", type="float", default = 0.002,
+                  help="Simulated file system delay per up to date check.")
+(options, remaining_args) = parser.parse_args()
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "benchmark_uptodate_checks_dir/"
+job_start_times = []
+
+def slow_needs_update_check (i, o):
+    time.sleep(options.latency)
+    return needs_update_check_modify_time(i, o)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%05d.1" % i] for i in range(options.jobs_count)])
+def task1 (i, o):
+    open(o, "w")
+
+@transform(task1, suffix(".1"), ".2")
+@check_if_uptodate(slow_needs_update_check)
+def task2 (i, o):
+    job_start_times.append(time.time())
+    open(o, "w")
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+if os.path.exists(tempdir):
+    shutil.rmtree(tempdir)
+pipeline_run([task2], verbose = 0, one_second_per_job = False)
+
+for uptodate_check_threads in (0, 4, 16):
+    #
+    #   only the last tenth of the jobs are out of date
+    #
+    for i in range(options.jobs_count * 9 // 10, options.jobs_count):
+        os.unlink(tempdir + "%05d.2" % i)
+    del job_start_times[:]
+    start = time.time()
+    pipeline_run([task2], verbose = 0, one_second_per_job = False,
+                 uptodate_check_threads = uptodate_check_threads)
+    print ("uptodate_check_threads = %2d    first job after %6.2f s    total %6.2f s" %
+            (uptodate_check_threads, job_start_times[0] - start, time.time() - start))
+
+shutil.rmtree(tempdir)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+
+    fake_batch_scheduler.py
+
+        Stands in for a batch scheduler (sbatch / squeue / scancel) when testing
+            t_batch_executor: array jobs run on this machine, a few tasks at a time
+
+        use :
+            fake_batch_scheduler.py --spool DIR submit --array=1-N [--slots K] SCRIPT
+                Prints the id of the array job.
+                Each task runs SCRIPT with its task id in $FAKE_ARRAY_TASK_ID
+
+            fake_batch_scheduler.py --spool DIR status
+                Prints the ids of array jobs which have not finished
+
+            fake_batch_scheduler.py --spool DIR cancel ID...
+
+        DIR/ID.submitted records each array job submitted
+
+"""
+import sys, os
+import time
+import signal
+import subprocess
+from optparse import OptionParser
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Commands
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+def running_file (spool, job_id):
+    return os.path.join(spool, "%s.running" % job_id)
+
+def submit (spool, array, slots, script):
+    """
+    Start running the array in the background, printing its id
+    """
+    cnt_tasks = int(array.split("-")[1])
+
+    # next free id
+    job_id = 1
+    while 1:
+        try:
+            os.close(os.open(os.path.join(spool, "%d.submitted" % job_id),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except OSError:
+            job_id += 1
+
+    log = open(os.path.join(spool, "%d.log" % job_id), "w")
+    runner = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--spool", spool,
+                               "--slots", str(slots), "run", str(job_id), str(cnt_tasks), script],
+                              stdout = log, stderr = log, close_fds = True,
+                              preexec_fn = os.setsid)
+    open(running_file(spool, job_id), "w").write("%d\n" % runner.pid)
+    sys.stdout.write("%d\n" % job_id)
+
+def run (spool, slots, job_id, cnt_tasks, script):
+    """
+    Run the tasks of the array, up to slots at a time
+    """
+    task_ids = range(1, int(cnt_tasks) + 1)
+    running = []
+    while task_ids or running:
+        running = [task for task in running if task.poll() == None]
+        while task_ids and len(running) < slots:
+            env = dict(os.environ)
+            env["FAKE_ARRAY_TASK_ID"] = str(task_ids.pop(0))
+            running.append(subprocess.Popen(["sh", script], env = env))
+        time.sleep(0.05)
+    os.unlink(running_file(spool, job_id))
+
+def status (spool):
+    for file_name in sorted(os.listdir(spool)):
+        if file_name.endswith(".running"):
+            sys.stdout.write("%s RUNNING\n" % file_name[:-len(".running")])
+
+def cancel (spool, job_ids):
+    for job_id in job_ids:
+        try:
+            pid = int(open(running_file(spool, job_id)).read())
+            os.unlink(running_file(spool, job_id))
+            os.killpg(pid, signal.SIGTERM)
+        except (IOError, OSError):
+            pass
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+if __name__ == '__main__':
+    parser = OptionParser(usage = "\n\n    %prog --spool DIR submit|status|cancel|run ...")
+    parser.add_option("--spool", dest = "spool", help = "Directory recording array jobs.")
+    parser.add_option("--array", dest = "array", default = "1-1", help = "Task ids, e.g. 1-10.")
+    parser.add_option("--slots", dest = "slots", type = "int", default = 4,
+                      help = "Number of tasks of each array job running at once.")
+    (options, args) = parser.parse_args()
+    if not options.spool or not args:
+        parser.error("Please specify --spool and a command")
+    if not os.path.isdir(options.spool):
+        os.makedirs(options.spool)
+
+    command, args = args[0], args[1:]
+    if command == "submit":
+        submit(options.spool, options.array, options.slots, args[0])
+    elif command == "run":
+        run(options.spool, options.slots, *args)
+    elif command == "status":
+        status(options.spool)
+    elif command == "cancel":
+        cancel(options.spool, args)
+    else:
+        parser.error("Unknown command %s" % command)
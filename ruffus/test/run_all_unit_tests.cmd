@@ -43,5 +43,44 @@ python ./test_files_decorator.py
 echo Running test_active_if.py                                                      && \
 python ./test_active_if.py -j2 -v                                                   && \
 echo Running test_softlink_uptodate.py                                              && \
-python ./test_softlink_uptodate.py -j2 -v
-
+python ./test_softlink_uptodate.py -j2 -v                                           && \
+echo Running test_job_level_dependencies.py                                         && \
+python ./test_job_level_dependencies.py                                             && \
+echo Running test_thread_executor.py                                                && \
+python ./test_thread_executor.py                                                    && \
+echo Running test_coroutine_executor.py                                             && \
+python ./test_coroutine_executor.py                                                 && \
+echo Running test_job_plan_cache.py                                                 && \
+python ./test_job_plan_cache.py                                                     && \
+echo Running test_file_cache.py                                                     && \
+python ./test_file_cache.py                                                         && \
+echo Running test_job_history.py                                                    && \
+python ./test_job_history.py                                                        && \
+echo Running test_checksum_uptodate.py                                              && \
+python ./test_checksum_uptodate.py                                                  && \
+echo Running test_uptodate_check_threads.py                                         && \
+python ./test_uptodate_check_threads.py                                             && \
+echo Running test_check_if_uptodate_batch.py                                        && \
+python ./test_check_if_uptodate_batch.py                                            && \
+echo Running test_re_glob.py                                                        && \
+python ./test_re_glob.py                                                            && \
+echo Running test_lazy_job_names.py                                                 && \
+python ./test_lazy_job_names.py                                                     && \
+echo Running test_priority.py                                                       && \
+python ./test_priority.py                                                           && \
+echo Running test_resources.py                                                      && \
+python ./test_resources.py                                                          && \
+echo Running test_socket_executor.py                                                && \
+python ./test_socket_executor.py                                                    && \
+echo Running test_batch_executor.py                                                 && \
+python ./test_batch_executor.py                                                     && \
+echo Running test_claims.py                                                         && \
+python ./test_claims.py                                                             && \
+echo Running test_shard.py                                                          && \
+python ./test_shard.py                                                              && \
+echo Running test_retry.py                                                          && \
+python ./test_retry.py                                                              && \
+echo Running test_cancel.py                                                         && \
+python ./test_cancel.py                                                             && \
+echo Running test_in_memory.py                                                      && \
+python ./test_in_memory.py
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+
+    test_batch_executor.py
+
+        Jobs are submitted to a batch scheduler as array jobs
+            (See t_batch_executor), here fake_batch_scheduler.py
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import glob
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.executors import t_batch_executor
+from ruffus.ruffus_exceptions import RethrownJobError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   N.B. batch jobs import this file: only run pipelines under __main__
+#
+tempdir = "test_batch_executor_dir/"
+spool = os.path.abspath(tempdir + "spool")
+fake_scheduler = "%s %s --spool %s" % (sys.executable,
+                                       os.path.join(exe_path, "fake_batch_scheduler.py"), spool)
+
+def write_pid (output_file):
+    open(output_file, "w").write("%d\n" % os.getpid())
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(20)])
+def make_start (i, o):
+    write_pid(o)
+
+@transform(make_start, suffix(".start"), ".finish")
+def make_finish (i, o):
+    write_pid(o)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.lost" % i] for i in range(2)])
+def lost (i, o):
+    if o.endswith("1.lost"):
+        os._exit(1)
+    write_pid(o)
+
+
+
+class Test_batch_executor(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        os.makedirs(spool)
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def make_executor (self, submit_command = fake_scheduler + " submit --array=1-{count} {script}"):
+        return t_batch_executor(submit_command   = submit_command,
+                                status_command   = fake_scheduler + " status",
+                                cancel_command   = fake_scheduler + " cancel {job_ids}",
+                                task_id_variable = "FAKE_ARRAY_TASK_ID",
+                                job_dir          = tempdir + "jobs",
+                                submit_delay     = 0.2,
+                                poll_interval    = 0.2)
+
+    def test_arrays(self):
+        executor = self.make_executor()
+        try:
+            pipeline_run([make_finish], verbose = 0, one_second_per_job = False, multiprocess = 20,
+                         executor = executor)
+        finally:
+            executor.close()
+        pids = set(int(open(f).read()) for f in glob.glob(tempdir + "*.start") +
+                                                glob.glob(tempdir + "*.finish"))
+        self.assertEqual(len(glob.glob(tempdir + "*.finish")), 20)
+        self.assertTrue(os.getpid() not in pids)
+
+        # 41 jobs (including mkdir) in a few arrays
+        self.assertEqual(len(glob.glob(os.path.join(spool, "*.submitted"))),
+                         executor.cnt_arrays_submitted)
+        self.assertTrue(executor.cnt_arrays_submitted <= 6)
+
+        # finished arrays are cleaned up
+        self.assertEqual(os.listdir(tempdir + "jobs"), [])
+
+    def test_lost_jobs(self):
+        executor = self.make_executor()
+        try:
+            self.assertRaises(RethrownJobError, pipeline_run, [lost], verbose = 0,
+                              one_second_per_job = False, multiprocess = 4, executor = executor)
+        finally:
+            executor.close()
+        self.assertTrue(os.path.exists(tempdir + "0.lost"))
+
+    def test_submit_fails(self):
+        executor = self.make_executor(submit_command = "false {count} {script}")
+        try:
+            self.assertRaises(RethrownJobError, pipeline_run, [make_start], verbose = 0,
+                              one_second_per_job = False, multiprocess = 4, executor = executor)
+        finally:
+            executor.close()
+
+    def test_presets(self):
+        executor = t_batch_executor("slurm")
+        self.assertEqual(executor.task_id_variable, "SLURM_ARRAY_TASK_ID")
+        executor.close()
+        self.assertRaises(Exception, t_batch_executor, "lsf")
+        self.assertRaises(Exception, t_batch_executor, submit_command = "qsub {script}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+
+    test_cancel.py
+
+        Jobs still running when the pipeline stops early (on failure or Ctrl-C)
+            are stopped, with the programs they started, and reported as cancelled
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import signal
+import threading
+import subprocess
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+import ruffus.task
+from ruffus.ruffus_exceptions import RethrownJobError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_cancel_dir/"
+
+def start_sleeping (output_file):
+    """
+    Start a long running program, recording its process id
+    """
+    open(output_file, "w").write("partial")
+    program = subprocess.Popen(["sleep", "60"])
+    open(output_file + ".pid", "w").write("%d\n" % program.pid)
+    return program
+
+def cnt_started ():
+    return len([f for f in os.listdir(tempdir) if f.endswith(".pid")])
+
+#
+#   fail once the other jobs are all running
+#
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.slow" % i] for i in range(3)] + [[None, tempdir + "fails"]])
+def slow_or_fails (i, o):
+    if o.endswith("fails"):
+        while cnt_started() < 3:
+            time.sleep(0.05)
+        raise Exception("Fails")
+    start_sleeping(o).wait()
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.slow" % i] for i in range(3)])
+def slow (i, o):
+    start_sleeping(o).wait()
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.slow" % i] for i in range(3)] + [[None, tempdir + "fails"]])
+def slow_or_fails_coroutine (i, o):
+    if o.endswith("fails"):
+        while cnt_started() < 3:
+            yield 0.05
+        raise Exception("Fails")
+    yield start_sleeping(o)
+
+
+#
+#   the next task turns out to be missing an input file while the slow jobs are running
+#
+@follows(mkdir(tempdir))
+@files(None, tempdir + "all.started")
+def all_started (i, o):
+    while cnt_started() < 3:
+        time.sleep(0.05)
+    open(o, "w")
+
+@transform(all_started, suffix(".started"), add_inputs(tempdir + "missing"), ".missing_input")
+def missing_input (i, o):
+    open(o, "w")
+
+@transform([tempdir + "missing.txt"], suffix(".txt"), ".out")
+def missing_first_input (i, o):
+    open(o, "w")
+
+
+def is_running (pid):
+    """
+    Whether the process exists and is not a zombie
+    """
+    try:
+        return " Z " not in open("/proc/%d/stat" % pid).read().split(")")[-1][:3]
+    except IOError:
+        return False
+
+
+class Test_cancel(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def wait_for_pid_files (self):
+        while not os.path.exists(tempdir) or cnt_started() < 3:
+            time.sleep(0.05)
+
+    def check_cancelled (self, cancelled_jobs):
+        self.assertEqual(len(cancelled_jobs), 3)
+        for i in range(3):
+            self.assertTrue(any("%d.slow" % i in job_name for job_name in cancelled_jobs))
+
+            # programs stopped and partial outputs removed
+            self.assertFalse(os.path.exists(tempdir + "%d.slow" % i))
+            self.assertFalse(is_running(int(open(tempdir + "%d.slow.pid" % i).read())))
+
+    def run_until_failure (self, target_task, **options):
+        start_time = time.time()
+        try:
+            pipeline_run([target_task], verbose = 0, one_second_per_job = False,
+                         exceptions_terminate_immediately = True, **options)
+            self.fail("Pipeline should fail")
+        except RethrownJobError, e:
+            cancelled_jobs = e.cancelled_jobs
+        self.assertTrue(time.time() - start_time < 30)
+        self.assertTrue("Cancelled jobs" in str(e))
+        self.check_cancelled(cancelled_jobs)
+
+    def test_processes(self):
+        self.run_until_failure(slow_or_fails, multiprocess = 4)
+
+    def test_coroutines(self):
+        self.run_until_failure(slow_or_fails_coroutine, multiprocess = 4, executor = "coroutines")
+
+    def test_pipeline_error(self):
+        start_time = time.time()
+        try:
+            pipeline_run([slow, missing_input], verbose = 0, one_second_per_job = False,
+                         multiprocess = 4)
+            self.fail("Pipeline should fail")
+        except RethrownJobError, e:
+            cancelled_jobs = e.cancelled_jobs
+        self.assertTrue(time.time() - start_time < 30)
+        self.assertTrue("missing" in str(e))
+        self.check_cancelled(cancelled_jobs)
+
+    def test_setup_error(self):
+        #
+        #   the run is cleaned up even if it fails before any job is started
+        #
+        os.makedirs(tempdir)
+        self.assertRaises(RethrownJobError, pipeline_run, [missing_first_input], verbose = 0,
+                          history_file = tempdir + "history.sqlite", multiprocess = 2)
+        self.assertFalse(ruffus.task.job_history.is_open())
+        self.assertFalse(ruffus.task.stat_cache.enabled)
+
+    def test_interrupt(self):
+        def interrupt ():
+            self.wait_for_pid_files()
+            os.kill(os.getpid(), signal.SIGINT)
+        threading.Thread(target = interrupt).start()
+        start_time = time.time()
+        self.assertRaises(KeyboardInterrupt, pipeline_run, [slow], verbose = 0,
+                          one_second_per_job = False, multiprocess = 3)
+        self.assertTrue(time.time() - start_time < 30)
+        for i in range(3):
+            self.assertFalse(os.path.exists(tempdir + "%d.slow" % i))
+            self.assertFalse(is_running(int(open(tempdir + "%d.slow.pid" % i).read())))
+
+
+if __name__ == '__main__':
+    unittest.main()
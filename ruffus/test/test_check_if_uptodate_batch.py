@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+
+    test_check_if_uptodate_batch.py
+
+        @check_if_uptodate(batch = func) checks all the jobs of a task in one call
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import StringIO
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import error_decorator_args
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_check_if_uptodate_batch_dir/"
+jobs_count = 10
+cnt_jobs_run = defaultdict(int)
+
+#
+#   stands in for a database of which jobs are up to date
+#
+uptodate_outputs = set()
+batch_calls = []
+
+def check_all_jobs (params):
+    batch_calls.append(len(params))
+    return [(o not in uptodate_outputs, "Not in database") for i, o in params]
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.1" % i] for i in range(jobs_count)])
+def task1 (i, o):
+    open(o, "w")
+
+@transform(task1, suffix(".1"), ".2")
+@check_if_uptodate(batch = check_all_jobs)
+def task2 (i, o):
+    cnt_jobs_run["task2"] += 1
+    open(o, "w")
+
+
+class Test_check_if_uptodate_batch(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        cnt_jobs_run.clear()
+        uptodate_outputs.clear()
+        del batch_calls[:]
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_batch(self):
+        pipeline_run([task2], verbose = 0, one_second_per_job = False)
+        self.assertEqual(cnt_jobs_run["task2"], jobs_count)
+        # at most once when looking for out of date tasks, once when running jobs
+        self.assertTrue(1 <= len(batch_calls) <= 2)
+        self.assertTrue(all(cnt_jobs == jobs_count for cnt_jobs in batch_calls))
+
+        # only out of date jobs rerun
+        uptodate_outputs.update(tempdir + "%d.2" % i for i in range(1, jobs_count))
+        cnt_jobs_run.clear()
+        pipeline_run([task2], verbose = 0, one_second_per_job = False)
+        self.assertEqual(cnt_jobs_run["task2"], 1)
+
+        # printout
+        del batch_calls[:]
+        s = StringIO.StringIO()
+        pipeline_printout(s, [task2], verbose = 5)
+        self.assertEqual(s.getvalue().count("Job needs update: Not in database"), 1)
+        self.assertTrue(all(cnt_jobs == jobs_count for cnt_jobs in batch_calls))
+
+        # up to date
+        uptodate_outputs.add(tempdir + "0.2")
+        cnt_jobs_run.clear()
+        pipeline_run([task2], verbose = 0, one_second_per_job = False)
+        self.assertEqual(sum(cnt_jobs_run.values()), 0)
+
+    def test_bad_args(self):
+        def task3 (i, o):
+            pass
+        self.assertRaises(error_decorator_args,
+                          check_if_uptodate(check_all_jobs, batch = check_all_jobs), task3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+
+    test_checksum_uptodate.py
+
+        With checksums, touching an input file without changing its contents
+            does not make its outputs out of date
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.job_history import t_job_history
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_checksum_uptodate_dir/"
+history_file = "test_checksum_uptodate.sqlite"
+cnt_jobs_run = defaultdict(int)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.1" % i] for i in range(3)])
+def task1 (i, o):
+    cnt_jobs_run["task1"] += 1
+    open(o, "w").write(o)
+
+@transform(task1, suffix(".1"), ".2")
+def task2 (i, o):
+    cnt_jobs_run["task2"] += 1
+    open(o, "w").write(open(i).read())
+
+@transform(task2, suffix(".2"), ".3")
+@check_if_uptodate(needs_update_check_checksum)
+def task3 (i, o):
+    cnt_jobs_run["task3"] += 1
+    open(o, "w").write(open(i).read())
+
+
+class Test_checksum_uptodate(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        cnt_jobs_run.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        if os.path.exists(history_file):
+            os.unlink(history_file)
+
+    def touch (self, file_name, contents = None):
+        if contents == None:
+            contents = open(file_name).read()
+        open(file_name, "w").write(contents)
+        # make sure modification time differs from that of the output
+        mtime = time.time() + 10
+        os.utime(file_name, (mtime, mtime))
+
+    def test_pipeline_checksums(self):
+        pipeline_run([task3], verbose = 0, history_file = history_file, checksums = True)
+        self.assertEqual(cnt_jobs_run["task3"], 3)
+
+        # touched but unchanged
+        self.touch(tempdir + "0.1")
+        cnt_jobs_run.clear()
+        pipeline_run([task3], verbose = 0, history_file = history_file, checksums = True)
+        self.assertEqual(sum(cnt_jobs_run.values()), 0)
+
+        # changed
+        self.touch(tempdir + "0.1", "changed")
+        pipeline_run([task3], verbose = 0, history_file = history_file, checksums = True)
+        self.assertEqual(cnt_jobs_run["task2"], 1)
+        self.assertEqual(cnt_jobs_run["task3"], 1)
+
+    def test_task_checksums(self):
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+
+        # only task3 checks checksums
+        self.touch(tempdir + "0.1")
+        self.touch(tempdir + "1.2")
+        cnt_jobs_run.clear()
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+        self.assertEqual(cnt_jobs_run["task2"], 1)
+        self.assertEqual(cnt_jobs_run["task3"], 0)
+
+    def test_checksum_cache(self):
+        os.makedirs(tempdir)
+        file_name = tempdir + "old_file"
+        open(file_name, "w").write("contents")
+        mtime = time.time() - 100
+        os.utime(file_name, (mtime, mtime))
+
+        job_history = t_job_history()
+        job_history.open(history_file)
+        checksum = job_history.file_checksum(file_name)
+        job_history.close()
+
+        # not recalculated if size and modification time are unchanged
+        open(file_name, "w").write("CONTENTS")
+        os.utime(file_name, (mtime, mtime))
+        job_history.open(history_file)
+        self.assertEqual(job_history.file_checksum(file_name), checksum)
+        job_history.close()
+
+        # recalculated otherwise
+        os.utime(file_name, (mtime + 1, mtime + 1))
+        job_history.open(history_file)
+        self.assertNotEqual(job_history.file_checksum(file_name), checksum)
+        job_history.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+
+    test_claims.py
+
+        Copies of the same pipeline started at the same time share out jobs
+            through claim files (See pipeline_run(claims_dir = ...))
+
+        Each copy runs in its own process, as it would on another host
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import subprocess
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_claims_dir/"
+claims_dir = tempdir + "claims"
+jobs_log = tempdir + "jobs.log"
+
+#
+#   one line for each job run, by any copy of the pipeline
+#
+def log_job (output_file):
+    open(jobs_log, "a").write("%s %d\n" % (output_file, os.getpid()))
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(12)])
+def make_start (i, o):
+    time.sleep(0.1)
+    open(o, "w")
+    log_job(o)
+
+@transform(make_start, suffix(".start"), ".middle")
+def make_middle (i, o):
+    time.sleep(0.1)
+    open(o, "w")
+    log_job(o)
+
+@merge(make_middle, tempdir + "all.summary")
+def summarise (i, o):
+    open(o, "w")
+    log_job(o)
+
+@follows(mkdir(tempdir))
+@transform(tempdir + "*.in", suffix(".in"), ".copy")
+def copy_input (i, o):
+    open(o, "w").write(open(i).read())
+
+
+def run_pipeline ():
+    pipeline_run([summarise], verbose = 0, one_second_per_job = False, multithread = 2,
+                 claims_dir = claims_dir)
+
+
+class Test_claims(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        os.makedirs(tempdir)
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def read_jobs_log (self):
+        pids_by_job = defaultdict(list)
+        for line in open(jobs_log):
+            output_file, pid = line.split()
+            pids_by_job[output_file].append(int(pid))
+        return pids_by_job
+
+    def test_several_copies(self):
+        copies = [subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0]), "--run_pipeline"])
+                    for i in range(3)]
+        for copy in copies:
+            self.assertEqual(copy.wait(), 0)
+
+        # each job run exactly once, shared between the copies
+        pids_by_job = self.read_jobs_log()
+        self.assertEqual(len(pids_by_job), 25)
+        self.assertTrue(all(len(pids) == 1 for pids in pids_by_job.values()))
+        self.assertTrue(len(set(pid for pids in pids_by_job.values() for pid in pids)) > 1)
+        self.assertTrue(os.path.exists(tempdir + "all.summary"))
+
+        # only done claims are left
+        self.assertEqual(set(f.rsplit(".", 1)[-1] for f in os.listdir(claims_dir)), set(["done"]))
+        self.assertEqual(len(os.listdir(claims_dir)), 25)
+
+    def test_old_claims(self):
+        run_pipeline()
+        self.assertEqual(len(self.read_jobs_log()), 25)
+
+        #
+        #   claims done by earlier runs are ignored
+        #
+        old_time = time.time() - 3600
+        for file_name in os.listdir(claims_dir):
+            os.utime(os.path.join(claims_dir, file_name), (old_time, old_time))
+        os.unlink(tempdir + "all.summary")
+        os.unlink(jobs_log)
+        run_pipeline()
+        self.assertEqual(self.read_jobs_log().keys(), [tempdir + "all.summary"])
+
+        # and removed
+        self.assertEqual(len(os.listdir(claims_dir)), 1)
+
+        #
+        #   claims of copies which stopped running are taken over
+        #
+        os.unlink(tempdir + "all.summary")
+        os.unlink(jobs_log)
+        claim_file, = [os.path.join(claims_dir, f[:-len(".done")]) for f in os.listdir(claims_dir)
+                            if f.endswith(".done") and
+                                os.path.getmtime(os.path.join(claims_dir, f)) > old_time + 1]
+        os.unlink(claim_file + ".done")
+        open(claim_file + ".claim", "w").write("elsewhere 1\n")
+        os.utime(claim_file + ".claim", (old_time, old_time))
+        run_pipeline()
+        self.assertEqual(self.read_jobs_log().keys(), [tempdir + "all.summary"])
+        self.assertTrue(os.path.exists(claim_file + ".done"))
+
+    def test_changed_input(self):
+        #
+        #   a job done by the last run is run again straight away once its input changes
+        #
+        open(tempdir + "a.in", "w").write("first")
+        pipeline_run([copy_input], verbose = 0, one_second_per_job = False, claims_dir = claims_dir)
+        self.assertEqual(open(tempdir + "a.copy").read(), "first")
+        time.sleep(1.1)
+        open(tempdir + "a.in", "w").write("second")
+        pipeline_run([copy_input], verbose = 0, one_second_per_job = False, claims_dir = claims_dir)
+        self.assertEqual(open(tempdir + "a.copy").read(), "second")
+
+
+if __name__ == '__main__':
+    if "--run_pipeline" in sys.argv:
+        run_pipeline()
+    else:
+        unittest.main()
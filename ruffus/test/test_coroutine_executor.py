@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+
+    test_coroutine_executor.py
+
+        Task functions which are generators wait on whatever they yield.
+        pipeline_run(executor = "coroutines") runs many such jobs at the same time
+            in a single thread, respecting @jobs_limit
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import subprocess
+import time
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import RethrownJobError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_coroutine_executor_dir/"
+cnt_jobs = 20
+jobs_running    = [0]
+max_jobs_running= [0]
+
+def start_job ():
+    jobs_running[0] += 1
+    max_jobs_running[0] = max(max_jobs_running[0], jobs_running[0])
+
+def end_job ():
+    jobs_running[0] -= 1
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(cnt_jobs)])
+def make_start (i, o):
+    start_job()
+    return_code = yield subprocess.Popen("sleep 1; touch %s" % o, shell = True)
+    assert(return_code == 0)
+    end_job()
+
+@transform(make_start, suffix(".start"), ".limited")
+@jobs_limit(3)
+def limited_jobs (i, o):
+    start_job()
+    yield 0.2
+    yield None
+    open(o, "w")
+    end_job()
+
+@transform(make_start, suffix(".start"), ".fails")
+def failing_jobs (i, o):
+    yield 0.1
+    raise Exception("Coroutine failed")
+
+
+class Test_coroutine_executor(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        max_jobs_running[0] = 0
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_concurrent_jobs(self):
+        start_time = time.time()
+        pipeline_run([make_start], executor = "coroutines", multiprocess = cnt_jobs,
+                     verbose = 0, one_second_per_job = False)
+        # all jobs wait on their subprocess at the same time
+        self.assertTrue(time.time() - start_time < cnt_jobs / 2)
+        self.assertEqual(max_jobs_running[0], cnt_jobs)
+        for i in range(cnt_jobs):
+            self.assertTrue(os.path.exists(tempdir + "%d.start" % i))
+
+    def test_jobs_limit(self):
+        pipeline_run([limited_jobs], executor = "coroutines", multiprocess = cnt_jobs,
+                     verbose = 0, one_second_per_job = False)
+        self.assertEqual(max_jobs_running[0], cnt_jobs)
+        max_jobs_running[0] = 0
+        pipeline_run([limited_jobs], [limited_jobs], executor = "coroutines", multiprocess = cnt_jobs,
+                     verbose = 0, one_second_per_job = False)
+        self.assertEqual(max_jobs_running[0], 3)
+
+    def test_exceptions(self):
+        self.assertRaises(RethrownJobError, pipeline_run, [failing_jobs], executor = "coroutines",
+                          multiprocess = cnt_jobs, verbose = 0, one_second_per_job = False)
+
+    def test_coroutines_in_processes(self):
+        pipeline_run([make_start], multiprocess = 5, verbose = 0, one_second_per_job = False)
+        for i in range(cnt_jobs):
+            self.assertTrue(os.path.exists(tempdir + "%d.start" % i))
+
+
+if __name__ == '__main__':
+    unittest.main()
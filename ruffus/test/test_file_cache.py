@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+
+    test_file_cache.py
+
+        File system information is cached during pipeline_run
+            and forgotten for the output of each job when it completes
+
+        Glob patterns are matched against directory listings,
+            cached until the directory is modified
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import glob
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.file_cache import t_stat_cache, t_glob_cache
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_file_cache_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(4)])
+def make_start (i, o):
+    open(o, "w")
+
+#
+#   every job depends on every start file
+#
+@follows(make_start)
+@files([[[tempdir + "%d.start" % i for i in range(4)], tempdir + "%d.summary" % j] for j in range(10)])
+def summarise (i, o):
+    open(o, "w")
+
+@transform(summarise, suffix(".summary"), ".final")
+def make_final (i, o):
+    open(o, "w")
+
+
+class Test_file_cache(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        os.makedirs(tempdir)
+        self.file_name = tempdir + "test_file"
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_stat_cache(self):
+        stat_cache = t_stat_cache()
+        stat_cache.start()
+        self.assertTrue(not stat_cache.exists(self.file_name))
+
+        # remembers file is missing
+        open(self.file_name, "w")
+        self.assertTrue(not stat_cache.exists(self.file_name))
+        self.assertEqual(stat_cache.cnt_syscalls, 1)
+        self.assertEqual(stat_cache.cnt_syscalls_saved, 1)
+
+        # until told otherwise
+        stat_cache.invalidate([self.file_name])
+        self.assertTrue(stat_cache.exists(self.file_name))
+        self.assertEqual(stat_cache.getmtime(self.file_name), os.path.getmtime(self.file_name))
+        self.assertEqual(stat_cache.realpath(self.file_name), os.path.realpath(self.file_name))
+        self.assertTrue(stat_cache.isdir(tempdir))
+        self.assertTrue(not stat_cache.isdir(self.file_name))
+
+        # not cached outside of pipeline runs
+        stat_cache.stop()
+        os.unlink(self.file_name)
+        self.assertTrue(not stat_cache.exists(self.file_name))
+        self.assertRaises(OSError, stat_cache.getmtime, self.file_name)
+
+    def test_file_id(self):
+        stat_cache = t_stat_cache()
+        input_file_name = self.file_name
+        output_file_name = tempdir + "output_file"
+        open(input_file_name, "w")
+        time.sleep(1.1)
+        open(output_file_name, "w")
+
+        # the same file whatever the path
+        os.link(input_file_name, tempdir + "hard_link")
+        os.symlink("test_file", tempdir + "soft_link")
+        for file_name in (tempdir + "hard_link", tempdir + "soft_link", tempdir + "./test_file"):
+            self.assertEqual(stat_cache.file_id(file_name), stat_cache.file_id(input_file_name))
+        self.assertNotEqual(stat_cache.file_id(output_file_name), stat_cache.file_id(input_file_name))
+        self.assertEqual(stat_cache.file_id(tempdir + "missing"), None)
+
+        # outputs which are also inputs are ignored
+        self.assertEqual(needs_update_check_modify_time([input_file_name],
+                                                        [output_file_name, tempdir + "soft_link"]),
+                         (False, "Up to date"))
+        needs_update, msg = needs_update_check_modify_time([output_file_name], [input_file_name])
+        self.assertTrue(needs_update)
+        self.assertTrue("Input files:" in msg and "Output files:" in msg)
+
+    def make_old (self, dir_name):
+        mtime = int(time.time()) - 100
+        os.utime(dir_name, (mtime, mtime))
+
+    def test_glob_cache(self):
+        for file_name in ("a.txt", "b.txt", "c.log", ".hidden.txt", "sub1/d.txt", "sub2/e.txt"):
+            file_name = os.path.join(tempdir, file_name)
+            if not os.path.exists(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            open(file_name, "w")
+
+        # same as glob.glob
+        glob_cache = t_glob_cache()
+        for pattern in ("*.txt", "[ab].txt", ".*", "sub*/*.txt", "sub*/", "*/d.txt",
+                        "a.txt", "missing", "missing_dir/*.txt", "*"):
+            pattern = os.path.join(tempdir, pattern)
+            self.assertEqual(sorted(glob_cache.glob(pattern)), sorted(glob.glob(pattern)))
+
+        # recently modified directories are listed again
+        glob_cache.start()
+        glob_cache.glob(tempdir + "*.txt")
+        self.assertEqual(glob_cache.cnt_listdirs, 1)
+        self.assertEqual(glob_cache.cnt_listdirs_saved, 0)
+
+        # listings of unmodified directories are reused
+        self.make_old(tempdir)
+        glob_cache.glob(tempdir + "*.txt")
+        glob_cache.glob(tempdir + "*.txt")
+        self.assertEqual(glob_cache.cnt_listdirs, 2)
+        self.assertEqual(glob_cache.cnt_listdirs_saved, 1)
+
+        # until modified
+        open(tempdir + "f.txt", "w")
+        self.assertTrue(tempdir + "f.txt" in glob_cache.glob(tempdir + "*.txt"))
+
+        # or written by the pipeline
+        self.make_old(tempdir)
+        glob_cache.glob(tempdir + "*.txt")
+        mtime = os.path.getmtime(tempdir)
+        open(tempdir + "g.txt", "w")
+        os.utime(tempdir, (mtime, mtime))
+        self.assertTrue(tempdir + "g.txt" not in glob_cache.glob(tempdir + "*.txt"))
+        glob_cache.invalidate([tempdir + "g.txt"])
+        self.assertTrue(tempdir + "g.txt" in glob_cache.glob(tempdir + "*.txt"))
+
+        # saved between runs
+        cache_file = tempdir + "glob_cache"
+        self.make_old(tempdir + "sub1")
+        glob_cache.glob(tempdir + "sub1/*.txt")
+        glob_cache.stop(cache_file)
+        glob_cache = t_glob_cache()
+        glob_cache.start(cache_file)
+        self.assertEqual(glob_cache.glob(tempdir + "sub1/*.txt"), [tempdir + "sub1/d.txt"])
+        self.assertEqual(glob_cache.cnt_listdirs, 0)
+
+        # otherwise forgotten after the run, and not cached outside of pipeline runs
+        glob_cache.stop()
+        self.assertEqual(glob_cache.listings, {})
+        glob_cache.glob(tempdir + "sub1/*.txt")
+        self.assertEqual(glob_cache.listings, {})
+
+    def test_pipeline(self):
+        shutil.rmtree(tempdir)
+        pipeline_run([make_final], verbose = 0, one_second_per_job = False)
+        for j in range(10):
+            self.assertTrue(os.path.exists(tempdir + "%d.final" % j))
+
+        # reruns downstream of updated file
+        time.sleep(1.1)
+        open(tempdir + "3.start", "w")
+        start_time = time.time()
+        pipeline_run([make_final], verbose = 0, one_second_per_job = False)
+        for j in range(10):
+            self.assertTrue(os.path.getmtime(tempdir + "%d.final" % j) >= int(start_time))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+
+    test_in_memory.py
+
+        Values returned by jobs of @in_memory tasks are passed to downstream jobs
+            in place of their output names, without writing files
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import InMemoryArgumentError, RethrownJobError
+from ruffus.data_store import t_data_store
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_in_memory_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(4)])
+def make_start (i, o):
+    open(o, "w").write(o[len(tempdir):-len(".start")])
+
+@in_memory()
+@transform(make_start, suffix(".start"), ".count")
+def count (i, o):
+    return {"number" : int(open(i).read()) * 10}
+
+@transform(count, suffix(".count"), ".total")
+def write_total (i, o):
+    open(o, "w").write("%d\n" % (i["number"] + 1))
+
+@in_memory()
+@merge(count, tempdir + "all.sum")
+def add_up (i, o):
+    return sum(value["number"] for value in i)
+
+@merge([add_up, write_total], tempdir + "all.summary")
+def summarise (i, o):
+    open(o, "w").write("%s\n" % (i,))
+
+@in_memory()
+@files(None, [tempdir + "low.pair", tempdir + "high.pair"])
+def make_pair (i, o):
+    return 1, 2
+
+@merge(make_pair, tempdir + "pair.summary")
+def summarise_pair (i, o):
+    open(o, "w").write("%s\n" % (i,))
+
+@in_memory()
+@files(None, [tempdir + "low.bad", tempdir + "high.bad"])
+def make_bad_pair (i, o):
+    return 1
+
+
+
+class Test_in_memory(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def run_pipeline (self, **options):
+        pipeline_run([summarise], verbose = 0, one_second_per_job = False, **options)
+
+    def read_totals (self):
+        return [open(tempdir + "%d.total" % i).read() for i in range(4)]
+
+    def check_outputs (self):
+        self.assertEqual(self.read_totals(), ["1\n", "11\n", "21\n", "31\n"])
+        self.assertEqual(open(tempdir + "all.summary").read(),
+                         "%s\n" % ([60] + [tempdir + "%d.total" % i for i in range(4)],))
+        # no files for the values kept in memory
+        self.assertFalse([f for f in os.listdir(tempdir) if f.endswith(".count") or f.endswith(".sum")])
+
+    def test_processes(self):
+        self.run_pipeline(multiprocess = 3)
+        self.check_outputs()
+
+    def test_threads(self):
+        self.run_pipeline(multithread = 3, job_level_dependencies = True)
+        self.check_outputs()
+
+    def test_spill(self):
+        self.run_pipeline(multiprocess = 3, in_memory_limit = 0)
+        self.check_outputs()
+
+    def test_up_to_date(self):
+        self.run_pipeline(multiprocess = 3)
+        made_times = [os.path.getmtime(tempdir + "%d.total" % i) for i in range(4)]
+
+        # only jobs downstream of changed input files are run again
+        future_time = time.time() + 10
+        os.utime(tempdir + "2.start", (future_time, future_time))
+        self.run_pipeline(multiprocess = 3)
+        for i in range(4):
+            if i == 2:
+                self.assertNotEqual(os.path.getmtime(tempdir + "%d.total" % i), made_times[i])
+            else:
+                self.assertEqual(os.path.getmtime(tempdir + "%d.total" % i), made_times[i])
+        self.check_outputs()
+
+    def test_checksums(self):
+        os.makedirs(tempdir)
+        history_file = tempdir + "history.sqlite"
+        self.run_pipeline(multiprocess = 3, checksums = True, history_file = history_file)
+        made_times = [os.path.getmtime(tempdir + "%d.total" % i) for i in range(4)]
+
+        # same values: nothing downstream is run again
+        self.run_pipeline(multiprocess = 3, checksums = True, history_file = history_file)
+        self.assertEqual([os.path.getmtime(tempdir + "%d.total" % i) for i in range(4)], made_times)
+
+        # jobs downstream of a changed value are run again
+        open(tempdir + "3.start", "w").write("4")
+        self.run_pipeline(multiprocess = 3, checksums = True, history_file = history_file)
+        self.assertEqual(self.read_totals(), ["1\n", "11\n", "21\n", "41\n"])
+        self.assertEqual([os.path.getmtime(tempdir + "%d.total" % i) for i in range(3)], made_times[:3])
+
+    def test_store_again(self):
+        #
+        #   values stored again under the same name replace the old ones
+        #
+        store = t_data_store()
+        store.start(memory_limit = 100)
+        store.put("small", "x" * 10, 0)
+        used = store.memory_used
+        store.put("small", "y" * 10, 0)
+        self.assertEqual(store.memory_used, used)
+        self.assertEqual(store.get("small"), "y" * 10)
+
+        store.put("large", "x" * 1000, 0)
+        store.put("large", "y" * 1000, 0)
+        self.assertEqual(len(os.listdir(store.spill_dir)), 1)
+        self.assertEqual(store.get("large"), "y" * 1000)
+
+        # spilled value replaced by one kept in memory
+        store.put("large", "z", 0)
+        self.assertEqual(os.listdir(store.spill_dir), [])
+        self.assertEqual(store.get("large"), "z")
+        spill_dir = store.spill_dir
+        store.stop()
+        self.assertFalse(os.path.exists(spill_dir))
+
+    def test_several_outputs(self):
+        os.makedirs(tempdir)
+        pipeline_run([summarise_pair], verbose = 0, one_second_per_job = False)
+        self.assertEqual(open(tempdir + "pair.summary").read(), "%s\n" % ([1, 2],))
+
+        # one value for each output
+        self.assertRaises(RethrownJobError, pipeline_run, [make_bad_pair], verbose = 0,
+                          one_second_per_job = False, multiprocess = 2)
+
+    def test_arguments(self):
+        self.assertRaises(InMemoryArgumentError, in_memory(1), make_start)
+        self.assertRaises(InMemoryArgumentError, pipeline_run, [summarise], verbose = 0,
+                          claims_dir = tempdir + "claims")
+
+
+if __name__ == '__main__':
+    unittest.main()
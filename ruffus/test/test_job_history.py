@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+
+    test_job_history.py
+
+        With pipeline_run(history_file = ...), jobs are up to date if their output
+            was made by a job which completed after the jobs which made their input,
+            whatever the file modification times
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import StringIO
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.job_history import job_history
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_job_history_dir/"
+history_file = "test_job_history.sqlite"
+cnt_jobs_run = defaultdict(int)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.1" % i] for i in range(3)])
+def task1 (i, o):
+    cnt_jobs_run["task1"] += 1
+    open(o, "w")
+
+@transform(task1, suffix(".1"), ".2")
+def task2 (i, o):
+    cnt_jobs_run["task2"] += 1
+    open(o, "w")
+
+@transform(task2, suffix(".2"), ".3")
+def task3 (i, o):
+    cnt_jobs_run["task3"] += 1
+    open(o, "w")
+
+def check_fails (i, o):
+    raise ValueError("Cannot check")
+
+@check_if_uptodate(check_fails)
+@files(None, tempdir + "unchecked")
+def unchecked (i, o):
+    pass
+
+
+class Test_job_history(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        cnt_jobs_run.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        if os.path.exists(history_file):
+            os.unlink(history_file)
+
+    def test_job_history(self):
+        #
+        #   no pause between tasks
+        #
+        start_time = time.time()
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+        self.assertTrue(time.time() - start_time < 1.0)
+        self.assertEqual(cnt_jobs_run["task3"], 3)
+
+        #
+        #   up to date
+        #
+        cnt_jobs_run.clear()
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+        self.assertEqual(sum(cnt_jobs_run.values()), 0)
+        s = StringIO.StringIO()
+        pipeline_printout(s, [task3], verbose = 3, history_file = history_file)
+        self.assertTrue("Job needs update" not in s.getvalue())
+
+        #
+        #   remaking the input means the output is out of date
+        #       even within the same second
+        #
+        pipeline_run([task2], [task2], verbose = 0, history_file = history_file)
+        cnt_jobs_run.clear()
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+        self.assertEqual(cnt_jobs_run["task3"], 3)
+
+        #
+        #   files modified outside the pipeline are compared by modification time
+        #
+        time.sleep(1.1)
+        open(tempdir + "0.2", "w")
+        cnt_jobs_run.clear()
+        pipeline_run([task3], verbose = 0, history_file = history_file)
+        self.assertEqual(cnt_jobs_run["task3"], 1)
+
+    def test_printout_closes_history(self):
+        #
+        #   the history is closed even if printing out fails
+        #
+        pipeline_run([task1], verbose = 0, history_file = history_file)
+        self.assertRaises(Exception, pipeline_printout, StringIO.StringIO(), [unchecked],
+                          verbose = 3, history_file = history_file)
+        self.assertFalse(job_history.is_open())
+
+
+if __name__ == '__main__':
+    unittest.main()
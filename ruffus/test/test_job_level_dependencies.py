@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+
+    test_job_level_dependencies.py
+
+        With job_level_dependencies, each @transform job should start as soon as
+            the upstream job making its input has completed, while
+            @merge waits for all of its inputs
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_job_level_dependencies_dir/"
+
+def write_times (output_file, start_time):
+    open(output_file, "w").write("%f %f\n" % (start_time, time.time()))
+
+def read_times (output_file):
+    return map(float, open(output_file).read().split())
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "fast.1", 0],
+        [None, tempdir + "slow.1", 3]])
+def make_start (i, o, delay):
+    start_time = time.time()
+    time.sleep(delay)
+    write_times(o, start_time)
+
+@transform(make_start, suffix(".1"), ".2")
+def transform_start (i, o):
+    write_times(o, time.time())
+
+@transform(transform_start, suffix(".2"), ".3")
+def transform_again (i, o):
+    write_times(o, time.time())
+
+@merge(transform_again, tempdir + "all.merged")
+def merge_all (i, o):
+    write_times(o, time.time())
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.many" % i] for i in range(16)])
+def make_many (i, o):
+    open(o, "w")
+
+@transform(make_many, suffix(".many"), ".many_done")
+def transform_many (i, o):
+    open(o, "w")
+
+
+class Test_job_level_dependencies(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_job_level_dependencies(self):
+        pipeline_run([merge_all], multiprocess = 4, verbose = 0,
+                     job_level_dependencies = True)
+        slow_start, slow_end = read_times(tempdir + "slow.1")
+        fast_start, fast_end = read_times(tempdir + "fast.1")
+
+        # downstream jobs of the fast job did not wait for the slow job
+        self.assertTrue(read_times(tempdir + "fast.2")[0] < slow_end)
+        self.assertTrue(read_times(tempdir + "fast.3")[0] < slow_end)
+
+        # and are still later than their inputs
+        self.assertTrue(os.path.getmtime(tempdir + "fast.2") > os.path.getmtime(tempdir + "fast.1"))
+        self.assertTrue(os.path.getmtime(tempdir + "fast.3") > os.path.getmtime(tempdir + "fast.2"))
+
+        # merge waits for everything
+        self.assertTrue(read_times(tempdir + "all.merged")[0] >= read_times(tempdir + "slow.3")[1])
+
+        # nothing left to do
+        merged_mtime = os.path.getmtime(tempdir + "all.merged")
+        pipeline_run([merge_all], multiprocess = 4, verbose = 0,
+                     job_level_dependencies = True)
+        self.assertEqual(merged_mtime, os.path.getmtime(tempdir + "all.merged"))
+
+    def test_task_level_dependencies(self):
+        pipeline_run([merge_all], multiprocess = 4, verbose = 0)
+        slow_start, slow_end = read_times(tempdir + "slow.1")
+        self.assertTrue(read_times(tempdir + "fast.2")[0] >= slow_end)
+
+    def run_many (self, **options):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        start_time = time.time()
+        pipeline_run([transform_many], multiprocess = 4, verbose = 0, **options)
+        return time.time() - start_time
+
+    def test_one_second_per_job(self):
+        #
+        #   jobs started early wait out the rest of the second after their upstream job
+        #       without taking up a process meanwhile
+        #
+        task_level_seconds = self.run_many()
+        job_level_seconds = self.run_many(job_level_dependencies = True)
+        self.assertTrue(job_level_seconds < task_level_seconds + 1)
+        for i in range(16):
+            self.assertTrue(os.path.getmtime(tempdir + "%d.many_done" % i) >
+                            os.path.getmtime(tempdir + "%d.many" % i))
+
+
+if __name__ == '__main__':
+    unittest.main()
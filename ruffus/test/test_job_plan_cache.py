@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+
+    test_job_plan_cache.py
+
+        Job parameters are generated once per pipeline run,
+            except for tasks whose parameters change as the pipeline runs:
+            @split and tasks downstream of it, and tasks with glob inputs
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.task import node
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_job_plan_cache_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(3)])
+def make_start (i, o):
+    open(o, "w")
+
+@transform(make_start, suffix(".start"), ".transformed")
+def transform_start (i, o):
+    open(o, "w")
+
+@split(transform_start, tempdir + "*.split")
+def split_all (i, o):
+    for f in i:
+        open(f.replace(".transformed", ".split"), "w")
+
+@transform(split_all, suffix(".split"), ".after_split")
+def transform_split (i, o):
+    open(o, "w")
+
+@follows(transform_split)
+@transform(tempdir + "*.after_split", suffix(".after_split"), ".globbed")
+def transform_glob (i, o):
+    open(o, "w")
+
+
+#
+#   count how often the parameters of each task are generated
+#
+cnt_param_generator_calls = defaultdict(int)
+def count_calls (task_name, param_generator_func):
+    def counting_param_generator_func (runtime_data):
+        cnt_param_generator_calls[task_name] += 1
+        return param_generator_func(runtime_data)
+    return counting_param_generator_func
+
+for task_func in (make_start, transform_start, split_all, transform_split, transform_glob):
+    t = node.lookup_node_from_name("__main__." + task_func.__name__)
+    t.param_generator_func = count_calls(task_func.__name__, t.param_generator_func)
+
+
+
+class Test_job_plan_cache(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        cnt_param_generator_calls.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_job_plan_cache(self):
+        pipeline_run([transform_glob], verbose = 0, one_second_per_job = False)
+
+        # parameters generated once
+        self.assertEqual(cnt_param_generator_calls["make_start"], 1)
+        self.assertEqual(cnt_param_generator_calls["transform_start"], 1)
+
+        # again once the actual output of @split is known
+        self.assertEqual(cnt_param_generator_calls["split_all"], 2)
+
+        # downstream parameters are not stale
+        for i in range(3):
+            self.assertTrue(os.path.exists(tempdir + "%d.after_split" % i))
+            self.assertTrue(os.path.exists(tempdir + "%d.globbed" % i))
+
+        # not reused between pipeline runs
+        cnt_param_generator_calls.clear()
+        pipeline_run([transform_glob], verbose = 0, one_second_per_job = False)
+        self.assertEqual(cnt_param_generator_calls["make_start"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+
+    test_lazy_job_names.py
+
+        Job names and up to date messages are only made
+            if they are going to be logged
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import cPickle as pickle
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.task import node, t_job_name, io_files_job_descriptor
+from ruffus.ruffus_utility import t_lazy_str
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_lazy_job_names_dir/"
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(5)])
+def make_start (i, o):
+    open(o, "w")
+
+@transform(make_start, suffix(".start"), ".finish")
+def make_finish (i, o):
+    open(o, "w")
+
+
+#
+#   count how often job names are made for each task
+#
+cnt_job_descriptor_calls = defaultdict(int)
+def count_calls (task_name, job_descriptor):
+    def counting_job_descriptor (param, runtime_data):
+        cnt_job_descriptor_calls[task_name] += 1
+        return job_descriptor(param, runtime_data)
+    return counting_job_descriptor
+
+for task_func in (make_start, make_finish):
+    t = node.lookup_node_from_name("__main__." + task_func.__name__)
+    t.job_descriptor = count_calls(task_func.__name__, t.job_descriptor)
+
+
+class t_save_to_str_logger:
+    def __init__ (self):
+        self.messages = []
+    def info (self, message):
+        self.messages.append(str(message))
+    def warning (self, message):
+        self.messages.append(str(message))
+    def error (self, message):
+        self.messages.append(str(message))
+    def debug (self, message):
+        self.messages.append(str(message))
+
+
+class Test_lazy_job_names(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        cnt_job_descriptor_calls.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_lazy_str(self):
+        cnt_calls = []
+        def make_str (a, b):
+            cnt_calls.append(1)
+            return "%s and %s" % (a, b)
+        lazy = t_lazy_str(make_str, "this", "that")
+        self.assertEqual(len(cnt_calls), 0)
+        self.assertEqual(str(lazy), "this and that")
+        self.assertEqual("%s" % lazy, "this and that")
+        self.assertEqual(len(cnt_calls), 1)
+
+        # otherwise behaves like the string
+        self.assertTrue("this" in lazy and lazy == "this and that")
+        self.assertTrue(lazy.startswith("this"))
+        self.assertEqual(len(lazy), 13)
+        self.assertEqual(len(cnt_calls), 1)
+
+    def test_pickle_job_name(self):
+        job_name = t_job_name(io_files_job_descriptor, ("a.start", "a.finish"), {})
+        self.assertEqual(str(pickle.loads(pickle.dumps(job_name))), str(job_name))
+        self.assertTrue("a.start" in str(job_name))
+        # formatted names are sent as strings
+        self.assertEqual(type(pickle.loads(pickle.dumps(job_name))), str)
+
+    def test_quiet(self):
+        pipeline_run([make_finish], verbose = 0, one_second_per_job = False)
+        self.assertEqual(sum(cnt_job_descriptor_calls.values()), 0)
+
+        # nor when up to date
+        pipeline_run([make_finish], verbose = 0)
+        self.assertEqual(sum(cnt_job_descriptor_calls.values()), 0)
+
+    def test_verbose(self):
+        logger = t_save_to_str_logger()
+        pipeline_run([make_finish], verbose = 3, logger = logger, one_second_per_job = False)
+        self.assertEqual(cnt_job_descriptor_calls["make_finish"], 5)
+        messages = "\n".join(logger.messages)
+        for i in range(5):
+            self.assertTrue("%s%d.finish" % (tempdir, i) in messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+
+    test_priority.py
+
+        Jobs of tasks with a higher @priority start first
+
+        With pipeline_run(priority_policy = "critical_path"), jobs on the
+            longest path through the rest of the pipeline start first,
+            and the longest jobs of each task (from previous runs) before the rest
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import sqlite3
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import PriorityArgumentError
+from ruffus.job_history import job_history
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_priority_dir/"
+history_file = "test_priority.sqlite"
+
+#
+#   jobs run in threads of this process so we can see the order in which they start
+#
+jobs_started = []
+def run_job (job_name, seconds, output_file):
+    jobs_started.append(job_name)
+    time.sleep(seconds)
+    open(output_file, "w")
+
+
+#
+#   manual priorities
+#
+@follows(mkdir(tempdir))
+@files(None, tempdir + "low")
+def low (i, o):
+    run_job("low", 0, o)
+
+@priority(10)
+@follows(mkdir(tempdir))
+@files(None, tempdir + "high")
+def high (i, o):
+    run_job("high", 0, o)
+
+@follows(mkdir(tempdir))
+@files(None, tempdir + "middle")
+def middle (i, o):
+    run_job("middle", 0, o)
+
+
+#
+#   many short jobs and a chain of long jobs
+#
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.short" % i] for i in range(4)])
+def short (i, o):
+    run_job("short", 0.3, o)
+
+@follows(mkdir(tempdir))
+@files(None, tempdir + "long.1")
+def long1 (i, o):
+    run_job("long1", 0.6, o)
+
+@transform(long1, suffix(".1"), ".2")
+def long2 (i, o):
+    run_job("long2", 0.6, o)
+
+
+#
+#   jobs of different lengths
+#
+job_seconds = {"a" : 0.05, "b" : 0.2, "c" : 0.1}
+@follows(mkdir(tempdir))
+@files([[None, tempdir + name + ".skewed"] for name in sorted(job_seconds)])
+def skewed (i, o):
+    name = os.path.basename(o)[0]
+    run_job(name, job_seconds[name], o)
+
+
+
+class Test_priority(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        del jobs_started[:]
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        if os.path.exists(history_file):
+            os.unlink(history_file)
+
+    def test_priority_arguments(self):
+        for ii, args in enumerate(((), ("high",), (1, 2))):
+            def bad_priority (i, o):
+                pass
+            bad_priority.__name__ = "bad_priority%d" % ii
+            try:
+                priority(*args)(bad_priority)
+            except PriorityArgumentError:
+                pass
+            else:
+                self.fail("@priority%r should be rejected" % (args,))
+
+    def test_manual_priority(self):
+        pipeline_run([low, middle, high], verbose = 0, one_second_per_job = False)
+        self.assertEqual(jobs_started[0], "high")
+        self.assertEqual(sorted(jobs_started), ["high", "low", "middle"])
+
+    def test_critical_path(self):
+        #
+        #   record how long each job takes
+        #       (the order of independent tasks is not specified)
+        #
+        pipeline_run([long2, short], verbose = 0, multithread = 2, history_file = history_file)
+        self.assertEqual(sorted(jobs_started), ["long1", "long2"] + ["short"] * 4)
+
+        #
+        #   longest path first, using the durations of the last run
+        #
+        del jobs_started[:]
+        pipeline_run([long2, short], [short, long1], verbose = 0, multithread = 2,
+                     history_file = history_file, priority_policy = "critical_path")
+        self.assertEqual(jobs_started[0], "long1")
+        self.assertTrue(jobs_started.index("long2") < 5)
+
+        #
+        #   without durations, each task on the path counts the same
+        #
+        del jobs_started[:]
+        pipeline_run([long2, short], [short, long1], verbose = 0, one_second_per_job = False,
+                     multithread = 2, priority_policy = "critical_path")
+        self.assertEqual(jobs_started[0], "long1")
+
+    def test_job_durations(self):
+        #
+        #   durations are recorded with the job history
+        #
+        pipeline_run([skewed], verbose = 0, history_file = history_file)
+        self.assertEqual(jobs_started, ["a", "b", "c"])
+        job_history.open(history_file)
+        durations = job_history.lookup_job_durations(["__main__.skewed"])["__main__.skewed"]
+        job_history.close()
+        self.assertEqual(len(durations), 3)
+        self.assertTrue(min(durations.values()) >= 0.05)
+
+        #
+        #   longest jobs first
+        #
+        del jobs_started[:]
+        pipeline_run([skewed], [skewed], verbose = 0, history_file = history_file,
+                     priority_policy = "critical_path")
+        self.assertEqual(jobs_started, ["b", "c", "a"])
+
+        # otherwise in order
+        del jobs_started[:]
+        pipeline_run([skewed], [skewed], verbose = 0, history_file = history_file)
+        self.assertEqual(jobs_started, ["a", "b", "c"])
+
+        # jobs not seen before come first
+        connection = sqlite3.connect(history_file)
+        connection.execute("DELETE FROM job_durations WHERE job_key = ?",
+                           (repr(tempdir + "c.skewed"),))
+        connection.commit()
+        connection.close()
+        del jobs_started[:]
+        pipeline_run([skewed], [skewed], verbose = 0, history_file = history_file,
+                     priority_policy = "critical_path")
+        self.assertEqual(jobs_started, ["c", "b", "a"])
+
+    def test_unknown_policy(self):
+        self.assertRaises(Exception, pipeline_run, [low], verbose = 0, priority_policy = "fastest")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+
+    test_re_glob.py
+
+        re_glob matches each component of a path with a regular expression,
+            or any number of nested directories with "**"
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+import ruffus.re_glob
+from ruffus.re_glob import re_glob
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Main logic
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_re_glob_dir/"
+
+class Test_re_glob(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        for file_name in ("a.txt", "b.txt", ".c.txt", "s1/d.txt", "s1/x/e.txt",
+                          "s2/f.log", ".hidden/g.txt"):
+            file_name = os.path.join(tempdir, file_name)
+            if not os.path.exists(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            open(file_name, "w")
+        # not followed by "**"
+        os.symlink("../s1", tempdir + "s2/link")
+        self.scandir = ruffus.re_glob.scandir
+
+    def tearDown(self):
+        ruffus.re_glob.scandir = self.scandir
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def check_matches (self, pattern, expected_matches):
+        expected_matches = sorted(tempdir + m for m in expected_matches)
+        self.assertEqual(sorted(re_glob(tempdir + pattern)), expected_matches)
+        self.assertEqual(sorted(re_glob(tempdir + pattern, threads = 3)), expected_matches)
+
+    def test_re_glob(self):
+        # with and without scandir
+        for scandir in set([self.scandir, None]):
+            ruffus.re_glob.scandir = scandir
+            self.check_matches(r"[ab]\.txt",        ["a.txt", "b.txt"])
+            self.check_matches(r"a\.txt",           ["a.txt"])
+            self.check_matches(r".*\.txt",          ["a.txt", "b.txt", ".c.txt"])
+            self.check_matches(r"s\d/.*",           ["s1/d.txt", "s1/x", "s2/f.log", "s2/link"])
+            self.check_matches(r"s\d/",             ["s1/", "s2/"])
+            self.check_matches(r"s1/x/e.txt",       ["s1/x/e.txt"])
+            self.check_matches(r"missing/.*",       [])
+            # whole name must match
+            self.check_matches(r"s",                [])
+            self.check_matches(r"a|a\.txt",         ["a.txt"])
+
+            # recursive
+            self.check_matches(r"**/[a-z]\.txt",    ["a.txt", "b.txt", "s1/d.txt", "s1/x/e.txt"])
+            self.check_matches(r"**/x/.*",          ["s1/x/e.txt"])
+            self.check_matches(r"**/",              ["", "s1/", "s1/x/", "s2/"])
+            self.check_matches(r"s1/**",            ["s1/d.txt", "s1/x", "s1/x/e.txt"])
+            self.check_matches(r"**",               ["a.txt", "b.txt", "s1", "s1/d.txt", "s1/x",
+                                                     "s1/x/e.txt", "s2", "s2/f.log", "s2/link"])
+
+        # parents before children
+        matches = re_glob(tempdir + "**")
+        self.assertTrue(matches.index(tempdir + "s1") < matches.index(tempdir + "s1/x") <
+                        matches.index(tempdir + "s1/x/e.txt"))
+
+
+if __name__ == '__main__':
+    unittest.main()
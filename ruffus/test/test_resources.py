@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+
+    test_resources.py
+
+        With pipeline_run(resources = ...), jobs only start if there is enough
+            left of each resource they need (See @resources),
+            and smaller jobs start while larger ones wait
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import threading
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import ResourcesArgumentError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_resources_dir/"
+
+#
+#   jobs run in threads of this process so we can see which run at the same time
+#
+lock = threading.Lock()
+in_use = defaultdict(float)
+max_in_use = defaultdict(float)
+jobs_started = []
+def run_job (job_name, seconds, output_file, **resources):
+    with lock:
+        jobs_started.append((job_name, dict(in_use)))
+        for name, amount in resources.items():
+            in_use[name] += amount
+            max_in_use[name] = max(max_in_use[name], in_use[name])
+    time.sleep(seconds)
+    with lock:
+        for name, amount in resources.items():
+            in_use[name] -= amount
+    open(output_file, "w")
+
+
+@follows(mkdir(tempdir))
+@resources(cpus = 4, mem = 6)
+@files([[None, tempdir + "%d.big" % i] for i in range(2)])
+def big (i, o):
+    run_job("big", 0.4, o, cpus = 4, mem = 6)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.small" % i] for i in range(8)])
+def small (i, o):
+    run_job("small", 0.1, o, cpus = 1, small_jobs = 1)
+
+@follows(mkdir(tempdir))
+@resources(cpus = 1, mem = 1)
+@files([[None, tempdir + "%d.tiny" % i] for i in range(4)])
+def tiny (i, o):
+    run_job("tiny", 0.1, o, cpus = 1, mem = 1)
+
+@follows(mkdir(tempdir))
+@resources(mem = 100)
+@files(None, tempdir + "huge")
+def huge (i, o):
+    pass
+
+
+
+class Test_resources(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        del jobs_started[:]
+        in_use.clear()
+        max_in_use.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_resources_arguments(self):
+        for ii, (args, kwargs) in enumerate((((), {}), ((4,), {}), ((), {"cpus" : -1}),
+                                            ((), {"mem" : "lots"}))):
+            def bad_resources (i, o):
+                pass
+            bad_resources.__name__ = "bad_resources%d" % ii
+            try:
+                resources(*args, **kwargs)(bad_resources)
+            except ResourcesArgumentError:
+                pass
+            else:
+                self.fail("@resources(%r, %r) should be rejected" % (args, kwargs))
+
+    def test_packing(self):
+        pipeline_run([big, small], verbose = 0, one_second_per_job = False, multithread = 8,
+                     resources = {"cpus" : 6, "mem" : 10})
+        self.assertEqual(len(jobs_started), 10)
+
+        # never more than is available
+        self.assertEqual(max_in_use["cpus"], 6)
+        self.assertEqual(max_in_use["mem"], 6)
+
+        # small jobs fill the gaps around big ones
+        for job_name, resources_in_use in jobs_started:
+            if ((job_name == "small" and resources_in_use.get("mem")) or
+                (job_name == "big" and resources_in_use.get("small_jobs"))):
+                break
+        else:
+            self.fail("No small jobs started alongside big ones")
+
+    def test_fractional_resources(self):
+        pipeline_run([tiny], verbose = 0, one_second_per_job = False, multithread = 8,
+                     resources = {"mem" : 2.5})
+        self.assertEqual(max_in_use["mem"], 2)
+
+    def test_unlimited(self):
+        #
+        #   only limited by multithread
+        #
+        pipeline_run([small], verbose = 0, one_second_per_job = False, multithread = 8)
+        self.assertEqual(max_in_use["cpus"], 8)
+
+    def test_too_big(self):
+        self.assertRaises(ResourcesArgumentError, pipeline_run, [huge], verbose = 0,
+                          resources = {"mem" : 64})
+        self.assertRaises(Exception, pipeline_run, [huge], verbose = 0, resources = 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+
+    test_retry.py
+
+        Failed jobs are run again (See @retry)
+        Second copies of straggling jobs are started (See @speculative)
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import multiprocessing
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import RethrownJobError, RetryArgumentError, SpeculativeArgumentError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_retry_dir/"
+
+def count_attempt (output_file):
+    """
+    Returns how many times the job has been run, including this time
+    """
+    open(output_file + ".attempts", "a").write("x")
+    return len(open(output_file + ".attempts").read())
+
+@follows(mkdir(tempdir))
+@retry(3, delay = 0.1, exceptions = (IOError, OSError))
+@files([[None, tempdir + "%d.flaky" % i] for i in range(4)])
+def flaky (i, o):
+    if count_attempt(o) <= 2:
+        raise IOError("Transient error")
+    open(o, "w")
+
+@follows(mkdir(tempdir))
+@retry(3, delay = 0.1, exceptions = IOError)
+@files(None, tempdir + "not_retryable")
+def not_retryable (i, o):
+    count_attempt(o)
+    raise ValueError("Not transient")
+
+@follows(mkdir(tempdir))
+@retry(2, delay = 0.1)
+@files(None, tempdir + "always_fails")
+def always_fails (i, o):
+    count_attempt(o)
+    raise IOError("Not transient either")
+
+#
+#   the first job fails once, and is run again only after the others
+#
+@follows(mkdir(tempdir))
+@retry(1, delay = 1.5)
+@files([[None, tempdir + "%d.recovers" % i] for i in range(6)])
+def recovers (i, o):
+    if o.endswith("0.recovers") and count_attempt(o) == 1:
+        raise IOError("Transient error")
+    time.sleep(0.1)
+    open(o, "w").write("%f" % time.time())
+
+@follows(mkdir(tempdir))
+@speculative(3)
+@files([[None, tempdir + "%d.straggler" % i] for i in range(8)])
+def straggler (i, o):
+    #
+    #   the first copy of the first job is very slow
+    #       Each copy writes to its own private output name
+    #
+    if o.endswith("0.straggler") and count_attempt(tempdir + "0.straggler") == 1:
+        time.sleep(4)
+        open(o, "w").write("slow")
+    else:
+        time.sleep(0.1)
+        open(o, "w").write("fast")
+
+
+class Test_retry(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def attempts (self, output_file):
+        return len(open(output_file + ".attempts").read())
+
+    def test_retry(self):
+        pipeline_run([flaky], verbose = 0, one_second_per_job = False, multiprocess = 2)
+        for i in range(4):
+            self.assertTrue(os.path.exists(tempdir + "%d.flaky" % i))
+            self.assertEqual(self.attempts(tempdir + "%d.flaky" % i), 3)
+
+    def test_delay(self):
+        #
+        #   the failed job waits without holding the only process
+        #
+        pipeline_run([recovers], verbose = 0, one_second_per_job = False, multiprocess = 1)
+        finish_times = [float(open(tempdir + "%d.recovers" % i).read()) for i in range(6)]
+        self.assertEqual(self.attempts(tempdir + "0.recovers"), 2)
+        self.assertTrue(max(finish_times[1:]) < finish_times[0])
+
+    def test_not_retryable(self):
+        self.assertRaises(RethrownJobError, pipeline_run, [not_retryable], verbose = 0,
+                          one_second_per_job = False)
+        self.assertEqual(self.attempts(tempdir + "not_retryable"), 1)
+
+    def test_retries_run_out(self):
+        self.assertRaises(RethrownJobError, pipeline_run, [always_fails], verbose = 0,
+                          one_second_per_job = False)
+        self.assertEqual(self.attempts(tempdir + "always_fails"), 3)
+
+    def test_speculative(self):
+        start_time = time.time()
+        pipeline_run([straggler], verbose = 0, one_second_per_job = False, multithread = 2)
+        self.assertTrue(time.time() - start_time < 3.5)
+
+        # outputs of the faster copy only
+        for i in range(8):
+            self.assertEqual(open(tempdir + "%d.straggler" % i).read(), "fast")
+        self.assertEqual(self.attempts(tempdir + "0.straggler"), 2)
+        self.assertEqual([f for f in os.listdir(tempdir) if f.startswith(".ruffus_copy")], [])
+
+        # the slow copy is ignored
+        time.sleep(4)
+        self.assertEqual(open(tempdir + "0.straggler").read(), "fast")
+        self.assertEqual([f for f in os.listdir(tempdir) if f.startswith(".ruffus_copy")], [])
+
+    def test_speculative_processes(self):
+        #
+        #   the slow copy is stopped before pipeline_run returns
+        #
+        pipeline_run([straggler], verbose = 0, one_second_per_job = False, multiprocess = 2)
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertEqual([f for f in os.listdir(tempdir) if f.startswith(".ruffus_copy")], [])
+        for i in range(8):
+            self.assertEqual(open(tempdir + "%d.straggler" % i).read(), "fast")
+
+    def test_arguments(self):
+        self.assertRaises(RetryArgumentError, retry(), flaky)
+        self.assertRaises(RetryArgumentError, retry(3, exceptions = "IOError"), flaky)
+        self.assertRaises(RetryArgumentError, retry(3, pause = 1), flaky)
+        self.assertRaises(SpeculativeArgumentError, speculative(0.5), straggler)
+
+
+if __name__ == '__main__':
+    unittest.main()
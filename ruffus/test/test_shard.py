@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+
+    test_shard.py
+
+        Copies of the same pipeline each run their own share of the jobs
+            (See pipeline_run(shard = (i, N)))
+
+        Each copy runs in its own process, as it would on another host
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import subprocess
+import time
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.cmdline import parse_shard
+from ruffus.ruffus_exceptions import RethrownJobError
+import ruffus.task
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_shard_dir/"
+jobs_log = tempdir + "jobs.log"
+
+#
+#   one line for each job run, by any copy of the pipeline
+#
+def log_job (output_file, shard_index):
+    open(jobs_log, "a").write("%s %d\n" % (output_file, shard_index))
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(12)])
+def make_start (i, o):
+    open(o, "w")
+    log_job(o, shard[0])
+
+@transform(make_start, suffix(".start"), ".middle")
+def make_middle (i, o):
+    open(o, "w")
+    log_job(o, shard[0])
+
+@merge(make_middle, tempdir + "all.summary")
+def summarise (i, o):
+    open(o, "w")
+    log_job(o, shard[0])
+
+@transform(summarise, suffix(".summary"), ".final")
+def finish (i, o):
+    open(o, "w")
+    log_job(o, shard[0])
+
+@follows(mkdir(tempdir))
+@split(None, tempdir + "*.part")
+def split_parts (i, o):
+    for i in range(4):
+        open(tempdir + "%d.part" % i, "w")
+    log_job(tempdir + "split", shard[0])
+
+@transform(split_parts, suffix(".part"), ".part_done")
+def after_split (i, o):
+    open(o, "w")
+    log_job(o, shard[0])
+
+@follows(mkdir(tempdir))
+@files(tempdir + "missing.source", tempdir + "missing.out")
+def from_missing_source (i, o):
+    open(o, "w")
+
+#
+#   outputs of an earlier run are not taken as made by the other shard in this run
+#
+@transform(tempdir + "*.version", suffix(".version"), ".copied")
+def copy_version (i, o):
+    open(o, "w").write(open(i).read())
+
+@merge(copy_version, tempdir + "all.merged")
+def merge_versions (i, o):
+    open(o, "w").write(",".join(open(f).read() for f in sorted(i)))
+
+
+shard = None
+def run_pipeline (shard_index, cnt_shards, target_tasks = None):
+    global shard
+    shard = (shard_index, cnt_shards)
+    pipeline_run(target_tasks or [finish, after_split], verbose = 0, one_second_per_job = False,
+                 multithread = 2, shard = shard)
+
+
+class Test_shard(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+        os.makedirs(tempdir)
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def read_jobs_log (self):
+        shards_by_job = defaultdict(list)
+        for line in open(jobs_log):
+            output_file, shard_index = line.split()
+            shards_by_job[output_file].append(int(shard_index))
+        return shards_by_job
+
+    def test_shards(self):
+        copies = [subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0]),
+                                    "--run_shard", "%d/2" % i])
+                    for i in range(2)]
+        for copy in copies:
+            self.assertEqual(copy.wait(), 0)
+
+        # each job run exactly once, shared between the copies
+        shards_by_job = self.read_jobs_log()
+        self.assertEqual(len(shards_by_job), 12 + 12 + 1 + 1 + 1 + 4)
+        self.assertTrue(all(len(shards) == 1 for shards in shards_by_job.values()))
+        middle_shards = set(shards_by_job[tempdir + "%d.middle" % i][0] for i in range(12))
+        self.assertEqual(middle_shards, set([0, 1]))
+
+        # barrier tasks and jobs downstream of @split on shard 0
+        self.assertEqual(shards_by_job[tempdir + "all.summary"], [0])
+        self.assertEqual(shards_by_job[tempdir + "split"], [0])
+        self.assertEqual(shards_by_job[tempdir + "0.part_done"], [0])
+        self.assertTrue(os.path.exists(tempdir + "all.final"))
+
+    def run_copies (self, run_option, start_delay = 0):
+        """
+        Run shards 0 and 1, starting shard 1 start_delay seconds after shard 0
+        """
+        copies = []
+        for i in range(2):
+            if i:
+                time.sleep(start_delay)
+            copies.append(subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0]),
+                                            run_option, "%d/2" % i]))
+        for copy in copies:
+            self.assertEqual(copy.wait(), 0)
+
+    def test_rerun(self):
+        for name in "ABCD":
+            open(tempdir + name + ".version", "w").write(name + "-V1")
+        self.run_copies("--run_versions")
+        self.assertEqual(open(tempdir + "all.merged").read(), "A-V1,B-V1,C-V1,D-V1")
+
+        #
+        #   shard 0 waits for shard 1 to remake its outputs, though they already exist
+        #
+        time.sleep(1.1)
+        for name in "ABCD":
+            open(tempdir + name + ".version", "w").write(name + "-V2")
+        self.run_copies("--run_versions", start_delay = 3)
+        self.assertEqual(open(tempdir + "all.merged").read(), "A-V2,B-V2,C-V2,D-V2")
+
+    def test_missing_input(self):
+        #
+        #   input files which are not made by other shards are missing straight away
+        #
+        start_time = time.time()
+        self.assertRaises(RethrownJobError, pipeline_run, [from_missing_source], verbose = 0,
+                          one_second_per_job = False, shard = (0, 1))
+        self.assertTrue(time.time() - start_time < 10)
+
+        #
+        #   shard 0 gives up waiting for the outputs of shard 1, which is not running
+        #
+        global shard
+        shard = (0, 2)
+        shard_wait_seconds = ruffus.task.shard_wait_seconds
+        shard_poll_interval = ruffus.task.shard_poll_interval
+        ruffus.task.shard_wait_seconds = 0.5
+        ruffus.task.shard_poll_interval = 0.1
+        try:
+            try:
+                pipeline_run([summarise], verbose = 0, one_second_per_job = False,
+                             multithread = 2, shard = shard)
+                self.fail("Pipeline should fail")
+            except RethrownJobError, e:
+                self.assertTrue("not made by other shards" in str(e))
+        finally:
+            shard = None
+            ruffus.task.shard_wait_seconds = shard_wait_seconds
+            ruffus.task.shard_poll_interval = shard_poll_interval
+
+    def test_parameters(self):
+        self.assertEqual(parse_shard("1/4"), (1, 4))
+        self.assertRaises(Exception, parse_shard, "1")
+        for bad_shard in ((2, 2), (-1, 2), "0/2", (0, 1, 2)):
+            self.assertRaises(Exception, pipeline_run, [finish], verbose = 0, shard = bad_shard)
+
+
+if __name__ == '__main__':
+    if "--run_shard" in sys.argv:
+        run_pipeline(*parse_shard(sys.argv[-1]))
+    elif "--run_versions" in sys.argv:
+        run_pipeline(*parse_shard(sys.argv[-1]), target_tasks = [merge_versions])
+    else:
+        unittest.main()
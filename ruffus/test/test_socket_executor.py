@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+
+    test_socket_executor.py
+
+        Jobs are run by worker processes which connect over TCP or Unix sockets
+            (See t_socket_executor / ruffus-worker)
+
+        Several workers are started on localhost
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import tempfile
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.ruffus_exceptions import RethrownJobError
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+#
+#   N.B. workers import this file: only run pipelines under __main__
+#
+tempdir = "test_socket_executor_dir/"
+
+def write_pid (output_file):
+    open(output_file, "w").write("%d\n" % os.getpid())
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.start" % i] for i in range(8)])
+def make_start (i, o):
+    time.sleep(0.2)
+    write_pid(o)
+
+@transform(make_start, suffix(".start"), ".finish")
+def make_finish (i, o):
+    write_pid(o)
+
+#
+#   start and finish times of jobs which should run one at a time
+#
+@jobs_limit(1)
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.limited" % i] for i in range(4)])
+def limited (i, o):
+    start_time = time.time()
+    time.sleep(0.2)
+    open(o, "w").write("%r %r\n" % (start_time, time.time()))
+
+#
+#   kills its worker the first time
+#
+@follows(mkdir(tempdir))
+@files(None, tempdir + "survivor")
+def kills_worker (i, o):
+    if not os.path.exists(tempdir + "killed"):
+        open(tempdir + "killed", "w")
+        os._exit(1)
+    write_pid(o)
+
+@follows(mkdir(tempdir))
+@files(None, tempdir + "never")
+def fails (i, o):
+    raise Exception("Failed on purpose")
+
+
+
+class Test_socket_executor(unittest.TestCase):
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def read_pids (self, file_names):
+        return set(int(open(f).read()) for f in file_names)
+
+    def test_tcp(self):
+        executor = t_socket_executor(local_workers = 3)
+        try:
+            self.assertEqual(executor.address[0], "127.0.0.1")
+            pipeline_run([make_finish], verbose = 0, one_second_per_job = False, multiprocess = 3,
+                         executor = executor)
+            pids = self.read_pids([tempdir + "%d.%s" % (i, suffix) for i in range(8)
+                                                                   for suffix in ("start", "finish")])
+            self.assertTrue(len(pids) > 1)
+            self.assertTrue(os.getpid() not in pids)
+
+            # workers are reused by later runs
+            shutil.rmtree(tempdir)
+            pipeline_run([make_finish], verbose = 0, one_second_per_job = False, multiprocess = 3,
+                         executor = executor)
+            self.assertTrue(len(self.read_pids([tempdir + "%d.finish" % i for i in range(8)]) | pids) <= 3)
+
+            # errors are passed back
+            self.assertRaises(RethrownJobError, pipeline_run, [fails], verbose = 0,
+                              multiprocess = 3, executor = executor)
+        finally:
+            executor.close()
+
+    def test_unix_socket(self):
+        socket_dir = tempfile.mkdtemp()
+        try:
+            executor = t_socket_executor(os.path.join(socket_dir, "socket"), local_workers = 2)
+            try:
+                pipeline_run([limited, kills_worker], verbose = 0, one_second_per_job = False,
+                             multiprocess = 2, executor = executor)
+            finally:
+                executor.close()
+        finally:
+            shutil.rmtree(socket_dir)
+
+        # the job was run again by the other worker
+        self.assertTrue(os.path.exists(tempdir + "survivor"))
+
+        # @jobs_limit applies to all workers together
+        times = sorted(tuple(map(float, open(tempdir + "%d.limited" % i).read().split()))
+                        for i in range(4))
+        for (start1, end1), (start2, end2) in zip(times, times[1:]):
+            self.assertTrue(end1 <= start2)
+
+    def test_wrong_authkey(self):
+        executor = t_socket_executor(authkey = "right")
+        try:
+            from multiprocessing.connection import Client
+            from multiprocessing import AuthenticationError
+            self.assertRaises(AuthenticationError, Client, executor.address, authkey = "wrong")
+        finally:
+            executor.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
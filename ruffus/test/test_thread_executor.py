@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+
+    test_thread_executor.py
+
+        pipeline_run(executor = "threads") runs jobs in threads of this process:
+            parameters do not need to be pickled and
+            @jobs_limit is still respected
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import threading
+import time
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+job_pids        = []
+jobs_running    = [0]
+max_jobs_running= [0]
+counter_lock    = threading.Lock()
+
+def start_job ():
+    with counter_lock:
+        job_pids.append(os.getpid())
+        jobs_running[0] += 1
+        max_jobs_running[0] = max(max_jobs_running[0], jobs_running[0])
+    time.sleep(0.2)
+    with counter_lock:
+        jobs_running[0] -= 1
+
+#
+#   lambdas cannot be pickled
+#
+@parallel([[i, lambda: i] for i in range(6)])
+def unlimited_jobs (i, unpicklable):
+    start_job()
+
+@jobs_limit(2)
+@parallel([[i, lambda: i] for i in range(6)])
+def limited_jobs (i, unpicklable):
+    start_job()
+
+
+class Test_thread_executor(unittest.TestCase):
+    def setUp(self):
+        del job_pids[:]
+        max_jobs_running[0] = 0
+
+    def test_unlimited_jobs(self):
+        pipeline_run([unlimited_jobs], multithread = 6, verbose = 0, one_second_per_job = False)
+        self.assertEqual(job_pids, [os.getpid()] * 6)
+        self.assertTrue(max_jobs_running[0] > 2)
+
+    def test_jobs_limit(self):
+        pipeline_run([limited_jobs], executor = "threads", multiprocess = 6,
+                     verbose = 0, one_second_per_job = False)
+        self.assertEqual(len(job_pids), 6)
+        self.assertEqual(max_jobs_running[0], 2)
+
+    def test_unknown_executor(self):
+        self.assertRaises(Exception, pipeline_run, [unlimited_jobs], executor = "abacus", verbose = 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+
+    test_uptodate_check_threads.py
+
+        pipeline_run(uptodate_check_threads = N) checks whether jobs are up to date
+            in N threads at once, a batch at a time
+
+"""
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   imports
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+import unittest
+import sys, os
+import shutil
+import time
+import threading
+from collections import defaultdict
+
+# add self to search path for testing
+exe_path = os.path.split(os.path.abspath(sys.argv[0]))[0]
+sys.path.insert(0,os.path.abspath(os.path.join(exe_path,"..", "..")))
+
+from ruffus import *
+from ruffus.task import t_uptodate_checker
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+
+#   Tasks
+
+
+#88888888888888888888888888888888888888888888888888888888888888888888888888888888888888888
+tempdir = "test_uptodate_check_threads_dir/"
+jobs_count = 100
+cnt_jobs_run = defaultdict(int)
+checking_threads = set()
+
+def needs_update_check_in_thread (i, o):
+    checking_threads.add(threading.current_thread().name)
+    time.sleep(0.001)
+    return needs_update_check_modify_time(i, o)
+
+@follows(mkdir(tempdir))
+@files([[None, tempdir + "%d.1" % i] for i in range(jobs_count)])
+def task1 (i, o):
+    cnt_jobs_run["task1"] += 1
+    open(o, "w")
+
+@transform(task1, suffix(".1"), ".2")
+@check_if_uptodate(needs_update_check_in_thread)
+def task2 (i, o):
+    cnt_jobs_run["task2"] += 1
+    open(o, "w")
+
+
+class Test_uptodate_check_threads(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        cnt_jobs_run.clear()
+        checking_threads.clear()
+
+    def tearDown(self):
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+
+    def test_pipeline(self):
+        pipeline_run([task2], verbose = 0, one_second_per_job = False,
+                     uptodate_check_threads = 4)
+        self.assertEqual(cnt_jobs_run["task2"], jobs_count)
+        self.assertTrue(len(checking_threads) > 1)
+        self.assertTrue(threading.current_thread().name not in checking_threads)
+
+        # only out of date jobs rerun
+        for i in range(0, jobs_count, 10):
+            os.unlink(tempdir + "%d.2" % i)
+        cnt_jobs_run.clear()
+        pipeline_run([task2], verbose = 0, one_second_per_job = False,
+                     uptodate_check_threads = 4)
+        self.assertEqual(cnt_jobs_run["task2"], jobs_count // 10)
+
+        # up to date
+        cnt_jobs_run.clear()
+        pipeline_run([task2], verbose = 0, one_second_per_job = False,
+                     uptodate_check_threads = 4)
+        self.assertEqual(sum(cnt_jobs_run.values()), 0)
+
+    def test_early_exit(self):
+        cnt_checks = [0]
+        def odd_jobs_need_update (i):
+            cnt_checks[0] += 1
+            return i % 2 == 1, ""
+
+        checker = t_uptodate_checker(4)
+        parameters = [((i,), "job %d" % i) for i in range(10000)]
+
+        # results in order
+        results = list(checker.check(odd_jobs_need_update, parameters))
+        self.assertEqual([r[1] for r in results], [d for p, d in parameters])
+        self.assertEqual([r[2] for r in results], [i % 2 == 1 for i in range(10000)])
+
+        # stopping at the first out of date job checks few jobs
+        cnt_checks[0] = 0
+        for param, descriptive_param, needs_update, msg in checker.check(odd_jobs_need_update, parameters):
+            if needs_update:
+                break
+        checker.close()
+        self.assertTrue(cnt_checks[0] < 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
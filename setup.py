@@ -188,6 +188,9 @@ Usage
         #    # If any package contains *.txt files, include them:
         #    '': ['*.TXT'],                                \
         #}
+        entry_points = {
+            'console_scripts': ['ruffus-worker = ruffus.executors:worker_main'],
+        },
 
 
      )